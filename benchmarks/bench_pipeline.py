@@ -0,0 +1,238 @@
+# benchmarks/bench_pipeline.py - 监听处理流程离线吞吐/延迟基准
+"""用合成事件驱动真实的 UserbotListener 处理器（客户端为本地替身，不联网）
+
+对每个场景（账号数 × 关键词数 × 消息长度 × 命中率 × 规则数）报告：
+- throughput_msgs_per_s：每秒处理的 NewMessage 数（所有账号合计）
+- latency_ms：命中消息从事件产生到 bot_client.send_message 的 p50/p95/p99
+
+用法：
+    python -m benchmarks.bench_pipeline [--messages 2000] [--accounts 1,4] \\
+        [--keywords 10,1000] [--rules 0,100] [--sizes 100,1000] [--hit-rates 0.01,0.1] [--output result.json]
+
+需要安装 requirements.txt 中的依赖（会导入真实的 modules.listener）。
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_telethon import FakeBotClient, FakeEvent, FakeUserClient  # noqa: E402
+from modules.data_manager import config_store, default_data  # noqa: E402
+from modules.listener import ListenerManager, UserbotListener  # noqa: E402
+
+ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789出售收购担保交易价格代理频道群组账号 "
+SEQ_PATTERN = re.compile(r"\[bench:(\d+)\]")
+TARGET_ID = -1009999999999
+
+
+def percentile(values, pct):
+    """最近秩百分位"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def make_keywords(rng, count):
+    return ["".join(rng.choice(ALPHABET.strip()) for _ in range(rng.randint(5, 10))) for _ in range(count)]
+
+
+def make_rules(rng, keywords, count, chats):
+    """生成 "A AND B NOT C" 形式的规则，一半限定在单个群"""
+    rules = []
+    for i in range(count):
+        a, b, c = rng.sample(keywords, 3) if len(keywords) >= 3 else (keywords * 3)[:3]
+        rule = {"id": i + 1, "name": f"r{i + 1}", "expr": f'"{a}" AND "{b}" NOT "{c}"'}
+        if i % 2:
+            rule["chats"] = [-1000000000000 - rng.randrange(chats)]
+        rules.append(rule)
+    return rules
+
+
+def make_messages(rng, keywords, count, size, hit_rate):
+    messages = []
+    for seq in range(count):
+        tag = f"[bench:{seq}] "
+        body = "".join(rng.choice(ALPHABET) for _ in range(max(0, size - len(tag))))
+        if rng.random() < hit_rate:
+            kw = rng.choice(keywords)
+            pos = rng.randint(0, max(0, len(body) - len(kw)))
+            body = body[:pos] + kw + body[pos + len(kw):]
+        messages.append(tag + body)
+    return messages
+
+
+async def run_scenario(accounts, keyword_count, size, hit_rate, message_count, chats, rpc_latency, rate, seed,
+                       rule_count=0):
+    rng = random.Random(seed)
+    keywords = make_keywords(rng, keyword_count)
+    messages = make_messages(rng, keywords, message_count, size, hit_rate)
+
+    # 只发布内存快照，不写 data.json
+    data = default_data()
+    data["keywords"] = keywords
+    data["rules"] = make_rules(rng, keywords, rule_count, chats)
+    data["target_channel_id"] = TARGET_ID
+    config_store.publish(data)
+
+    bot = FakeBotClient()
+    # 基准关注处理流程本身，放开发送队列的限速
+    manager = ListenerManager(0, "", bot_entity=None, bot_client=bot, dispatcher_options={
+        "max_queue": message_count * accounts + 1,
+        "per_target_rate": 1e9, "per_target_burst": 1e9,
+        "global_rate": 1e9, "global_burst": 1e9
+    })
+    clients = []
+    for i in range(accounts):
+        client = FakeUserClient(rpc_latency=rpc_latency)
+        listener = UserbotListener(
+            f"bench_{i}", f"bench_{i}", 0, "", None,
+            bot_client=bot,
+            dedup=manager.dedup,
+            dispatcher=manager.dispatcher,
+            bus=manager.bus,
+            entity_cache=manager.entity_cache,
+            link_cache=manager.link_cache,
+            client=client
+        )
+        listener.listener_username = f"@bench_{i}"
+        await listener.setup_handlers()
+        manager.listeners[listener.session_name] = listener
+        clients.append(client)
+
+    created = {}
+    tasks = []
+    interval = 1.0 / rate if rate else 0
+    start = time.perf_counter()
+    for seq, text in enumerate(messages):
+        chat_id = -1000000000000 - (seq % chats)
+        # 所有账号都在同一批群里，收到同一条消息
+        for client in clients:
+            event = FakeEvent(chat_id, seq + 1, text, sender_id=seq % 97 + 1, rpc_latency=rpc_latency)
+            created.setdefault(seq, event.created_at)
+            tasks.append(asyncio.create_task(client.dispatch(event)))
+        if interval:
+            await asyncio.sleep(max(0, start + (seq + 1) * interval - time.perf_counter()))
+        else:
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    # 处理器只负责入队，等待各监听器的处理队列清空
+    await asyncio.gather(*(listener.queue.join() for listener in manager.listeners.values()))
+    handled = time.perf_counter()
+    while manager.dispatcher.pending:
+        await asyncio.sleep(0.001)
+    elapsed = handled - start
+
+    latencies = []
+    for sent_at, _, text in bot.sent:
+        match = SEQ_PATTERN.search(text)
+        if match:
+            latencies.append((sent_at - created[int(match.group(1))]) * 1000)
+
+    stats = [listener.stats for listener in manager.listeners.values()]
+    queue_stats = [listener.queue.stats() for listener in manager.listeners.values()]
+    for listener in manager.listeners.values():
+        await listener.queue.close()
+    await manager.dispatcher.close()
+    return {
+        "accounts": accounts,
+        "keywords": keyword_count,
+        "rules": rule_count,
+        "message_size": size,
+        "hit_rate": hit_rate,
+        "messages": message_count,
+        "events": message_count * accounts,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_msgs_per_s": round(message_count * accounts / elapsed, 1) if elapsed else None,
+        "alerts_sent": len(bot.sent),
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99)
+        },
+        "matched": sum(s["matched"] for s in stats),
+        "duplicates": sum(s["duplicates"] for s in stats),
+        "queue_max_depth": max((q["max_depth"] for q in queue_stats), default=0),
+        "queue_dropped": sum(q["dropped_oldest"] + q["dropped_unmatched"] for q in queue_stats),
+        "rpc_awaits_unmatched": sum(s["rpc_awaits_unmatched"] for s in stats),
+        "export_link_calls": sum(c.export_calls for c in clients)
+    }
+
+
+def parse_list(value, cast):
+    return [cast(v) for v in value.split(",") if v]
+
+
+async def main_async(args):
+    results = []
+    matrix = itertools.product(
+        parse_list(args.accounts, int),
+        parse_list(args.keywords, int),
+        parse_list(args.sizes, int),
+        parse_list(args.hit_rates, float),
+        parse_list(args.rules, int)
+    )
+    for accounts, keyword_count, size, hit_rate, rule_count in matrix:
+        result = await run_scenario(
+            accounts, keyword_count, size, hit_rate, args.messages,
+            args.chats, args.rpc_latency, args.rate, args.seed, rule_count
+        )
+        results.append(result)
+        lat = result["latency_ms"]
+        p50 = f"{lat['p50']:.2f}" if lat["p50"] is not None else "-"
+        p99 = f"{lat['p99']:.2f}" if lat["p99"] is not None else "-"
+        print(
+            f"accounts={accounts:<3} keywords={keyword_count:<6} rules={rule_count:<5} size={size:<5} hit={hit_rate:<5} "
+            f"-> {result['throughput_msgs_per_s']:>10} msg/s  p50={p50}ms p99={p99}ms",
+            file=sys.stderr
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="监听处理流程离线基准")
+    parser.add_argument("--messages", type=int, default=2000, help="每个场景的消息数")
+    parser.add_argument("--accounts", default="1,4", help="账号数量列表")
+    parser.add_argument("--keywords", default="10,1000", help="关键词数量列表")
+    parser.add_argument("--sizes", default="100,1000", help="消息长度列表")
+    parser.add_argument("--hit-rates", default="0.01,0.1", help="命中率列表")
+    parser.add_argument("--rules", default="0", help="规则数量列表")
+    parser.add_argument("--chats", type=int, default=20, help="消息分布的群数量")
+    parser.add_argument("--rpc-latency", type=float, default=0.0, help="模拟的单次 RPC 延迟（秒）")
+    parser.add_argument("--rate", type=float, default=0, help="消息到达速率（条/秒），0 表示不限速")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果 JSON 输出文件（默认输出到标准输出）")
+    args = parser.parse_args()
+
+    # 基准期间关闭常规日志，避免 I/O 干扰结果
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("modules").setLevel(logging.WARNING)
+
+    results = asyncio.run(main_async(args))
+    report = {
+        "benchmark": "listener_pipeline",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": results
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
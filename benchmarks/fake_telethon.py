@@ -0,0 +1,97 @@
+# benchmarks/fake_telethon.py - 离线基准使用的 TelegramClient 替身
+"""只实现监听流程实际用到的接口，不连接网络
+
+- FakeUserClient：监听账号客户端，记录 on() 注册的处理器，模拟 export_message_link
+- FakeBotClient：机器人客户端，记录 send_message 的调用时间
+- FakeEvent：NewMessage 事件替身，带创建时间戳用于计算端到端延迟
+"""
+import asyncio
+import time
+
+
+class FakeEntity:
+    def __init__(self, id, title=None, username=None, first_name=None, last_name=None):
+        self.id = id
+        self.title = title
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+
+
+class FakeMessage:
+    __slots__ = ("id",)
+
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeEvent:
+    """NewMessage.Event 替身"""
+    def __init__(self, chat_id, message_id, text, sender_id=1, rpc_latency=0.0, chat_username=None):
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.raw_text = text
+        self.is_private = False
+        self.message = FakeMessage(message_id)
+        self.input_chat = chat_id
+        self.created_at = time.perf_counter()
+        self._rpc_latency = rpc_latency
+        self._chat = FakeEntity(int(str(abs(chat_id))[3:]), title=f"群组{chat_id}", username=chat_username)
+        self._sender = FakeEntity(sender_id, username=f"user{sender_id}", first_name="测试", last_name=str(sender_id))
+
+    async def _rpc(self):
+        if self._rpc_latency:
+            await asyncio.sleep(self._rpc_latency)
+        else:
+            await asyncio.sleep(0)
+
+    async def get_chat(self):
+        await self._rpc()
+        return self._chat
+
+    async def get_sender(self):
+        await self._rpc()
+        return self._sender
+
+
+class FakeUserClient:
+    """监听账号客户端替身"""
+    def __init__(self, rpc_latency=0.0):
+        self.rpc_latency = rpc_latency
+        self.handlers = []
+        self.export_calls = 0
+
+    def on(self, builder):
+        def decorator(callback):
+            self.handlers.append((builder, callback))
+            return callback
+        return decorator
+
+    async def dispatch(self, event):
+        """按注册顺序调用处理器（与 Telethon 对单个更新的处理方式一致）"""
+        for _, callback in self.handlers:
+            await callback(event)
+
+    async def export_message_link(self, input_chat, message_id):
+        self.export_calls += 1
+        if self.rpc_latency:
+            await asyncio.sleep(self.rpc_latency)
+        return f"https://t.me/c/{str(abs(input_chat))[3:]}/{message_id}"
+
+    def is_connected(self):
+        return True
+
+    async def disconnect(self):
+        return None
+
+
+class FakeBotClient:
+    """机器人客户端替身，记录每次发送的时间"""
+    def __init__(self, send_latency=0.0):
+        self.send_latency = send_latency
+        self.sent = []  # [(perf_counter, target_id, text)]
+
+    async def send_message(self, target_id, text, buttons=None, parse_mode=None):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        self.sent.append((time.perf_counter(), target_id, text))
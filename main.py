@@ -2,9 +2,16 @@
 import asyncio
 import json
 import logging
+import time
 from modules.bot_manager import BotManager
 from modules.listener import ListenerManager
-from modules.data_manager import load_data
+from modules.sharding import ShardedListenerManager
+from modules.alert_history import AlertHistory
+from modules.sinks import JsonlSink, WebhookSink, RelaySink
+from modules import metrics
+from modules.data_manager import (
+    get_config, config_store, configure_persistence, use_sqlite, flush_data, flush_data_sync
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -27,37 +34,129 @@ async def main():
     api_hash = config['api_hash']
     bot_token = config['bot_token']
     
-    # 加载数据配置
-    data = load_data()
+    # 可选 SQLite 存储（storage.backend 为 "sqlite" 时启用，首次启动自动导入 data.json）
+    storage_config = config.get("storage") or {}
+    if storage_config.get("backend") == "sqlite":
+        use_sqlite(storage_config.get("path", "data.db"))
+    
+    # 加载数据配置（之后所有读取都走内存快照）
+    data = get_config()
     bot_username = data.get("bot_username")
     
+    # data.json 写入合并窗口（秒）
+    configure_persistence(write_delay=config.get("data_write_delay", 1.0))
+    
+    # 监视 data.json 的外部修改（data_watch_interval 为 0 时关闭）
+    watch_interval = config.get("data_watch_interval", 5)
+    if watch_interval:
+        config_store.start_watcher(watch_interval)
+    
+    # 会话/发送者缓存配置（path 设为 null 可关闭持久化）
+    cache_options = dict(config.get("entity_cache") or {})
+    cache_options.setdefault("path", "entity_cache.json")
+    warm_entity_cache = cache_options.pop("warm_from_dialogs", True)
+    
     # 初始化监听管理器（暂时不传 bot_client，等机器人初始化后再设置）
-    listener_manager = ListenerManager(api_id, api_hash, bot_entity=None, bot_client=None)
+    # 多进程分片：sharding.workers 大于 1 时把账号分散到多个工作进程
+    sharding_config = dict(config.get("sharding") or {})
+    workers = sharding_config.pop("workers", 0)
+    sharded = bool(workers and workers > 1)
+    if sharded:
+        listener_manager = ShardedListenerManager(
+            api_id, api_hash, bot_entity=None, bot_client=None,
+            dispatcher_options=config.get("alert_dispatcher"),
+            entity_cache_options=cache_options,
+            workers=workers,
+            **sharding_config
+        )
+    else:
+        listener_manager = ListenerManager(
+            api_id, api_hash, bot_entity=None, bot_client=None,
+            dispatcher_options=config.get("alert_dispatcher"),
+            entity_cache_options=cache_options
+        )
+    listener_manager.warm_entity_cache = warm_entity_cache
+    if not sharded:
+        # 分片模式下由各工作进程加载并保存自己的缓存文件，主进程不持有监听器
+        listener_manager.entity_cache.load()
+        listener_manager.entity_cache.start_autosave()
+    
+    # 提醒历史（history.enabled 为 false 时关闭）
+    history_config = dict(config.get("history") or {})
+    if history_config.pop("enabled", True):
+        history_config.setdefault("path", "history.db")
+        listener_manager.history = AlertHistory(**history_config)
+        listener_manager.history.start()
+    
+    # 断线补拉（gap_recovery.enabled 为 false 时关闭）
+    gap_config = dict(config.get("gap_recovery") or {})
+    if gap_config.pop("enabled", True):
+        gap_config.setdefault("path", "cursors.json")
+        listener_manager.enable_gap_recovery(**gap_config)
+    
+    # 启动并发度与随机抖动（避免所有账号同时登录）
+    startup_config = config.get("startup") or {}
+    listener_manager.startup_concurrency = startup_config.get("concurrency", 8)
+    listener_manager.startup_jitter = startup_config.get("jitter", 1.0)
+    # 每个监听器的消息处理队列（max_size / workers / overflow: drop_oldest | drop_unmatched | block）
+    listener_manager.queue_options = dict(config.get("listener_queue") or {})
     
-    # 初始化管理机器人
     bot_manager = BotManager(api_id, api_hash, bot_token, listener_manager)
-    await bot_manager.init()
     
-    # 设置机器人实体和客户端（在启动监听器之前）
-    if bot_username:
-        try:
-            bot_entity = await bot_manager.client.get_entity(bot_username)
-            listener_manager.bot_entity = bot_entity
-            listener_manager.bot_client = bot_manager.client  # 传递机器人客户端给 ListenerManager
-            # logger.info(f"已设置管理机器人: {bot_username}")
-        except Exception as e:
-            logger.warning(f"设置管理机器人失败: {e}")
+    # 命中事件的其它输出（目标群输出默认开启）：jsonl / webhook / relay（旧版 JSON 转发格式）
+    sinks_config = config.get("sinks") or {}
+    jsonl_config = dict(sinks_config.get("jsonl") or {})
+    if jsonl_config.pop("enabled", False):
+        listener_manager.bus.subscribe(JsonlSink(**jsonl_config))
+    webhook_config = dict(sinks_config.get("webhook") or {})
+    if webhook_config.pop("enabled", False) and webhook_config.get("url"):
+        listener_manager.bus.subscribe(WebhookSink(**webhook_config))
+    relay_config = dict(sinks_config.get("relay") or {})
+    bot_manager.accept_relay = bool(relay_config.pop("accept_incoming", False))
+    if relay_config.pop("enabled", False) and relay_config.get("chat"):
+        listener_manager.bus.subscribe(
+            RelaySink(client_provider=listener_manager.dispatcher.wait_for_client, **relay_config)
+        )
     
-    # 设置机器人事件处理器
-    await bot_manager.setup_handlers()
+    async def start_bot():
+        """初始化管理机器人并把客户端交给监听管理器"""
+        phase_start = time.monotonic()
+        await bot_manager.init()
+        
+        # 设置机器人实体和客户端（监听器在此之前产生的提醒会在发送队列中等待）
+        if bot_username:
+            try:
+                bot_entity = await bot_manager.client.get_entity(bot_username)
+                listener_manager.bot_entity = bot_entity
+                listener_manager.update_bot_client(bot_manager.client)  # 传递机器人客户端给 ListenerManager 和发送队列
+                # logger.info(f"已设置管理机器人: {bot_username}")
+            except Exception as e:
+                logger.warning(f"设置管理机器人失败: {e}")
+        
+        # 设置机器人事件处理器
+        await bot_manager.setup_handlers()
+        logger.info(f"⏱ 管理机器人初始化完成，耗时 {time.monotonic() - phase_start:.1f}s")
     
-    # 启动所有已配置的监听（此时 bot_client 已经设置）
-    # logger.info("正在启动已配置的监听账号...")
-    await listener_manager.reload_all()
+    # 管理机器人与已配置的监听账号同时启动
+    startup_start = time.monotonic()
+    await asyncio.gather(start_bot(), listener_manager.reload_all())
     
-    # 确保所有监听器都有 bot_client（双重保险）
+    # 确保所有监听器都有 bot_client（机器人可能晚于部分监听器就绪）
     if listener_manager.bot_client:
         listener_manager.update_bot_client(listener_manager.bot_client)
+    logger.info(f"⏱ 启动总耗时 {time.monotonic() - startup_start:.1f}s")
+    
+    # 可选的本地指标服务（Prometheus 文本格式）
+    metrics_config = config.get("metrics") or {}
+    if metrics_config.get("enabled"):
+        metrics.registry.register_collector(listener_manager.collect_metrics)
+        try:
+            await metrics.start_metrics_server(
+                metrics_config.get("host", "127.0.0.1"),
+                metrics_config.get("port", 9108)
+            )
+        except OSError as e:
+            logger.error(f"指标服务启动失败: {e}")
     
     logger.info("🚀 系统已启动")
     
@@ -73,6 +172,15 @@ async def main():
         )
     except Exception as e:
         logger.error(f"运行错误: {e}")
+    finally:
+        # 停止监听（分片模式下通知工作进程退出），再把尚未落盘的配置修改和实体缓存写入磁盘
+        try:
+            await listener_manager.shutdown()
+        except Exception as e:
+            logger.error(f"停止监听失败: {e}")
+        await flush_data()
+        if not sharded:
+            await listener_manager.entity_cache.flush()
 
 if __name__ == '__main__':
     try:
@@ -83,4 +191,7 @@ if __name__ == '__main__':
         logger.error(f"❌ 启动失败: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        # 兜底：事件循环被中断时同步写入剩余修改
+        flush_data_sync()
 
@@ -0,0 +1,127 @@
+# modules/admin_index.py - 管理界面列表索引模块
+"""管理机器人列表页使用的内存索引
+
+- 关键词、账号、规则、路由各编译为一个 IndexedList：条目、短 ID、ID -> 位置
+- 按配置版本缓存，配置不变时翻页只做切片，不重新遍历配置
+- 回调数据只携带短 ID（关键词 / 账号用 CRC32，规则 / 路由用自身的 id），
+  不受 Telegram 回调数据 64 字节的限制，也不会因为关键词中的特殊字符出错
+- 翻页使用游标（页首条目的 ID）：列表在两次点击之间被修改时，
+  从游标所在的位置继续，而不是按页码跳到错位的内容
+- 关键词按字典序排列，前缀搜索为两次二分查找
+"""
+import bisect
+import zlib
+
+
+def short_id(text):
+    """稳定的短 ID（与进程、配置版本无关）"""
+    return format(zlib.crc32(str(text).encode("utf-8")), "08x")
+
+
+class Page:
+    """一页条目：entries 为 [(ID, 条目)]，offset 为页首在范围内的位置"""
+    __slots__ = ("entries", "offset", "total", "prev_cursor", "next_cursor")
+
+    def __init__(self, entries, offset, total, prev_cursor, next_cursor):
+        self.entries = entries
+        self.offset = offset
+        self.total = total
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+
+class IndexedList:
+    """带 ID 与位置索引的不可变列表"""
+    __slots__ = ("items", "ids", "_positions")
+
+    def __init__(self, items, ids):
+        self.items = tuple(items)
+        self.ids = tuple(ids)
+        self._positions = {item_id: index for index, item_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, item_id):
+        index = self._positions.get(item_id)
+        return None if index is None else self.items[index]
+
+    def position(self, item_id):
+        return self._positions.get(item_id)
+
+    def page(self, cursor=None, size=10, start=0, stop=None, at=None):
+        """取 [start, stop) 范围内从游标（或位置 at）开始的一页；游标失效时从范围开头开始"""
+        stop = len(self.items) if stop is None else stop
+        index = self._positions.get(cursor) if cursor else at
+        if index is None or not start <= index < stop:
+            index = start
+        end = min(stop, index + size)
+        return Page(
+            [(self.ids[i], self.items[i]) for i in range(index, end)],
+            index - start,
+            stop - start,
+            self.ids[max(start, index - size)] if index > start else None,
+            self.ids[end] if end < stop else None
+        )
+
+
+def _unique_ids(keys):
+    """按顺序为每个键生成短 ID（极少数 CRC32 冲突时加序号区分）"""
+    ids = []
+    seen = set()
+    for key in keys:
+        item_id = short_id(key)
+        suffix = 1
+        while item_id in seen:
+            item_id = short_id(f"{key}#{suffix}")
+            suffix += 1
+        seen.add(item_id)
+        ids.append(item_id)
+    return ids
+
+
+class AdminIndex:
+    """一个配置版本下的所有列表索引"""
+    __slots__ = ("version", "keywords", "accounts", "rules", "routes", "_source")
+
+    def __init__(self, keywords, accounts, rules, routes, version=None):
+        self.version = version
+        self._source = (tuple(keywords), tuple(accounts), tuple(rules), tuple(routes))
+        sorted_keywords = sorted(set(keywords))
+        self.keywords = IndexedList(sorted_keywords, _unique_ids(sorted_keywords))
+        self.accounts = IndexedList(accounts, _unique_ids(acc.get("session_name") for acc in accounts))
+        self.rules = IndexedList(rules, (str(rule.get("id")) for rule in rules))
+        self.routes = IndexedList(routes, (str(route.get("id")) for route in routes))
+
+    def keyword_position(self, keyword):
+        """关键词在字典序中的位置（不存在时为应插入的位置）"""
+        return bisect.bisect_left(self.keywords.items, keyword)
+
+    def keyword_range(self, prefix=""):
+        """以 prefix 开头的关键词在 keywords 中的范围 [start, stop)"""
+        items = self.keywords.items
+        if not prefix:
+            return 0, len(items)
+        start = bisect.bisect_left(items, prefix)
+        return start, bisect.bisect_left(items, prefix + "\U0010ffff", start)
+
+
+_index = None
+
+
+def get_admin_index(snapshot):
+    """获取与配置快照对应的列表索引（列表内容不变时沿用）"""
+    global _index
+    index = _index
+    if index is not None and index.version == snapshot.version:
+        return index
+    source = (
+        tuple(snapshot.keywords), tuple(snapshot.accounts),
+        tuple(snapshot.get("rules", ())), tuple(snapshot.get("routes", ()))
+    )
+    if index is not None and index._source == source:
+        index.version = snapshot.version
+        return index
+    index = AdminIndex(*source, version=snapshot.version)
+    _index = index
+    return index
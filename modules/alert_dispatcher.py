@@ -0,0 +1,233 @@
+# modules/alert_dispatcher.py - 提醒发送队列模块
+from telethon.errors import FloodWaitError
+import asyncio
+import logging
+import time
+from collections import deque
+from modules.message_handler import create_keyword_digest_message, format_digest_entry
+from modules import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """令牌桶限速器：rate 个/秒，最多积累 capacity 个"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """尝试取一个令牌，返回需要等待的秒数（0 表示已取得）"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class AlertItem:
+    """一条待发送的提醒"""
+    __slots__ = ("target_id", "text", "buttons", "event_data", "created_at")
+
+    def __init__(self, target_id, text, buttons=None, event_data=None):
+        self.target_id = target_id
+        self.text = text
+        self.buttons = buttons
+        self.event_data = event_data
+        self.created_at = time.monotonic()
+
+
+class AlertDispatcher:
+    """监听器与机器人客户端之间的发送队列
+
+    - 有界队列：积压超过 max_queue 时丢弃新提醒并计数
+    - 每个目标群一个发送协程，按目标群令牌桶 + 全局令牌桶限速
+    - 遇到 FloodWaitError 只暂停对应目标群，其它目标群照常发送，提醒不会丢失
+    - 可选汇总模式：距上次发送不足 digest_window 秒时先积攒，再把积压的命中
+      （最多 digest_max_items 条 / digest_max_chars 字符）合并为一条消息；
+      流量低时第一条命中仍然立即单独发送
+    """
+    def __init__(self, client=None, max_queue=1000, per_target_rate=20 / 60, per_target_burst=5,
+                 global_rate=25, global_burst=25, digest=False, digest_window=10,
+                 digest_max_items=10, digest_max_chars=3500, digest_snippet_len=200):
+        self._client = client
+        self._client_ready = None  # asyncio.Event，首次等待时创建
+        self.digest = digest
+        self.digest_window = digest_window
+        self.digest_max_items = digest_max_items
+        self.digest_max_chars = digest_max_chars
+        self.digest_snippet_len = digest_snippet_len
+        self._last_sent = {}  # {target_id: monotonic 时间}
+        self.max_queue = max_queue
+        self.per_target_rate = per_target_rate
+        self.per_target_burst = per_target_burst
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._buckets = {}  # {target_id: TokenBucket}
+        self._queues = {}  # {target_id: deque[AlertItem]}
+        self._workers = {}  # {target_id: asyncio.Task}
+        self._paused_until = {}  # {target_id: monotonic 时间}
+        self.pending = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0
+        self.digests_sent = 0
+
+    @property
+    def client(self):
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+        if self._client_ready is not None:
+            if client:
+                self._client_ready.set()
+            else:
+                self._client_ready.clear()
+
+    async def wait_for_client(self):
+        """等待机器人客户端就绪（启动阶段监听器可能先于机器人完成登录）"""
+        if self._client:
+            return self._client
+        if self._client_ready is None:
+            self._client_ready = asyncio.Event()
+        await self._client_ready.wait()
+        return self._client
+
+    def submit(self, target_id, text, buttons=None, event_data=None):
+        """提交一条提醒（不等待发送），队列已满时返回 False"""
+        if self.pending >= self.max_queue:
+            self.dropped += 1
+            logger.warning(f"⚠️ 提醒队列已满 ({self.pending})，丢弃发往 {target_id} 的提醒")
+            return False
+        queue = self._queues.get(target_id)
+        if queue is None:
+            queue = self._queues[target_id] = deque()
+            self._buckets[target_id] = TokenBucket(self.per_target_rate, self.per_target_burst)
+        queue.append(AlertItem(target_id, text, buttons, event_data))
+        self.pending += 1
+        worker = self._workers.get(target_id)
+        if worker is None or worker.done():
+            self._workers[target_id] = asyncio.create_task(self._target_worker(target_id))
+        return True
+
+    async def _send(self, item):
+        client = self._client or await self.wait_for_client()
+        await client.send_message(
+            item.target_id,
+            item.text,
+            buttons=item.buttons,
+            parse_mode='md'
+        )
+
+    def _take_batch(self, queue):
+        """从队首取出可合并的一批提醒（至少一条，只看不删）"""
+        if not self.digest or len(queue) == 1 or queue[0].event_data is None:
+            return [queue[0]]
+        batch = []
+        chars = 0
+        for item in queue:
+            if item.event_data is None or len(batch) >= self.digest_max_items:
+                break
+            chars += len(format_digest_entry(len(batch) + 1, item.event_data, self.digest_snippet_len))
+            if batch and chars > self.digest_max_chars:
+                break
+            batch.append(item)
+        return batch
+
+    async def _target_worker(self, target_id):
+        queue = self._queues[target_id]
+        bucket = self._buckets[target_id]
+        try:
+            while queue:
+                # 汇总模式：刚发送过则等到窗口结束，期间的命中会被合并
+                if self.digest:
+                    wait = self._last_sent.get(target_id, 0) + self.digest_window - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                await bucket.acquire()
+                await self._global_bucket.acquire()
+                batch = self._take_batch(queue)
+                if len(batch) == 1:
+                    item = batch[0]
+                else:
+                    text, buttons = create_keyword_digest_message(
+                        [i.event_data for i in batch], self.digest_snippet_len
+                    )
+                    item = AlertItem(target_id, text, buttons)
+                try:
+                    await self._send(item)
+                    now = time.monotonic()
+                    self._last_sent[target_id] = now
+                    for queued in batch:
+                        metrics.ALERT_SEND_LATENCY.observe(now - queued.created_at)
+                    self.sent += len(batch)
+                    if len(batch) == 1:
+                        keyword = (item.event_data or {}).get("keyword", "")
+                        logger.info(f"✅ 已发送关键词提醒: {keyword} -> {target_id}")
+                    else:
+                        self.digests_sent += 1
+                        logger.info(f"✅ 已发送关键词提醒汇总: {len(batch)} 条 -> {target_id}")
+                except FloodWaitError as e:
+                    # 只暂停当前目标群，稍后重发同一条
+                    self.flood_waits += 1
+                    self.flood_wait_seconds += e.seconds
+                    metrics.FLOOD_WAIT_DURATION.observe(e.seconds)
+                    self._paused_until[target_id] = time.monotonic() + e.seconds
+                    logger.warning(f"⏳ 目标群 {target_id} 触发 FloodWait，暂停 {e.seconds} 秒")
+                    await asyncio.sleep(e.seconds)
+                    self._paused_until.pop(target_id, None)
+                    continue
+                except Exception as e:
+                    self.failed += len(batch)
+                    logger.error(f"❌ 发送关键词提醒失败 -> {target_id}: {e}", exc_info=True)
+                for _ in batch:
+                    queue.popleft()
+                self.pending -= len(batch)
+        finally:
+            if self._workers.get(target_id) is asyncio.current_task():
+                del self._workers[target_id]
+
+    def stats(self):
+        """队列状态"""
+        now = time.monotonic()
+        return {
+            "queue_depth": self.pending,
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "flood_waits": self.flood_waits,
+            "flood_wait_seconds": self.flood_wait_seconds,
+            "digests_sent": self.digests_sent,
+            "targets": {
+                target_id: {
+                    "queue_depth": len(queue),
+                    "paused_for": max(0, self._paused_until.get(target_id, now) - now)
+                }
+                for target_id, queue in self._queues.items()
+            }
+        }
+
+    async def close(self):
+        """取消所有发送协程"""
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._workers.clear()
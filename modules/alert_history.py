@@ -0,0 +1,266 @@
+# modules/alert_history.py - 提醒历史记录模块（SQLite + 全文索引）
+"""把每次命中写入本地 SQLite，便于事后按关键词/群/内容检索
+
+- record() 只把记录放入内存缓冲区，不做任何 I/O；后台任务按批（batch_size 条或
+  flush_interval 秒）在单线程执行器中一次事务写入，不影响提醒发送
+- 全文索引使用 FTS5 trigram 分词（支持中文子串检索，查询词至少 3 个字符）；
+  更短的查询词、或 SQLite 不支持 trigram 分词时退回 LIKE
+  （unicode61 分词把连续的中文当作一个词，无法做子串检索，不用于查询）
+- 超过 retention_days 的记录定期删除
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    keyword TEXT,
+    chat_id INTEGER,
+    chat_title TEXT,
+    sender_name TEXT,
+    sender_username TEXT,
+    message_text TEXT,
+    message_link TEXT,
+    listener_account TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_created_at ON alerts(created_at);
+CREATE INDEX IF NOT EXISTS idx_alerts_chat ON alerts(chat_id, created_at);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS alerts_fts USING fts5(
+    keyword, chat_title, sender_name, message_text,
+    content='alerts', content_rowid='id'{tokenize}
+);
+CREATE TRIGGER IF NOT EXISTS alerts_ai AFTER INSERT ON alerts BEGIN
+    INSERT INTO alerts_fts(rowid, keyword, chat_title, sender_name, message_text)
+    VALUES (new.id, new.keyword, new.chat_title, new.sender_name, new.message_text);
+END;
+CREATE TRIGGER IF NOT EXISTS alerts_ad AFTER DELETE ON alerts BEGIN
+    INSERT INTO alerts_fts(alerts_fts, rowid, keyword, chat_title, sender_name, message_text)
+    VALUES ('delete', old.id, old.keyword, old.chat_title, old.sender_name, old.message_text);
+END;
+"""
+
+COLUMNS = ("created_at", "keyword", "chat_id", "chat_title", "sender_name", "sender_username",
+           "message_text", "message_link", "listener_account")
+
+# trigram 分词要求查询词至少 3 个字符
+FTS_MIN_QUERY_LEN = 3
+
+
+class AlertHistory:
+    """命中历史（批量写入，支持全文检索与分页）"""
+    def __init__(self, path="history.db", batch_size=200, flush_interval=2.0, max_buffer=20000,
+                 retention_days=30, prune_interval=3600):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.pruned = 0
+        self._buffer = deque()
+        self._wakeup = None
+        self._task = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alert-history")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self.fts = self._create_fts()
+
+    def _create_fts(self):
+        for tokenize in (", tokenize='trigram'", ""):
+            try:
+                self._conn.executescript(FTS_SCHEMA.format(tokenize=tokenize))
+                if not tokenize:
+                    logger.warning("⚠️ 当前 SQLite 不支持 trigram 分词，历史检索将使用 LIKE")
+                return "trigram" if tokenize else "unicode61"
+            except sqlite3.OperationalError:
+                continue
+        logger.warning("⚠️ 当前 SQLite 不支持 FTS5，历史检索将使用 LIKE")
+        return None
+
+    def record(self, event_data, created_at=None):
+        """记录一次命中（只写内存缓冲区）"""
+        if len(self._buffer) >= self.max_buffer:
+            self._buffer.popleft()
+            self.dropped += 1
+        row = dict(event_data)
+        row["created_at"] = created_at if created_at is not None else time.time()
+        self._buffer.append(tuple(row.get(column) for column in COLUMNS))
+        self.recorded += 1
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _insert(self, rows):
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    f"INSERT INTO alerts ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    rows
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        self.written += len(rows)
+
+    async def flush(self):
+        """把缓冲区中的记录写入数据库"""
+        if not self._buffer:
+            return 0
+        rows = list(self._buffer)
+        self._buffer.clear()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._insert, rows)
+        except Exception as e:
+            logger.error(f"写入提醒历史失败: {e}", exc_info=True)
+            # 放回缓冲区，下一轮重试
+            self._buffer.extendleft(reversed(rows))
+            return 0
+        return len(rows)
+
+    async def run(self):
+        """后台写入与定期清理"""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        last_prune = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self.retention_days and time.monotonic() - last_prune >= self.prune_interval:
+                last_prune = time.monotonic()
+                await self.prune()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    def _prune(self, cutoff):
+        with self._lock:
+            return self._conn.execute("DELETE FROM alerts WHERE created_at < ?", (cutoff,)).rowcount
+
+    async def prune(self, retention_days=None):
+        """删除超过保留期的记录，返回删除条数"""
+        days = retention_days if retention_days is not None else self.retention_days
+        if not days:
+            return 0
+        cutoff = time.time() - days * 86400
+        count = await asyncio.get_running_loop().run_in_executor(self._executor, self._prune, cutoff)
+        if count:
+            self.pruned += count
+            logger.info(f"🧹 已清理 {count} 条超过 {days} 天的提醒历史")
+        return count
+
+    def _search(self, query, keyword, chat, since, limit, offset):
+        where = []
+        params = []
+        # 多个检索词之间为 AND
+        for term in (query or "").split():
+            if self.fts == "trigram" and len(term) >= FTS_MIN_QUERY_LEN:
+                where.append("id IN (SELECT rowid FROM alerts_fts WHERE alerts_fts MATCH ?)")
+                params.append('"' + term.replace('"', '""') + '"')
+            else:
+                pattern = f"%{term}%"
+                where.append("(message_text LIKE ? OR keyword LIKE ? OR chat_title LIKE ? OR sender_name LIKE ?)")
+                params.append(pattern)
+                params.extend([pattern] * 3)
+        if keyword:
+            where.append("keyword LIKE ?")
+            params.append(f"%{keyword}%")
+        if chat:
+            if str(chat).lstrip("-").isdigit():
+                where.append("chat_id = ?")
+                # 记录中保存的是不带 -100 前缀的会话 ID
+                chat = str(chat)
+                params.append(int(chat[4:]) if chat.startswith("-100") else abs(int(chat)))
+            else:
+                where.append("chat_title LIKE ?")
+                params.append(f"%{chat}%")
+        if since:
+            where.append("created_at >= ?")
+            params.append(since)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM alerts {clause}", params).fetchone()[0]
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM alerts {clause} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            )
+            rows = [dict(zip(COLUMNS, row)) for row in cursor]
+        return rows, total
+
+    async def search(self, query=None, keyword=None, chat=None, since=None, limit=10, offset=0):
+        """检索历史（按时间倒序），返回 (本页记录, 总条数)；先写入缓冲区中的记录"""
+        await self.flush()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._search, query, keyword, chat, since, limit, offset
+        )
+
+    def _count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
+
+    async def count(self):
+        """已保存的记录数（含尚在缓冲区中的记录）"""
+        await self.flush()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._count)
+
+    def stats(self):
+        return {
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "pruned": self.pruned,
+            "fts": self.fts
+        }
+
+
+def parse_search_query(text):
+    """解析检索参数：普通词为全文检索，另支持 关键词:xx 群:xx 天:7（也可用 kw: chat: days:）"""
+    options = {"query": [], "keyword": None, "chat": None, "days": None}
+    for token in text.split():
+        name, sep, value = token.replace("：", ":").partition(":")
+        name = name.lower()
+        if sep and value and name in ("关键词", "kw", "keyword"):
+            options["keyword"] = value
+        elif sep and value and name in ("群", "chat"):
+            options["chat"] = value
+        elif sep and value and name in ("天", "days") and value.isdigit():
+            options["days"] = int(value)
+        else:
+            options["query"].append(token)
+    options["query"] = " ".join(options["query"]) or None
+    return options
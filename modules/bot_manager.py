@@ -4,16 +4,48 @@ import asyncio
 import json
 import logging
 import os
-import base64
+import math
+import time
 from modules.data_manager import (
-    load_data, save_data, add_account, remove_account,
+    get_config, add_account, remove_account,
     add_keywords, remove_keyword, set_target_channel, set_bot_username,
-    clear_all_accounts, clear_all_keywords
+    clear_all_accounts, clear_all_keywords, add_rule, remove_rule, add_route, remove_route, update_chat_filter
+)
+from modules.rule_engine import parse_rule_text, RuleSyntaxError
+from modules.alert_history import parse_search_query
+from modules.chat_filter import parse_chat_filter_text
+from modules.routing import parse_route_text
+from modules.supervisor import STATE_LABELS, STATE_RUNNING, STATE_STOPPED, STATE_BACKOFF, STATE_FAILED
+from modules.event_bus import HitEvent
+from modules.admin_index import get_admin_index
+from modules.session_import import (
+    is_archive, split_session_strings, new_session_names, read_session_archive,
+    validate_session, validate_sessions
 )
-from modules.message_handler import create_keyword_alert_message
 
 logger = logging.getLogger(__name__)
 
+
+def clip_text(text, limit=60):
+    """列表中过长的条目截断显示"""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+HISTORY_PAGE_SIZE = 5  # 提醒历史每页条数
+CONFIG_PREVIEW_SIZE = 20  # 查看配置中预览的关键词数
+LIST_PAGE_SIZE = 30  # 文本列表（关键词、账号）每页条数
+DETAIL_PAGE_SIZE = 10  # 多行条目的文本列表（规则、路由）每页条数
+BUTTON_PAGE_SIZE = 10  # 按钮列表（删除关键词、移除账号等）每页条数
+
+HISTORY_USAGE = (
+    "🔍 **提醒历史检索**\n\n"
+    "用法：`/search 检索词 [关键词:xx] [群:群名或ID] [天:7]`\n\n"
+    "💡 示例：\n"
+    "- `/search 出售频道`\n"
+    "- `/search 关键词:USDT 天:7`\n"
+    "- `/search 担保 群:-1001234567890`\n\n"
+    "清理历史：`/history_prune 天数`（删除早于该天数的记录）"
+)
+
 class BotManager:
     """管理机器人"""
     def __init__(self, api_id, api_hash, bot_token, listener_manager):
@@ -22,7 +54,11 @@ class BotManager:
         self.bot_token = bot_token
         self.listener_manager = listener_manager
         self.client = TelegramClient('bot_session', api_id, api_hash)
-        self.waiting_for = {}  # {user_id: "account_name" | "keyword" | "target" | "bot" | "session"}
+        self.waiting_for = {}  # {user_id: "account_name" | "keyword" | "rule" | "target" | "bot" | "session" | "chat_allow" | "chat_deny" | "chat_remove" | "route" | "keyword_search"}
+        self.history_queries = {}  # {user_id: 最近一次检索参数}，翻页时使用
+        self.keyword_queries = {}  # {user_id: 最近一次关键词搜索前缀}，翻页时使用
+        self.session_import_concurrency = 5  # 批量导入时同时验证的 session 数
+        self.accept_relay = False  # 是否接收私聊中 JSON 格式的转发命中（sinks.relay.accept_incoming）
     
     async def init(self):
         """初始化机器人"""
@@ -45,8 +81,8 @@ class BotManager:
         logger.info(f"机器人信息: ID={me.id}, Username={bot_username}")
         
         if bot_username:
-            data = load_data()
-            if "bot_username" not in data or not data.get("bot_username"):
+            data = get_config()
+            if not data.get("bot_username"):
                 set_bot_username(bot_username)
             
             # 更新 listener_manager 的 bot_entity（无论是否已设置都要更新，确保使用正确的机器人）
@@ -66,8 +102,20 @@ class BotManager:
         return [
             [Button.text("📱 账号管理"), Button.text("🔑 关键词管理")],
             [Button.text("🎯 设置目标群"), Button.text("📋 查看配置")],
+            [Button.text("📐 规则管理"), Button.text("🔍 提醒历史")],
+            [Button.text("🚫 群组过滤"), Button.text("🧭 路由管理")],
         ]
     
+    def format_listener_state(self, status_info):
+        """账号的监听状态（等待重连时附带剩余秒数，失败时附带原因）"""
+        state = status_info.get("state") or (STATE_RUNNING if status_info.get("is_running") else STATE_STOPPED)
+        label = STATE_LABELS.get(state, state)
+        if state == STATE_BACKOFF and status_info.get("next_retry_at"):
+            label += f"（{max(0, status_info['next_retry_at'] - time.time()):.0f}s 后重连）"
+        elif state == STATE_FAILED and status_info.get("last_error"):
+            label += f"（{status_info['last_error']}）"
+        return label
+    
     def get_account_menu(self):
         """账号管理内联菜单（只包含操作按钮，不包含账号列表按钮）"""
         return [
@@ -81,11 +129,236 @@ class BotManager:
         """关键词管理内联菜单"""
         return [
             [Button.inline("➕ 添加关键词", b"keyword_add")],
-            [Button.inline("➖ 删除关键词", b"keyword_remove")],
+            [Button.inline("➖ 删除关键词", b"keyword_remove"), Button.inline("🔎 搜索关键词", b"kw_search")],
             [Button.inline("🗑️ 清空所有关键词", b"keyword_clear_all")],
             [Button.inline("🔙 返回主菜单", b"menu_main")]
         ]
     
+    def get_rule_menu(self):
+        """规则管理内联菜单"""
+        return [
+            [Button.inline("➕ 添加规则", b"rule_add")],
+            [Button.inline("➖ 删除规则", b"rule_remove")],
+            [Button.inline("🔙 返回主菜单", b"menu_main")]
+        ]
+    
+    def page_nav(self, page, prefix):
+        """翻页按钮行（回调数据为 prefix + 游标）"""
+        nav = []
+        if page.prev_cursor:
+            nav.append(Button.inline("⬅️ 上一页", f"{prefix}{page.prev_cursor}"))
+        if page.next_cursor:
+            nav.append(Button.inline("下一页 ➡️", f"{prefix}{page.next_cursor}"))
+        return [nav] if nav else []
+    
+    def page_range(self, page):
+        """「第 a-b 个，共 n 个」"""
+        return f"第 {page.offset + 1}-{page.offset + len(page.entries)} 个，共 {page.total} 个"
+    
+    def aligned_position(self, position, start, size):
+        """删除条目后重新显示它原来所在的那一页"""
+        return start + max(0, position - start) // size * size
+    
+    def render_rule_list(self, cursor=None):
+        """规则列表的一页，返回 (消息, 按钮)"""
+        page = get_admin_index(get_config()).rules.page(cursor, DETAIL_PAGE_SIZE)
+        if not page.total:
+            return "📐 **规则管理**\n\n当前没有已添加的规则。", self.get_rule_menu()
+        msg = f"📐 **规则管理**\n\n**当前规则列表**（{self.page_range(page)}）：\n\n"
+        for _, rule in page.entries:
+            msg += f"{rule.get('id')}. **{rule.get('name') or '未命名'}**\n   表达式：`{clip_text(rule.get('expr', ''), 200)}`\n"
+            if rule.get("chats"):
+                msg += f"   群组：{', '.join(str(c) for c in rule['chats'])}\n"
+            if rule.get("exclude_senders"):
+                msg += f"   排除发送者：{', '.join(str(s) for s in rule['exclude_senders'])}\n"
+        return msg, self.page_nav(page, "rulel_") + self.get_rule_menu()
+    
+    def render_rule_remove(self, cursor=None):
+        """选择要删除的规则（按钮分页）"""
+        page = get_admin_index(get_config()).rules.page(cursor, BUTTON_PAGE_SIZE)
+        buttons = [
+            [Button.inline(f"❌ {rule.get('id')}. {rule.get('name') or rule.get('expr')}", f"rule_del_{rule_id}")]
+            for rule_id, rule in page.entries
+        ]
+        buttons += self.page_nav(page, "ruler_")
+        buttons.append([Button.inline("🔙 返回", b"menu_rules")])
+        return f"选择要删除的规则（{self.page_range(page)}）：", buttons
+    
+    def get_route_menu(self):
+        """路由管理内联菜单"""
+        return [
+            [Button.inline("➕ 添加路由", b"route_add")],
+            [Button.inline("➖ 删除路由", b"route_remove")],
+            [Button.inline("🔙 返回主菜单", b"menu_main")]
+        ]
+    
+    def render_route_list(self, cursor=None):
+        """路由列表的一页，返回 (消息, 按钮)"""
+        data = get_config()
+        page = get_admin_index(data).routes.page(cursor, DETAIL_PAGE_SIZE)
+        default = data.get("target_channel_id")
+        msg = "🧭 **路由管理**\n\n"
+        msg += f"未匹配任何路由的提醒发往默认目标群：{f'`{default}`' if default else '未设置'}\n\n"
+        if not page.total:
+            return msg + "当前没有已添加的路由。", self.get_route_menu()
+        msg += f"**当前路由列表**（{self.page_range(page)}）：\n\n"
+        for _, route in page.entries:
+            msg += f"{route.get('id')}. **{route.get('name') or '未命名'}**\n"
+            if route.get("keywords"):
+                msg += f"   关键词：{', '.join(f'`{kw}`' for kw in route['keywords'])}\n"
+            if route.get("rules"):
+                msg += f"   规则：{', '.join(str(r) for r in route['rules'])}\n"
+            if route.get("chats"):
+                msg += f"   群组：{', '.join(str(c) for c in route['chats'])}\n"
+            msg += f"   目标：{', '.join(f'`{t}`' for t in route.get('targets') or ())}\n"
+        return msg, self.page_nav(page, "routel_") + self.get_route_menu()
+    
+    def render_route_remove(self, cursor=None):
+        """选择要删除的路由（按钮分页）"""
+        page = get_admin_index(get_config()).routes.page(cursor, BUTTON_PAGE_SIZE)
+        buttons = [
+            [Button.inline(f"❌ {route.get('id')}. {route.get('name') or '未命名'}", f"route_del_{route_id}")]
+            for route_id, route in page.entries
+        ]
+        buttons += self.page_nav(page, "router_")
+        buttons.append([Button.inline("🔙 返回", b"menu_routes")])
+        return f"选择要删除的路由（{self.page_range(page)}）：", buttons
+    
+    def render_keyword_list(self, cursor=None):
+        """关键词列表的一页（按字典序），返回 (消息, 按钮)"""
+        page = get_admin_index(get_config()).keywords.page(cursor, LIST_PAGE_SIZE)
+        if not page.total:
+            return "🔑 **关键词管理**\n\n当前没有已添加的关键词。", self.get_keyword_menu()
+        msg = f"🔑 **关键词管理**\n\n**当前关键词列表**（{self.page_range(page)}）：\n\n"
+        for i, (_, kw) in enumerate(page.entries, page.offset + 1):
+            msg += f"{i}. `{clip_text(kw)}`\n"
+        return msg, self.page_nav(page, "kwp_l_") + self.get_keyword_menu()
+    
+    def render_keyword_remove(self, user_id, view="r", cursor=None, near=None):
+        """选择要删除的关键词（按钮分页）；view 为 "s" 时只列出以搜索前缀开头的关键词
+
+        near 为刚删除的关键词：重新显示它原来所在的那一页
+        """
+        index = get_admin_index(get_config())
+        prefix = ""
+        if view == "s":
+            prefix = self.keyword_queries.get(user_id)
+            if prefix is None:
+                return "❌ 搜索已过期，请重新搜索", self.get_keyword_menu()
+        start, stop = index.keyword_range(prefix)
+        at = None
+        if near is not None:
+            at = self.aligned_position(index.keyword_position(near), start, BUTTON_PAGE_SIZE)
+        page = index.keywords.page(cursor, BUTTON_PAGE_SIZE, start, stop, at=at)
+        if not page.total:
+            msg = f"🔎 没有以 `{prefix}` 开头的关键词。" if prefix else "❌ 当前没有已添加的关键词。"
+        elif prefix:
+            msg = f"🔎 以 `{prefix}` 开头的关键词（{self.page_range(page)}），点击删除："
+        else:
+            msg = f"选择要删除的关键词（{self.page_range(page)}）："
+        buttons = [
+            [Button.inline(f"❌ {clip_text(kw, 40)}", f"kwd_{view}_{keyword_id}")]
+            for keyword_id, kw in page.entries
+        ]
+        buttons += self.page_nav(page, f"kwp_{view}_")
+        buttons.append([Button.inline("🔎 搜索", b"kw_search"), Button.inline("🔙 返回", b"menu_keywords")])
+        return msg, buttons
+    
+    def render_account_list(self, cursor=None, at=None):
+        """账号列表的一页（含监听状态），返回 (消息, 按钮)"""
+        page = get_admin_index(get_config()).accounts.page(cursor, LIST_PAGE_SIZE, at=at)
+        if not page.total:
+            return "📱 **账号管理**\n\n当前没有已添加的账号。", self.get_account_menu()
+        msg = f"📱 **账号管理**\n\n**当前账号列表**（{self.page_range(page)}）：\n\n"
+        for i, (_, acc) in enumerate(page.entries, page.offset + 1):
+            session_name = acc.get("session_name", "未知")
+            running = self.format_listener_state(self.listener_manager.get_listener_info(session_name))
+            msg += f"{i}. **{clip_text(acc.get('name', '未知'), 40)}** {running}\n"
+            msg += f"   Session: `{clip_text(session_name, 40)}`\n"
+        return msg, self.page_nav(page, "accp_") + self.get_account_menu()
+    
+    def render_account_remove(self, cursor=None):
+        """选择要移除的账号（按钮分页）"""
+        page = get_admin_index(get_config()).accounts.page(cursor, BUTTON_PAGE_SIZE)
+        buttons = []
+        for account_id, acc in page.entries:
+            session_name = acc.get("session_name", "未知")
+            running = "✅" if self.listener_manager.get_listener_info(session_name).get("is_running") else "❌"
+            buttons.append([Button.inline(
+                f"{running} {acc.get('name', '未知')} ({session_name})",
+                f"account_del_{account_id}"
+            )])
+        buttons += self.page_nav(page, "accr_")
+        buttons.append([Button.inline("🔙 返回", b"menu_accounts")])
+        return f"选择要移除的账号（{self.page_range(page)}）：", buttons
+    
+    def get_chat_filter_menu(self):
+        """群组过滤内联菜单"""
+        return [
+            [Button.inline("✅ 加入白名单", b"chatf_allow"), Button.inline("🚫 加入黑名单", b"chatf_deny")],
+            [Button.inline("➖ 移出名单", b"chatf_remove")],
+            [Button.inline("🔙 返回主菜单", b"menu_main")]
+        ]
+    
+    def format_chat_filter(self):
+        """群组白名单/黑名单（全局与各账号）"""
+        data = get_config()
+        
+        def describe(chat_filter):
+            chat_filter = chat_filter or {}
+            lines = ""
+            for list_name, label in (("allow", "白名单"), ("deny", "黑名单")):
+                chat_ids = chat_filter.get(list_name) or ()
+                if chat_ids:
+                    lines += f"   {label}：{', '.join(f'`{c}`' for c in chat_ids)}\n"
+            return lines
+        
+        msg = "🚫 **群组过滤**\n\n"
+        msg += "**全局：**\n" + (describe(data.get("chat_filter")) or "   未设置（处理所有群）\n")
+        for acc in data.get("userbot_accounts", []):
+            lines = describe(acc.get("chat_filter"))
+            if lines:
+                msg += f"\n**{acc.get('name', '未知')}**（`{acc.get('session_name')}`）：\n{lines}"
+        msg += (
+            "\n💡 白名单非空时只处理名单中的群（账号的白名单优先于全局白名单），"
+            "黑名单中的群始终不处理。"
+        )
+        return msg
+    
+    async def render_history_page(self, user_id, page):
+        """生成提醒历史检索结果的某一页，返回 (消息, 按钮)"""
+        history = self.listener_manager.history
+        if history is None:
+            return "❌ 未启用提醒历史", None
+        options = self.history_queries.get(user_id)
+        if options is None:
+            return "❌ 检索已过期，请重新发送 /search", None
+        since = time.time() - options["days"] * 86400 if options["days"] else None
+        rows, total = await history.search(
+            options["query"], options["keyword"], options["chat"], since,
+            limit=HISTORY_PAGE_SIZE, offset=page * HISTORY_PAGE_SIZE
+        )
+        pages = max(1, math.ceil(total / HISTORY_PAGE_SIZE))
+        msg = f"🔍 **提醒历史**（共 {total} 条，第 {page + 1}/{pages} 页）\n\n"
+        if not rows:
+            msg += "没有找到匹配的记录。"
+        for i, row in enumerate(rows, page * HISTORY_PAGE_SIZE + 1):
+            when = time.strftime("%m-%d %H:%M", time.localtime(row["created_at"]))
+            text = (row["message_text"] or "").replace("```", "")
+            if len(text) > 150:
+                text = text[:147] + "..."
+            msg += f"**{i}.** {when} | 🔑 `{row['keyword']}` | 💬 {row['chat_title']} | 👤 {row['sender_name']}\n{text}\n"
+            if row["message_link"]:
+                msg += f"[查看消息]({row['message_link']})\n"
+            msg += "\n"
+        
+        nav = []
+        if page > 0:
+            nav.append(Button.inline("⬅️ 上一页", f"hist_page_{page - 1}"))
+        if page + 1 < pages:
+            nav.append(Button.inline("下一页 ➡️", f"hist_page_{page + 1}"))
+        return msg, [nav] if nav else None
+    
     async def save_session_from_file(self, event, session_name):
         """从文件保存 session
         
@@ -121,6 +394,122 @@ class BotManager:
         except Exception as e:
             return False, f"处理 session 字符串失败: {e}", None
     
+    async def ensure_bot_entity(self):
+        """启动监听前确保监听器知道管理机器人的实体"""
+        bot_username = get_config().get("bot_username")
+        if bot_username and not self.listener_manager.bot_entity:
+            try:
+                self.listener_manager.bot_entity = await self.client.get_entity(bot_username)
+            except Exception as e:
+                logger.warning(f"获取管理机器人实体失败: {e}")
+    
+    def existing_session_names(self):
+        return [acc.get("session_name") for acc in get_config().get("userbot_accounts", [])]
+    
+    async def import_session_archive(self, event):
+        """批量导入压缩包中的 session 文件 / StringSession"""
+        archive_path = None
+        try:
+            archive_path = await event.download_media(file=f"session_import_{event.id}_{event.file.name}")
+            entries = read_session_archive(archive_path)
+        except Exception as e:
+            await event.respond(f"❌ 读取压缩包失败：{e}\n\n💡 继续发送下一个 session，或输入「完成」结束导入。")
+            return
+        finally:
+            if archive_path and os.path.exists(archive_path):
+                os.remove(archive_path)
+        if not entries:
+            await event.respond(
+                "❌ 压缩包中没有找到 .session 文件或 StringSession 文本\n\n"
+                "💡 继续发送下一个 session，或输入「完成」结束导入。"
+            )
+            return
+        
+        names = new_session_names(len(entries), self.existing_session_names())
+        items = []
+        extracted = {}
+        for name, (source, kind, payload) in zip(names, entries):
+            if kind == "file":
+                path = os.path.join(os.getcwd(), f"{name}.session")
+                with open(path, "wb") as f:
+                    f.write(payload)
+                extracted[name] = path
+                items.append((name, None, source))
+            else:
+                items.append((name, payload, source))
+        await self.import_sessions(event, items, extracted)
+    
+    async def import_session_strings(self, event, session_strings):
+        """批量导入多行 StringSession"""
+        names = new_session_names(len(session_strings), self.existing_session_names())
+        items = [(name, s, f"第 {i} 行") for i, (name, s) in enumerate(zip(names, session_strings), 1)]
+        await self.import_sessions(event, items, {})
+    
+    async def import_sessions(self, event, items, extracted):
+        """并发验证一批 session，验证通过的连接直接交给监听器（不重新登录）
+        
+        items: [(session_name, session_string 或 None, 来源描述)]
+        extracted: {session_name: 从压缩包写出的 .session 文件}，导入失败时删除
+        """
+        await event.respond(f"⏳ 正在验证 {len(items)} 个 session（同时 {self.session_import_concurrency} 个）...")
+        started_at = time.monotonic()
+        results = await validate_sessions(
+            self.api_id, self.api_hash, items, concurrency=self.session_import_concurrency
+        )
+        await self.ensure_bot_entity()
+        
+        known = {acc.get("session_string") for acc in get_config().get("userbot_accounts", []) if acc.get("session_string")}
+        to_start = []
+        for result in results:
+            if not result.ok:
+                continue
+            if result.session_string and result.session_string in known:
+                result.error = "该 session 已经导入过"
+            else:
+                add_success, add_msg = add_account(result.account_name, result.session_name, result.session_string)
+                if add_success:
+                    to_start.append(result)
+                    continue
+                result.error = add_msg
+            await result.client.disconnect()
+        
+        async def start(result):
+            ok = await self.listener_manager.start_listener(
+                result.session_name, result.account_name, client=result.client, me=result.me
+            )
+            if not ok:
+                remove_account(result.session_name)
+                result.error = "启动监听失败"
+        
+        await asyncio.gather(*(start(result) for result in to_start))
+        
+        succeeded = [r for r in results if r.ok]
+        failed = [r for r in results if not r.ok]
+        for result in failed:
+            path = extracted.get(result.session_name)
+            if path and os.path.exists(path):
+                os.remove(path)
+        logger.info(
+            f"⏱ 批量导入 {len(items)} 个 session：成功 {len(succeeded)}，失败 {len(failed)}，"
+            f"耗时 {time.monotonic() - started_at:.1f}s"
+        )
+        
+        msg = f"📦 **批量导入完成**\n\n✅ 成功：{len(succeeded)}\n❌ 失败：{len(failed)}\n"
+        if succeeded:
+            msg += "\n**已启动：**\n"
+            for result in succeeded[:30]:
+                msg += f"- {result.account_name}（{result.session_name}）\n"
+            if len(succeeded) > 30:
+                msg += f"- ... 另外 {len(succeeded) - 30} 个\n"
+        if failed:
+            msg += "\n**失败：**\n"
+            for result in failed[:30]:
+                msg += f"- {result.source}：{result.error}\n"
+            if len(failed) > 30:
+                msg += f"- ... 另外 {len(failed) - 30} 个\n"
+        msg += "\n💡 继续发送下一个 session，或输入「完成」结束导入。"
+        await event.respond(msg)
+    
     async def setup_handlers(self):
         """设置事件处理器"""
         
@@ -132,40 +521,54 @@ class BotManager:
                 buttons=self.get_main_keyboard()
             )
         
+        @self.client.on(events.NewMessage(incoming=True, pattern=r'^/search(?:@\w+)?(?:\s+([\s\S]*))?$',
+                                          func=lambda e: e.is_private))
+        async def search_handler(event):
+            query_text = (event.pattern_match.group(1) or "").strip()
+            if not query_text:
+                await event.respond(HISTORY_USAGE)
+                return
+            self.history_queries[event.sender_id] = parse_search_query(query_text)
+            msg, buttons = await self.render_history_page(event.sender_id, 0)
+            await event.respond(msg, buttons=buttons, link_preview=False)
+        
+        @self.client.on(events.NewMessage(incoming=True, pattern=r'^/history_prune(?:@\w+)?(?:\s+(\d+))?\s*$',
+                                          func=lambda e: e.is_private))
+        async def history_prune_handler(event):
+            history = self.listener_manager.history
+            if history is None:
+                await event.respond("❌ 未启用提醒历史")
+                return
+            days = event.pattern_match.group(1)
+            if not days:
+                await event.respond(f"用法：`/history_prune 天数`\n\n当前自动保留 {history.retention_days} 天的记录。")
+                return
+            count = await history.prune(int(days))
+            await event.respond(f"🧹 已删除 {count} 条早于 {days} 天的提醒历史")
+        
+        if self.accept_relay:
+            @self.client.on(events.NewMessage(incoming=True, pattern=r'^\{', func=lambda e: e.is_private))
+            async def relay_handler(event):
+                """接收其它实例以 JSON 文本转发的命中（{"type": "keyword_alert", ...}），发布到事件总线"""
+                try:
+                    event_data = json.loads(event.raw_text)
+                except ValueError:
+                    return
+                if isinstance(event_data, dict) and event_data.get("type") == "keyword_alert":
+                    self.listener_manager.bus.publish(HitEvent.from_dict(event_data))
+        
         @self.client.on(events.NewMessage(incoming=True, func=lambda e: e.is_private))
         async def message_handler(event):
             text = event.raw_text or ""
             user_id = event.sender_id
             
-            # 优先处理来自 Userbot 的事件数据（JSON格式）
-            # 注意：JSON 消息不应该被当作普通消息处理，也不应该回复给用户
-            if text.startswith('{') and text.endswith('}'):
-                try:
-                    event_data = json.loads(text)
-                    if "type" in event_data and event_data["type"] == "keyword_alert":
-                        alert_msg, buttons = create_keyword_alert_message(event_data)
-                        data_obj = load_data()
-                        target_id = data_obj.get("target_channel_id")
-                        
-                        if target_id:
-                            try:
-                                # 确保target_id是正确的格式
-                                if isinstance(target_id, int) and target_id > 0:
-                                    target_id = int(f"-100{target_id}")
-                                
-                                await self.client.send_message(target_id, alert_msg, buttons=buttons, parse_mode='md')
-                                return
-                            except Exception as e:
-                                logger.error(f"发送到目标群失败: {e}")
-                                return
-                        else:
-                            logger.warning("未设置目标群")
-                            return
-                except (json.JSONDecodeError, KeyError):
-                    pass  # 不是有效的JSON事件数据，继续处理普通消息
-                except Exception as e:
-                    logger.error(f"处理JSON事件数据失败: {e}")
-                    return
+            # 检索类命令由单独的处理器响应，不当作普通输入
+            if text.startswith(("/search", "/history_prune")):
+                return
+            
+            # 旧版 JSON 转发格式由 relay_handler 处理（accept_relay 开启时）
+            if self.accept_relay and text.startswith('{'):
+                return
             
             # 处理等待状态
             if user_id in self.waiting_for:
@@ -178,13 +581,23 @@ class BotManager:
                         del self.waiting_for[user_id]
                         return
                     
+                    # 批量导入：压缩包，或每行一个 StringSession 的多行文本
+                    file_name = event.file.name if event.message.media and event.file else None
+                    if is_archive(file_name):
+                        await self.import_session_archive(event)
+                        return
+                    if not event.message.media and len(split_session_strings(text)) > 1:
+                        await self.import_session_strings(event, split_session_strings(text))
+                        return
+                    
                     # 用户发送了 session，需要从 session 中获取账号信息
-                    session_name = f"anon_{len(load_data().get('userbot_accounts', [])) + 1}"
+                    session_name = f"anon_{len(get_config().get('userbot_accounts', [])) + 1}"
                     session_str = None
                     account_name = "未知账号"
                     success = False
                     msg = ""
                     session_valid = False  # 初始化 session_valid
+                    validated = None  # 验证通过的 session（客户端保持连接）
                     
                     # 检查是否是文件
                     if event.message.media:
@@ -197,22 +610,14 @@ class BotManager:
                                 account_name = existing_listener.account_name
                                 session_valid = True
                             else:
-                                # 验证 session 文件是否有效
-                                temp_client = None
-                                try:
-                                    from telethon import TelegramClient
-                                    temp_client = TelegramClient(session_name, self.api_id, self.api_hash)
-                                    await temp_client.connect()
-                                    if await temp_client.is_user_authorized():
-                                        me = await temp_client.get_me()
-                                        account_name = f"{me.first_name or ''} {me.last_name or ''}".strip() or (f"@{me.username}" if me.username else f"用户{me.id}")
-                                        session_valid = True
-                                    else:
-                                        session_valid = False
-                                except Exception as e:
-                                    error_msg = str(e)
-                                    logger.warning(f"验证 session 文件失败: {e}")
-                                    
+                                # 验证 session 文件是否有效（验证通过的客户端保持连接，直接交给监听器使用）
+                                validated = await validate_session(self.api_id, self.api_hash, session_name)
+                                if validated.ok:
+                                    account_name = validated.account_name
+                                    session_valid = True
+                                else:
+                                    error_msg = validated.error
+                                    logger.warning(f"验证 session 文件失败: {error_msg}")
                                     # 根据错误类型提供不同的提示
                                     if "database is locked" in error_msg.lower():
                                         # 数据库被锁定，可能是文件正在被使用
@@ -241,18 +646,7 @@ class BotManager:
                                             "请确认这是有效的 Telethon session 文件。\n\n"
                                             "💡 继续发送下一个 session，或输入「完成」结束导入。"
                                         )
-                                    session_valid = False
-                                    account_name = f"账号_{session_name}"
                                     return  # 不删除 waiting_for，继续等待下一个 session
-                                finally:
-                                    # 确保客户端正确关闭
-                                    if temp_client:
-                                        try:
-                                            await temp_client.disconnect()
-                                            # 等待一小段时间，确保所有任务完成
-                                            await asyncio.sleep(0.1)
-                                        except Exception:
-                                            pass
                         
                         # 如果验证失败，不添加账号
                         if not session_valid:
@@ -272,58 +666,17 @@ class BotManager:
                             success, msg = result[:2]
                             session_str = result[2] if len(result) > 2 else text.strip()
                         
-                        # 验证 session 是否有效（在添加账号之前）
+                        # 验证 session 是否有效（在添加账号之前）；
+                        # 没有 session_string 时验证同名的本地 session 文件
                         account_name = None
                         session_valid = False
-                        temp_client = None
-                        if success and session_str:
-                            try:
-                                from telethon import TelegramClient
-                                from telethon.sessions import StringSession
-                                temp_client = TelegramClient(StringSession(session_str), self.api_id, self.api_hash)
-                                # 使用 connect() + is_user_authorized()，避免交互式输入
-                                await temp_client.connect()
-                                if await temp_client.is_user_authorized():
-                                    me = await temp_client.get_me()
-                                    account_name = f"{me.first_name or ''} {me.last_name or ''}".strip() or (f"@{me.username}" if me.username else f"用户{me.id}")
-                                    session_valid = True
-                                else:
-                                    session_valid = False
-                            except Exception as e:
-                                logger.warning(f"验证 session 失败: {e}")
-                                session_valid = False
-                            finally:
-                                if temp_client:
-                                    try:
-                                        await temp_client.disconnect()
-                                        await asyncio.sleep(0.1)
-                                    except Exception:
-                                        pass
-                        
-                        # 如果没有 session_string，尝试验证本地 session 文件
-                        if success and not session_str:
-                            temp_client = None
-                            try:
-                                from telethon import TelegramClient
-                                temp_client = TelegramClient(session_name, self.api_id, self.api_hash)
-                                # 使用 connect() + is_user_authorized()，避免交互式输入
-                                await temp_client.connect()
-                                if await temp_client.is_user_authorized():
-                                    me = await temp_client.get_me()
-                                    account_name = f"{me.first_name or ''} {me.last_name or ''}".strip() or (f"@{me.username}" if me.username else f"用户{me.id}")
-                                    session_valid = True
-                                else:
-                                    session_valid = False
-                            except Exception as e:
-                                logger.warning(f"验证 session 文件失败: {e}")
-                                session_valid = False
-                            finally:
-                                if temp_client:
-                                    try:
-                                        await temp_client.disconnect()
-                                        await asyncio.sleep(0.1)
-                                    except Exception:
-                                        pass
+                        if success:
+                            validated = await validate_session(self.api_id, self.api_hash, session_name, session_str)
+                            if validated.ok:
+                                account_name = validated.account_name
+                                session_valid = True
+                            else:
+                                logger.warning(f"验证 session 失败: {validated.error}")
                         
                         # 如果验证失败，不添加账号
                         if not session_valid:
@@ -343,16 +696,13 @@ class BotManager:
                         add_success, add_msg = add_account(account_name, session_name, session_str)
                         if add_success:
                             # 立即尝试启动监听
-                            data = load_data()
-                            bot_username = data.get("bot_username")
-                            if bot_username and not self.listener_manager.bot_entity:
-                                try:
-                                    bot_entity = await self.client.get_entity(bot_username)
-                                    self.listener_manager.bot_entity = bot_entity
-                                except Exception as e:
-                                    logger.warning(f"获取管理机器人实体失败: {e}")
+                            await self.ensure_bot_entity()
                             
-                            start_ok = await self.listener_manager.start_listener(session_name, account_name)
+                            start_ok = await self.listener_manager.start_listener(
+                                session_name, account_name,
+                                client=validated.client if validated else None,
+                                me=validated.me if validated else None
+                            )
                             listener = self.listener_manager.listeners.get(session_name)
                             listener_user = getattr(listener, "listener_username", "未知") if listener else "未知"
                             running = listener.is_running if listener else False
@@ -362,7 +712,6 @@ class BotManager:
                                 prefix = "✅ 账号添加并启动成功！"
                             else:
                                 # 启动失败，删除已添加的账号
-                                from modules.data_manager import remove_account
                                 remove_account(session_name)
                                 status_text = (
                                     "启动失败：session 可能无效或已过期。"
@@ -378,6 +727,8 @@ class BotManager:
                                 "💡 继续发送下一个 session，或输入「完成」结束导入。"
                             )
                         else:
+                            if validated and validated.client:
+                                await validated.client.disconnect()
                             await event.respond(f"❌ 添加账号失败：{add_msg}\n\n💡 继续发送下一个 session，或输入「完成」结束导入。")
                     else:
                         await event.respond(f"❌ {msg}\n\n💡 继续发送下一个 session，或输入「完成」结束导入。")
@@ -415,6 +766,106 @@ class BotManager:
                     # 不删除 waiting_for，继续等待下一个关键词
                     return
                 
+                elif wait_type == "keyword_search":
+                    prefix = text.strip()
+                    if prefix.lower() in ["取消", "cancel"]:
+                        await event.respond("❌ 已取消搜索关键词")
+                        del self.waiting_for[user_id]
+                        return
+                    if not prefix:
+                        await event.respond("⚠️ 请发送关键词的开头部分，或输入「取消」取消操作。")
+                        return
+                    self.keyword_queries[user_id] = prefix
+                    del self.waiting_for[user_id]
+                    msg, buttons = self.render_keyword_remove(user_id, "s")
+                    await event.respond(msg, buttons=buttons)
+                    return
+                
+                elif wait_type == "rule":
+                    # 检查是否是"取消"命令
+                    if text.strip().lower() in ["取消", "cancel"]:
+                        await event.respond("❌ 已取消添加规则")
+                        del self.waiting_for[user_id]
+                        return
+                    
+                    try:
+                        rule = parse_rule_text(text)
+                    except RuleSyntaxError as e:
+                        await event.respond(f"❌ 规则格式错误：{e}\n\n💡 请修改后重新发送，或输入「取消」取消操作。")
+                        # 不删除 waiting_for，允许用户重试或取消
+                        return
+                    success, result = add_rule(rule)
+                    if success:
+                        await event.respond(
+                            f"✅ 已添加规则 {result['id']}：**{result.get('name') or '未命名'}**\n"
+                            f"表达式：`{result['expr']}`",
+                            buttons=self.get_rule_menu()
+                        )
+                    else:
+                        await event.respond(f"❌ 添加规则失败：{result}")
+                    del self.waiting_for[user_id]
+                    return
+                
+                elif wait_type == "route":
+                    # 检查是否是"取消"命令
+                    if text.strip().lower() in ["取消", "cancel"]:
+                        await event.respond("❌ 已取消添加路由")
+                        del self.waiting_for[user_id]
+                        return
+                    
+                    try:
+                        route = parse_route_text(text)
+                    except ValueError as e:
+                        await event.respond(f"❌ 路由格式错误：{e}\n\n💡 请修改后重新发送，或输入「取消」取消操作。")
+                        # 不删除 waiting_for，允许用户重试或取消
+                        return
+                    route = add_route(route)
+                    await event.respond(
+                        f"✅ 已添加路由 {route['id']}：**{route.get('name') or '未命名'}**\n"
+                        f"目标：{', '.join(str(t) for t in route['targets'])}",
+                        buttons=self.get_route_menu()
+                    )
+                    del self.waiting_for[user_id]
+                    return
+                
+                elif wait_type in ("chat_allow", "chat_deny", "chat_remove"):
+                    # 检查是否是"取消"命令
+                    if text.strip().lower() in ["取消", "cancel"]:
+                        await event.respond("❌ 已取消修改群组过滤")
+                        del self.waiting_for[user_id]
+                        return
+                    
+                    try:
+                        entries = parse_chat_filter_text(text)
+                    except ValueError as e:
+                        await event.respond(f"❌ {e}\n\n💡 请修改后重新发送，或输入「取消」取消操作。")
+                        # 不删除 waiting_for，允许用户重试或取消
+                        return
+                    
+                    if wait_type == "chat_remove":
+                        targets = [("allow", "白名单", False), ("deny", "黑名单", False)]
+                    elif wait_type == "chat_allow":
+                        targets = [("allow", "白名单", True)]
+                    else:
+                        targets = [("deny", "黑名单", True)]
+                    results = []
+                    for session_name, chat_ids in entries.items():
+                        scope = "全局" if session_name is None else f"账号 `{session_name}` 的"
+                        for list_name, label, add in targets:
+                            ok, changed = update_chat_filter(list_name, chat_ids, session_name, add=add)
+                            if not ok:
+                                results.append(f"❌ {changed}")
+                                break
+                            if changed:
+                                action = "加入" if add else "移出"
+                                results.append(f"✅ 已{action}{scope}{label}：{', '.join(str(c) for c in changed)}")
+                    await event.respond(
+                        "\n".join(results) or "⚠️ 名单没有变化",
+                        buttons=self.get_chat_filter_menu()
+                    )
+                    del self.waiting_for[user_id]
+                    return
+                
                 elif wait_type == "target":
                     # 检查是否是"取消"命令
                     if text.strip().lower() in ["取消", "cancel"]:
@@ -445,40 +896,30 @@ class BotManager:
                 
             # 处理主菜单键盘按钮
             if text == "📱 账号管理":
-                data_obj = load_data()
-                accounts = data_obj.get("userbot_accounts", [])
-                status = self.listener_manager.get_listener_status()
-                
-                if accounts:
-                    msg = "📱 **账号管理**\n\n**当前账号列表：**\n\n"
-                    for i, acc in enumerate(accounts, 1):
-                        session_name = acc.get("session_name", "未知")
-                        status_info = status.get(session_name, {})
-                        running = "✅ 运行中" if status_info.get("is_running") else "❌ 未运行"
-                        msg += f"{i}. **{acc.get('name', '未知')}** {running}\n"
+                msg, buttons = self.render_account_list()
+                await event.respond(msg, buttons=buttons)
+            
+            elif text == "🔍 提醒历史":
+                history = self.listener_manager.history
+                if history is None:
+                    await event.respond("❌ 未启用提醒历史（config.json 中 history.enabled 为 false）")
                 else:
-                    msg = "📱 **账号管理**\n\n当前没有已添加的账号。"
-                
-                await event.respond(
-                    msg,
-                    buttons=self.get_account_menu()
-                )
+                    await event.respond(f"{HISTORY_USAGE}\n\n📚 当前共保存 {await history.count()} 条记录，保留 {history.retention_days} 天。")
+            
+            elif text == "📐 规则管理":
+                msg, buttons = self.render_rule_list()
+                await event.respond(msg, buttons=buttons)
+            
+            elif text == "🚫 群组过滤":
+                await event.respond(self.format_chat_filter(), buttons=self.get_chat_filter_menu())
+            
+            elif text == "🧭 路由管理":
+                msg, buttons = self.render_route_list()
+                await event.respond(msg, buttons=buttons)
             
             elif text == "🔑 关键词管理":
-                data_obj = load_data()
-                keywords = data_obj.get("keywords", [])
-                
-                if keywords:
-                    msg = "🔑 **关键词管理**\n\n**当前关键词列表：**\n\n"
-                    for i, kw in enumerate(keywords, 1):
-                        msg += f"{i}. `{kw}`\n"
-                else:
-                    msg = "🔑 **关键词管理**\n\n当前没有已添加的关键词。"
-                
-                await event.respond(
-                    msg,
-                    buttons=self.get_keyword_menu()
-                )
+                msg, buttons = self.render_keyword_list()
+                await event.respond(msg, buttons=buttons)
             
             elif text == "🎯 设置目标群":
                 self.waiting_for[user_id] = "target"
@@ -492,11 +933,9 @@ class BotManager:
                 )
             
             elif text == "📋 查看配置":
-                data_obj = load_data()
-                accounts = data_obj.get("userbot_accounts", [])
-                keywords = data_obj.get("keywords", [])
+                data_obj = get_config()
+                index = get_admin_index(data_obj)
                 target = data_obj.get("target_channel_id")
-                status = self.listener_manager.get_listener_status()
                 
                 # 获取目标群名称
                 target_name = "未设置"
@@ -507,29 +946,24 @@ class BotManager:
                     except:
                         target_name = str(target)
                 
+                # 只显示数量与前几项，完整列表在分页的账号/关键词列表中查看
                 msg = "📋 **当前配置**\n\n"
-                msg += f"📱 **账号数量**：{len(accounts)} (运行中: {sum(1 for s in status.values() if s.get('is_running'))})\n"
-                if keywords:
-                    msg += f"🔑 **关键词**：{', '.join([f'`{kw}`' for kw in keywords])}\n"
+                msg += f"📱 **账号数量**：{len(index.accounts)} (运行中: {self.listener_manager.running_count()})\n"
+                if len(index.keywords):
+                    preview = index.keywords.items[:CONFIG_PREVIEW_SIZE]
+                    msg += f"🔑 **关键词**（{len(index.keywords)} 个）：{', '.join(f'`{clip_text(kw, 30)}`' for kw in preview)}"
+                    msg += " 等\n" if len(index.keywords) > len(preview) else "\n"
                 else:
                     msg += f"🔑 **关键词**：无\n"
-                msg += f"🎯 **目标群**：{target_name}\n\n"
+                msg += f"📐 **规则数量**：{len(index.rules)}\n"
+                chat_filter = data_obj.get("chat_filter") or {}
+                msg += f"🚫 **群组过滤**：白名单 {len(chat_filter.get('allow') or ())} 个，黑名单 {len(chat_filter.get('deny') or ())} 个\n"
+                msg += f"🎯 **目标群**：{target_name}\n"
+                msg += f"🧭 **路由数量**：{len(index.routes)}\n"
                 
-                if accounts:
-                    msg += "**账号列表：**\n"
-                    for acc in accounts:
-                        session_name = acc.get("session_name", "未知")
-                        status_info = status.get(session_name, {})
-                        running = "✅" if status_info.get("is_running") else "❌"
-                        msg += f"- {running} {acc.get('name', '未知')} (`{session_name}`)\n"
-                    msg += "\n"
-                
-                if keywords:
-                    msg += "**关键词列表：**\n"
-                    for kw in keywords:
-                        msg += f"- `{kw}`\n"
-                
-                await event.respond(msg)
+                await event.respond(msg, buttons=[
+                    [Button.inline("📱 账号列表", b"accp_"), Button.inline("🔑 关键词列表", b"kwp_l_")]
+                ])
             
             elif text == "🔙 返回主菜单":
                 await event.respond(
@@ -562,85 +996,51 @@ class BotManager:
                         "💡 提示：\n"
                         "- 可以发送 `.session` 文件\n"
                         "- 也可以发送 session 字符串（StringSession）\n"
+                        "- 一次导入多个：发送包含 .session 文件的 zip / tar 压缩包，"
+                        "或每行一个 StringSession 的文本（并发验证）\n"
                         "- 支持批量导入：连续发送多个 session，完成后输入「完成」结束导入"
                     )
                     await event.answer()
                 
                 elif data == "account_remove":
-                    data_obj = load_data()
-                    accounts = data_obj.get("userbot_accounts", [])
-                    if not accounts:
+                    if not len(get_admin_index(get_config()).accounts):
                         await event.respond("❌ 当前没有已添加的账号。")
                         await event.answer()
                         return
-                    
-                    # 获取运行状态
-                    status = self.listener_manager.get_listener_status()
-                    
-                    buttons = []
-                    for acc in accounts:
-                        session_name = acc.get("session_name", "未知")
-                        status_info = status.get(session_name, {})
-                        running = "✅" if status_info.get("is_running") else "❌"
-                        buttons.append([Button.inline(
-                            f"{running} {acc.get('name', '未知')} ({session_name})",
-                            f"account_del_{session_name}"
-                        )])
-                    buttons.append([Button.inline("🔙 返回", b"menu_accounts")])
-                    
-                    await event.edit("选择要移除的账号：", buttons=buttons)
+                    msg, buttons = self.render_account_remove()
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data.startswith("accr_"):
+                    msg, buttons = self.render_account_remove(data[len("accr_"):] or None)
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data.startswith("accp_"):
+                    msg, buttons = self.render_account_list(data[len("accp_"):] or None)
+                    await event.edit(msg, buttons=buttons)
                 
                 elif data.startswith("account_del_"):
-                    session_name = data.replace("account_del_", "")
-                    success = remove_account(session_name)
-                    if success:
+                    accounts = get_admin_index(get_config()).accounts
+                    account_id = data[len("account_del_"):]
+                    account = accounts.get(account_id)
+                    position = accounts.position(account_id) or 0
+                    session_name = account.get("session_name") if account is not None else None
+                    if session_name and remove_account(session_name):
                         await self.listener_manager.stop_listener(session_name)
                         await event.respond(f"✅ 已移除账号：{session_name}\n监听已停止")
                     else:
-                        await event.respond(f"❌ 移除失败")
-                    data_obj = load_data()
-                    accounts = data_obj.get("userbot_accounts", [])
-                    status = self.listener_manager.get_listener_status()
-                    data_obj = load_data()
-                    accounts = data_obj.get("userbot_accounts", [])
-                    status = self.listener_manager.get_listener_status()
-                    
-                    if accounts:
-                        msg = "📱 **账号管理**\n\n**当前账号列表：**\n\n"
-                        for i, acc in enumerate(accounts, 1):
-                            session_name = acc.get("session_name", "未知")
-                            status_info = status.get(session_name, {})
-                            running = "✅ 运行中" if status_info.get("is_running") else "❌ 未运行"
-                            msg += f"{i}. **{acc.get('name', '未知')}** {running}\n"
-                    else:
-                        msg = "📱 **账号管理**\n\n当前没有已添加的账号。"
-                    
-                    await event.edit(msg, buttons=self.get_account_menu())
+                        await event.respond(f"❌ 移除失败：账号不存在")
+                    msg, buttons = self.render_account_list(
+                        at=self.aligned_position(position, 0, LIST_PAGE_SIZE)
+                    )
+                    await event.edit(msg, buttons=buttons)
                 
                 elif data == "menu_accounts":
-                    data_obj = load_data()
-                    accounts = data_obj.get("userbot_accounts", [])
-                    status = self.listener_manager.get_listener_status()
-                    
-                    if accounts:
-                        msg = "📱 **账号管理**\n\n**当前账号列表：**\n\n"
-                        for i, acc in enumerate(accounts, 1):
-                            session_name = acc.get("session_name", "未知")
-                            status_info = status.get(session_name, {})
-                            running = "✅ 运行中" if status_info.get("is_running") else "❌ 未运行"
-                            msg += f"{i}. **{acc.get('name', '未知')}** {running}\n"
-                            msg += f"   Session: `{session_name}`\n\n"
-                    else:
-                        msg = "📱 **账号管理**\n\n当前没有已添加的账号。"
-                    
-                    await event.edit(
-                        msg,
-                        buttons=self.get_account_menu()
-                    )
+                    msg, buttons = self.render_account_list()
+                    await event.edit(msg, buttons=buttons)
                 
                 elif data == "account_clear_all":
                     # 确认清空所有账号
-                    data_obj = load_data()
+                    data_obj = get_config()
                     accounts = data_obj.get("userbot_accounts", [])
                     if not accounts:
                         await event.respond("❌ 当前没有已添加的账号。")
@@ -662,7 +1062,7 @@ class BotManager:
                 
                 elif data == "account_clear_confirm":
                     # 执行清空所有账号
-                    data_obj = load_data()
+                    data_obj = get_config()
                     accounts = data_obj.get("userbot_accounts", [])
                     
                     # 停止所有监听
@@ -692,35 +1092,44 @@ class BotManager:
                     await event.answer()
                 
                 elif data == "keyword_remove":
-                    data_obj = load_data()
-                    keywords = data_obj.get("keywords", [])
-                    if not keywords:
+                    if not len(get_admin_index(get_config()).keywords):
                         await event.respond("❌ 当前没有已添加的关键词。")
                         await event.answer()
                         return
-                    
-                    buttons = []
-                    for kw in keywords:
-                        buttons.append([Button.inline(
-                            f"❌ {kw}",
-                            f"keyword_del_{kw}"
-                        )])
-                    buttons.append([Button.inline("🔙 返回", b"menu_keywords")])
-                    
-                    await event.edit("选择要删除的关键词：", buttons=buttons)
+                    msg, buttons = self.render_keyword_remove(user_id)
+                    await event.edit(msg, buttons=buttons)
                 
-                elif data.startswith("keyword_del_"):
-                    keyword = data.replace("keyword_del_", "")
-                    success = remove_keyword(keyword)
-                    if success:
+                elif data == "kw_search":
+                    self.waiting_for[user_id] = "keyword_search"
+                    await event.respond(
+                        "🔎 **搜索关键词**\n\n"
+                        "请发送关键词的开头部分，将列出所有以它开头的关键词（区分大小写）。\n\n"
+                        "💬 输入「取消」可取消操作。"
+                    )
+                    await event.answer()
+                
+                elif data.startswith("kwp_"):
+                    # kwp_{视图}_{游标}：l 为文本列表，r 为删除列表，s 为搜索结果
+                    view, cursor = data[len("kwp_"):].split("_", 1)
+                    if view == "l":
+                        msg, buttons = self.render_keyword_list(cursor or None)
+                    else:
+                        msg, buttons = self.render_keyword_remove(user_id, view, cursor or None)
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data.startswith("kwd_"):
+                    view, keyword_id = data[len("kwd_"):].split("_", 1)
+                    keyword = get_admin_index(get_config()).keywords.get(keyword_id)
+                    if keyword is not None and remove_keyword(keyword):
                         await event.respond(f"✅ 已删除关键词：{keyword}")
                     else:
                         await event.respond(f"❌ 删除失败：关键词不存在")
-                    await event.edit("🔑 **关键词管理**", buttons=self.get_keyword_menu())
+                    msg, buttons = self.render_keyword_remove(user_id, view, near=keyword)
+                    await event.edit(msg, buttons=buttons)
                 
                 elif data == "keyword_clear_all":
                     # 确认清空所有关键词
-                    data_obj = load_data()
+                    data_obj = get_config()
                     keywords = data_obj.get("keywords", [])
                     if not keywords:
                         await event.respond("❌ 当前没有已添加的关键词。")
@@ -750,12 +1159,134 @@ class BotManager:
                         buttons=self.get_keyword_menu()
                     )
                 
-                elif data == "menu_keywords":
-                    await event.edit(
-                        "🔑 **关键词管理**\n\n"
-                        "管理监听关键词：",
-                        buttons=self.get_keyword_menu()
+                elif data == "rule_add":
+                    self.waiting_for[user_id] = "rule"
+                    await event.respond(
+                        "➕ **添加规则**\n\n"
+                        "请按以下格式发送规则（群组、排除发送者可省略）：\n\n"
+                        "```\n"
+                        "名称: 出售频道\n"
+                        "表达式: 出售 AND 频道 NOT 担保\n"
+                        "群组: -1001234567890, -1009876543210\n"
+                        "排除发送者: 123456\n"
+                        "```\n\n"
+                        "💡 提示：\n"
+                        "- 表达式支持 AND、OR、NOT 和括号，相邻的词默认为 AND\n"
+                        "- 含空格的词用双引号括起来，例如 `\"USDT 出售\"`\n"
+                        "- 不填群组表示所有群\n\n"
+                        "💬 输入「取消」可取消操作。"
+                    )
+                    await event.answer()
+                
+                elif data == "rule_remove":
+                    if not len(get_admin_index(get_config()).rules):
+                        await event.respond("❌ 当前没有已添加的规则。")
+                        await event.answer()
+                        return
+                    msg, buttons = self.render_rule_remove()
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data.startswith("ruler_"):
+                    msg, buttons = self.render_rule_remove(data[len("ruler_"):] or None)
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data.startswith("rulel_"):
+                    msg, buttons = self.render_rule_list(data[len("rulel_"):] or None)
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data.startswith("rule_del_"):
+                    rule_id = int(data.replace("rule_del_", ""))
+                    success = remove_rule(rule_id)
+                    if success:
+                        await event.respond(f"✅ 已删除规则：{rule_id}")
+                    else:
+                        await event.respond(f"❌ 删除失败：规则不存在")
+                    msg, buttons = self.render_rule_list()
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data == "route_add":
+                    self.waiting_for[user_id] = "route"
+                    await event.respond(
+                        "➕ **添加路由**\n\n"
+                        "请按以下格式发送路由（关键词、规则、群组可省略，目标必填）：\n\n"
+                        "```\n"
+                        "名称: 交易\n"
+                        "关键词: 出售, 收购, USDT\n"
+                        "规则: 3\n"
+                        "群组: -1001234567890\n"
+                        "目标: -1001111111111, -1002222222222\n"
+                        "```\n\n"
+                        "💡 提示：\n"
+                        "- 关键词用逗号分隔，规则填写规则 ID\n"
+                        "- 同时填写关键词和群组时，两者都满足才匹配；都不填表示所有命中\n"
+                        "- 匹配多条路由时发往所有目标群；未匹配任何路由时发往默认目标群\n\n"
+                        "💬 输入「取消」可取消操作。"
                     )
+                    await event.answer()
+                
+                elif data == "route_remove":
+                    if not len(get_admin_index(get_config()).routes):
+                        await event.respond("❌ 当前没有已添加的路由。")
+                        await event.answer()
+                        return
+                    msg, buttons = self.render_route_remove()
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data.startswith("router_"):
+                    msg, buttons = self.render_route_remove(data[len("router_"):] or None)
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data.startswith("routel_"):
+                    msg, buttons = self.render_route_list(data[len("routel_"):] or None)
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data.startswith("route_del_"):
+                    route_id = int(data.replace("route_del_", ""))
+                    success = remove_route(route_id)
+                    if success:
+                        await event.respond(f"✅ 已删除路由：{route_id}")
+                    else:
+                        await event.respond(f"❌ 删除失败：路由不存在")
+                    msg, buttons = self.render_route_list()
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data in ("chatf_allow", "chatf_deny", "chatf_remove"):
+                    self.waiting_for[user_id] = data.replace("chatf_", "chat_")
+                    title = {
+                        "chatf_allow": "✅ **加入白名单**",
+                        "chatf_deny": "🚫 **加入黑名单**",
+                        "chatf_remove": "➖ **移出名单**（同时从白名单和黑名单中移除）"
+                    }[data]
+                    await event.respond(
+                        f"{title}\n\n"
+                        "请发送群 ID，多个用逗号或空格分隔：\n\n"
+                        "```\n"
+                        "-1001234567890, -1009876543210\n"
+                        "anon_1: -1001111111111\n"
+                        "```\n\n"
+                        "💡 提示：\n"
+                        "- 不带前缀的行修改全局名单\n"
+                        "- 以「session 名:」开头的行只修改该账号的名单\n\n"
+                        "💬 输入「取消」可取消操作。"
+                    )
+                    await event.answer()
+                
+                elif data.startswith("hist_page_"):
+                    page = int(data.replace("hist_page_", ""))
+                    msg, buttons = await self.render_history_page(user_id, page)
+                    await event.edit(msg, buttons=buttons, link_preview=False)
+                
+                elif data == "menu_rules":
+                    msg, buttons = self.render_rule_list()
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data == "menu_routes":
+                    msg, buttons = self.render_route_list()
+                    await event.edit(msg, buttons=buttons)
+                
+                elif data == "menu_keywords":
+                    msg, buttons = self.render_keyword_list()
+                    await event.edit(msg, buttons=buttons)
                 
             except Exception as e:
                 logger.error(f"回调处理失败: {e}")
@@ -0,0 +1,105 @@
+# modules/chat_filter.py - 群组白名单/黑名单模块
+"""按群过滤消息（作为 Telethon 的事件过滤函数执行，被排除的群不会进入消息处理器）
+
+配置：
+    "chat_filter": {"allow": [...], "deny": [...]}      全局名单（data.json 顶层）
+    账号中的 "chat_filter": {"allow": [...], "deny": [...]}  单个账号的名单
+
+- 白名单非空时只处理名单中的群；账号设置了白名单时以账号的为准，否则使用全局白名单
+- 黑名单为全局与账号黑名单的并集，优先于白名单
+- 名单编译为整数集合（正数 ID 同时加入 -100 前缀形式），每条消息只做集合查找
+- 配置变化时只重建变化的部分：全局名单编译一次供所有账号共用，名单未变的账号沿用原结果
+"""
+import re
+from modules.rule_engine import normalize_chat_ids
+
+LISTS = ("allow", "deny")
+
+
+class ChatFilter:
+    """编译后的过滤条件（不可变）"""
+    __slots__ = ("allow", "deny", "version")
+
+    def __init__(self, allow=None, deny=frozenset(), version=None):
+        self.allow = allow  # None 表示不限制
+        self.deny = deny
+        self.version = version
+
+    def allows(self, chat_id):
+        if chat_id in self.deny:
+            return False
+        return self.allow is None or chat_id in self.allow
+
+
+def _compile(source):
+    """{"allow": [...], "deny": [...]} -> (白名单集合或 None, 黑名单集合)"""
+    source = source or {}
+    allow = source.get("allow") or ()
+    return (normalize_chat_ids(allow) if allow else None), normalize_chat_ids(source.get("deny"))
+
+
+_global = (None, (None, frozenset()))  # (全局名单原始配置, 编译结果)
+_accounts = (None, {})  # (配置版本, {session_name: 账号的名单配置})
+_filters = {}  # {session_name: (全局名单原始配置, 账号名单原始配置, ChatFilter)}
+
+
+def _account_sources(snapshot):
+    global _accounts
+    version, sources = _accounts
+    if version != snapshot.version:
+        sources = {acc.get("session_name"): acc.get("chat_filter") for acc in snapshot.accounts}
+        _accounts = (snapshot.version, sources)
+    return sources
+
+
+def get_chat_filter(snapshot, session_name):
+    """获取账号在当前配置快照下的过滤条件（按版本缓存，名单不变时沿用）"""
+    cached = _filters.get(session_name)
+    if cached is not None and cached[2].version == snapshot.version:
+        return cached[2]
+
+    global _global
+    global_source = snapshot.get("chat_filter")
+    if _global[0] != global_source:
+        _global = (global_source, _compile(global_source))
+    account_source = _account_sources(snapshot).get(session_name)
+    if cached is not None and cached[0] == global_source and cached[1] == account_source:
+        cached[2].version = snapshot.version
+        return cached[2]
+
+    global_allow, global_deny = _global[1]
+    account_allow, account_deny = _compile(account_source)
+    chat_filter = ChatFilter(
+        account_allow if account_allow is not None else global_allow,
+        global_deny | account_deny,
+        version=snapshot.version
+    )
+    _filters[session_name] = (global_source, account_source, chat_filter)
+    return chat_filter
+
+
+def parse_chat_filter_text(text):
+    """解析机器人收到的名单文本，返回 {session_name 或 None(全局): [群 ID]}
+
+    每行一组 ID（逗号或空格分隔）；以「session 名:」开头的行只作用于该账号。
+    """
+    result = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        session_name = None
+        parts = re.split(r"[:：]", line, maxsplit=1)
+        if len(parts) == 2:
+            session_name = parts[0].strip() or None
+            line = parts[1]
+        for item in re.split(r"[,，\s]+", line.strip()):
+            if not item:
+                continue
+            try:
+                result.setdefault(session_name, []).append(int(item))
+            except ValueError:
+                raise ValueError(f"群 ID 无效：{item}")
+    if not result:
+        raise ValueError("没有找到群 ID")
+    return result
@@ -0,0 +1,178 @@
+# modules/config_store.py - 内存配置快照模块
+import asyncio
+import json
+import logging
+import os
+import threading
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+
+def _freeze(value):
+    """递归冻结：dict -> 只读映射，list -> tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    """递归解冻：只读映射 -> dict，tuple -> list（返回可修改的副本）"""
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class ConfigSnapshot:
+    """不可变的配置快照（每次写入都会生成新版本）"""
+    __slots__ = ("version", "data")
+
+    def __init__(self, version, data):
+        self.version = version
+        self.data = _freeze(data)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    @property
+    def keywords(self):
+        return self.data.get("keywords", ())
+
+    @property
+    def accounts(self):
+        return self.data.get("userbot_accounts", ())
+
+    @property
+    def target_channel_id(self):
+        return self.data.get("target_channel_id")
+
+    def to_dict(self):
+        """返回可修改的深拷贝"""
+        return _thaw(self.data)
+
+
+class ConfigStore:
+    """共享配置存储
+
+    - 热路径只读取内存中的快照，不访问磁盘
+    - 写入方通过 publish() 换入新快照（引用替换是原子的）
+    - 可选的文件监视器用于感知外部对 data.json 的手动修改
+    """
+    def __init__(self, path, default_factory):
+        self.path = path
+        self.default_factory = default_factory
+        self._snapshot = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._file_mtime = None
+        self._watch_task = None
+        self._source = None  # 非 JSON 文件的存储（提供 read() 与 change_token()）
+        # 由写入方设置：返回 True 表示内存中还有未落盘的修改，此时不从文件重载
+        self.has_pending_writes = lambda: False
+
+    @property
+    def snapshot(self):
+        """当前快照（首次访问时从文件加载）"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.reload()
+        return snapshot
+
+    def set_source(self, source):
+        """改用其它存储（如 SQLite）：之后的加载与外部修改检测都走 source"""
+        self._source = source
+        self.path = source.path
+        self._snapshot = None
+
+    def _read_file(self):
+        if self._source is not None:
+            data = self._source.read()
+            self._file_mtime = self._source.change_token()
+            return data
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._file_mtime = self._stat_mtime()
+            return data
+        self._file_mtime = None
+        return self.default_factory()
+
+    def _stat_mtime(self):
+        if self._source is not None:
+            return self._source.change_token()
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self):
+        """从文件重新加载并发布新快照"""
+        return self.publish(self._read_file())
+
+    def publish(self, data):
+        """发布新快照并通知订阅者"""
+        with self._lock:
+            self._version += 1
+            # _freeze 会重建所有容器，快照与调用方的 data 互不影响
+            snapshot = ConfigSnapshot(self._version, data)
+            self._snapshot = snapshot
+        for callback in list(self._subscribers):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"配置订阅回调执行失败: {e}", exc_info=True)
+        return snapshot
+
+    def subscribe(self, callback):
+        """订阅快照变更，callback(snapshot)"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def mark_synced(self):
+        """记录自身写入后的文件 mtime，避免监视器把自己的写入当成外部修改"""
+        self._file_mtime = self._stat_mtime()
+
+    async def watch(self, interval=5.0):
+        """轮询 data.json 的修改时间，发现外部修改时重新加载"""
+        logger.info(f"已启动配置文件监视: {self.path} (间隔 {interval}s)")
+        while True:
+            await asyncio.sleep(interval)
+            if self.has_pending_writes():
+                continue
+            mtime = self._stat_mtime()
+            if mtime is None or mtime == self._file_mtime:
+                continue
+            try:
+                # 文件解析放到线程池，避免阻塞事件循环
+                data = await asyncio.get_running_loop().run_in_executor(None, self._read_file)
+                snapshot = self.publish(data)
+                logger.info(f"检测到 {self.path} 外部修改，已重新加载 (版本 {snapshot.version})")
+            except (OSError, ValueError) as e:
+                # 文件可能正在被写入，下一轮再试
+                logger.warning(f"重新加载 {self.path} 失败: {e}")
+
+    def start_watcher(self, interval=5.0):
+        """在当前事件循环中启动文件监视任务"""
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self.watch(interval))
+        return self._watch_task
+
+    async def stop_watcher(self):
+        if self._watch_task and not self._watch_task.done():
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+        self._watch_task = None
@@ -1,25 +1,75 @@
 # modules/data_manager.py - 数据管理模块
-import json
-import os
+from modules.config_store import ConfigStore
+from modules.persistence import WriteBehindWriter
+from modules.rule_engine import compile_rule, RuleSyntaxError
 
 DATA_FILE = 'data.json'
+SQLITE_FILE = 'data.db'
 
-def load_data():
-    """加载动态配置数据"""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+def default_data():
+    """默认配置"""
     return {
         "userbot_accounts": [],
         "keywords": [],
+        "rules": [],
+        "routes": [],
         "target_channel_id": None,
         "bot_username": None
     }
 
+# 全局共享的配置存储（所有监听器与管理机器人共用同一份内存快照）
+config_store = ConfigStore(DATA_FILE, default_data)
+
+# 延迟合并写入：短时间内的多次修改只落盘一次，且不阻塞事件循环
+data_writer = WriteBehindWriter(
+    DATA_FILE,
+    delay=1.0,
+    serializer=lambda snapshot: snapshot.to_dict(),
+    on_written=config_store.mark_synced
+)
+config_store.has_pending_writes = lambda: data_writer.busy
+
+def configure_persistence(write_delay=None):
+    """调整写入合并窗口（秒）"""
+    if write_delay is not None:
+        data_writer.delay = write_delay
+
+def use_sqlite(path=SQLITE_FILE):
+    """改用 SQLite 存储（需在首次读取配置前调用）；首次启动时自动导入 data.json"""
+    global data_writer
+    from modules.sqlite_store import SQLiteBackend
+    backend = SQLiteBackend(path, default_data)
+    backend.migrate_from_json(DATA_FILE)
+    config_store.set_source(backend)
+    data_writer = WriteBehindWriter(
+        path,
+        delay=data_writer.delay,
+        serializer=lambda snapshot: snapshot.to_dict(),
+        on_written=config_store.mark_synced,
+        write_func=backend.write
+    )
+    return backend
+
+async def flush_data():
+    """立即落盘尚未写入的修改（退出前调用）"""
+    await data_writer.flush()
+
+def flush_data_sync():
+    """同步落盘尚未写入的修改"""
+    data_writer.flush_sync()
+
+def get_config():
+    """获取当前配置快照（只读，不访问磁盘，供热路径使用）"""
+    return config_store.snapshot
+
+def load_data():
+    """加载动态配置数据（返回内存快照的可修改副本）"""
+    return config_store.snapshot.to_dict()
+
 def save_data(data):
-    """保存动态配置数据"""
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    """保存动态配置数据：立即换入新的内存快照，磁盘写入延迟合并执行"""
+    snapshot = config_store.publish(data)
+    data_writer.schedule(snapshot)
 
 def add_account(name, session_name, session_string=None):
     """添加账号
@@ -100,3 +150,77 @@ def clear_all_keywords():
     save_data(data)
     return True
 
+def add_rule(rule):
+    """添加规则（先校验表达式），返回 (是否成功, 规则或错误信息)"""
+    try:
+        compile_rule(rule)
+    except RuleSyntaxError as e:
+        return False, str(e)
+    data = load_data()
+    rules = data.get("rules", [])
+    rule = dict(rule)
+    rule["id"] = max((r.get("id", 0) for r in rules), default=0) + 1
+    rules.append(rule)
+    data["rules"] = rules
+    save_data(data)
+    return True, rule
+
+def remove_rule(rule_id):
+    """删除规则"""
+    data = load_data()
+    rules = data.get("rules", [])
+    remaining = [r for r in rules if r.get("id") != rule_id]
+    if len(remaining) == len(rules):
+        return False
+    data["rules"] = remaining
+    save_data(data)
+    return True
+
+def add_route(route):
+    """添加提醒路由，返回带 id 的路由"""
+    data = load_data()
+    routes = data.get("routes", [])
+    route = dict(route)
+    route["id"] = max((r.get("id", 0) for r in routes), default=0) + 1
+    routes.append(route)
+    data["routes"] = routes
+    save_data(data)
+    return route
+
+def remove_route(route_id):
+    """删除提醒路由"""
+    data = load_data()
+    routes = data.get("routes", [])
+    remaining = [r for r in routes if r.get("id") != route_id]
+    if len(remaining) == len(routes):
+        return False
+    data["routes"] = remaining
+    save_data(data)
+    return True
+
+def update_chat_filter(list_name, chat_ids, session_name=None, add=True):
+    """修改群组白名单("allow")/黑名单("deny")；session_name 为空时修改全局名单
+
+    返回 (是否成功, 实际变化的 ID 或错误信息)
+    """
+    data = load_data()
+    if session_name is None:
+        owner = data
+    else:
+        owner = next((a for a in data.get("userbot_accounts", []) if a.get("session_name") == session_name), None)
+        if owner is None:
+            return False, f"账号不存在：{session_name}"
+    chat_filter = owner.get("chat_filter") or {}
+    current = chat_filter.get(list_name, [])
+    if add:
+        changed = [c for c in dict.fromkeys(chat_ids) if c not in current]
+        current = current + changed
+    else:
+        changed = [c for c in dict.fromkeys(chat_ids) if c in current]
+        current = [c for c in current if c not in changed]
+    if not changed:
+        return True, []
+    chat_filter[list_name] = current
+    owner["chat_filter"] = chat_filter
+    save_data(data)
+    return True, changed
@@ -0,0 +1,56 @@
+# modules/dedup.py - 跨账号消息去重模块
+import time
+from collections import OrderedDict
+
+
+class MessageDedup:
+    """跨账号共享的命中去重索引
+
+    以 (chat_id, message_id) 为键，先 claim 的账号负责发送提醒，
+    其余账号直接丢弃。条目按 TTL 过期，并受 max_size 限制（超出时淘汰最旧的）。
+    """
+    def __init__(self, ttl=600, max_size=50000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # {(chat_id, message_id): (claimed_at, owner)}
+        self.claimed = 0
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self, now):
+        entries = self._entries
+        deadline = now - self.ttl
+        # 插入顺序即时间顺序，只需从头部淘汰
+        while entries:
+            key, (claimed_at, _) = next(iter(entries.items()))
+            if claimed_at > deadline and len(entries) <= self.max_size:
+                break
+            entries.popitem(last=False)
+
+    def claim(self, chat_id, message_id, owner=None):
+        """尝试认领一条消息，返回 True 表示由调用方处理"""
+        now = time.monotonic()
+        key = (chat_id, message_id)
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[0] <= self.ttl:
+            self.duplicates += 1
+            return False
+        if entry is not None:
+            del self._entries[key]
+        self._entries[key] = (now, owner)
+        self.claimed += 1
+        self._evict(now)
+        return True
+
+    def owner_of(self, chat_id, message_id):
+        entry = self._entries.get((chat_id, message_id))
+        return entry[1] if entry else None
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "claimed": self.claimed,
+            "duplicates": self.duplicates
+        }
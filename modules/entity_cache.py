@@ -0,0 +1,206 @@
+# modules/entity_cache.py - 会话/发送者信息缓存模块
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from modules.persistence import WriteBehindWriter
+
+logger = logging.getLogger(__name__)
+
+
+class EntityInfo:
+    """解析后的会话/发送者元数据（只保留生成提醒所需的字段）"""
+    __slots__ = ("id", "title", "username", "first_name", "last_name", "cached_at")
+
+    def __init__(self, id=None, title=None, username=None, first_name=None, last_name=None, cached_at=None):
+        self.id = id
+        self.title = title
+        self.username = username
+        self.first_name = first_name
+        self.last_name = last_name
+        self.cached_at = cached_at if cached_at is not None else time.time()
+
+    @classmethod
+    def from_entity(cls, entity):
+        return cls(
+            id=getattr(entity, "id", None),
+            title=getattr(entity, "title", None),
+            username=getattr(entity, "username", None),
+            first_name=getattr(entity, "first_name", None),
+            last_name=getattr(entity, "last_name", None)
+        )
+
+    @property
+    def display_name(self):
+        """发送者显示名（名 + 姓），没有时返回 None"""
+        parts = [p for p in (self.first_name, self.last_name) if p]
+        return " ".join(parts) if parts else None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class EntityCache:
+    """所有监听器共享的会话/发送者缓存（LRU + TTL）
+
+    - 以 (kind, marked_id) 为键，kind 为 "chat" 或 "sender"
+    - 同一实体的并发未命中只发起一次解析
+    - 启动时可从对话列表预热，可选持久化到磁盘，重启后无需重新解析
+    """
+    def __init__(self, max_size=20000, ttl=6 * 3600, path=None, save_interval=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.save_interval = save_interval
+        self._entries = OrderedDict()  # {(kind, id): EntityInfo}
+        self._inflight = {}  # {(kind, id): asyncio.Future}
+        self._dirty = False
+        self._save_task = None
+        self._writer = WriteBehindWriter(path, delay=0, indent=None) if path else None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, kind, entity_id):
+        """只查缓存，不发起请求；未命中或已过期返回 None"""
+        key = (kind, entity_id)
+        info = self._entries.get(key)
+        if info is None:
+            return None
+        if time.time() - info.cached_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return info
+
+    def put(self, kind, entity_id, info):
+        key = (kind, entity_id)
+        self._entries[key] = info
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self._dirty = True
+        return info
+
+    def remember(self, kind, entity_id, entity):
+        """缓存一个已拿到的 Telethon 实体（None 也缓存为空信息，避免反复解析）"""
+        if entity_id is None:
+            return EntityInfo.from_entity(entity)
+        return self.put(kind, entity_id, EntityInfo.from_entity(entity))
+
+    async def _resolve(self, kind, entity_id, fetch):
+        info = self.get(kind, entity_id)
+        if info is not None:
+            self.hits += 1
+            return info
+        self.misses += 1
+        if entity_id is None:
+            # 没有 ID 的实体（匿名管理员、频道消息）各不相同，不能共享解析结果
+            try:
+                return self.remember(kind, entity_id, await fetch())
+            except Exception:
+                self.errors += 1
+                raise
+        key = (kind, entity_id)
+        future = self._inflight.get(key)
+        if future is not None:
+            # 其它监听器正在解析同一实体，直接等待其结果
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            entity = await fetch()
+            info = self.remember(kind, entity_id, entity)
+            future.set_result(info)
+            return info
+        except Exception as e:
+            self.errors += 1
+            future.set_exception(e)
+            # 没有其它等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def get_chat(self, event):
+        """获取事件所在会话的信息"""
+        return await self._resolve("chat", event.chat_id, event.get_chat)
+
+    async def get_sender(self, event):
+        """获取事件发送者的信息"""
+        return await self._resolve("sender", event.sender_id, event.get_sender)
+
+    async def warm_from_dialogs(self, client, limit=None):
+        """从账号的对话列表预热会话缓存"""
+        count = 0
+        try:
+            async for dialog in client.iter_dialogs(limit=limit):
+                if dialog.is_user:
+                    continue
+                self.remember("chat", dialog.id, dialog.entity)
+                count += 1
+        except Exception as e:
+            logger.warning(f"预热会话缓存失败: {e}")
+        logger.info(f"会话缓存预热完成: {count} 个会话")
+        return count
+
+    def load(self):
+        """从磁盘加载缓存（忽略已过期条目）"""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"加载实体缓存失败: {e}")
+            return 0
+        now = time.time()
+        for kind, entity_id, fields in rows:
+            info = EntityInfo(**fields)
+            if now - info.cached_at <= self.ttl:
+                self._entries[(kind, entity_id)] = info
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        logger.info(f"已加载实体缓存: {len(self._entries)} 条")
+        return len(self._entries)
+
+    def _export(self):
+        return [[kind, entity_id, info.to_dict()] for (kind, entity_id), info in self._entries.items()]
+
+    def save(self):
+        """登记一次持久化（在事件循环线程中导出，磁盘写入在执行器中完成）"""
+        if not self._writer or not self._dirty:
+            return
+        self._dirty = False
+        self._writer.schedule(self._export())
+
+    async def flush(self):
+        self.save()
+        if self._writer:
+            await self._writer.flush()
+
+    async def autosave(self):
+        """定期持久化"""
+        while True:
+            await asyncio.sleep(self.save_interval)
+            self.save()
+
+    def start_autosave(self):
+        if self._writer and (self._save_task is None or self._save_task.done()):
+            self._save_task = asyncio.create_task(self.autosave())
+        return self._save_task
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -0,0 +1,160 @@
+# modules/event_bus.py - 进程内事件总线模块
+"""命中事件的发布/订阅
+
+监听器只负责把命中发布到总线，各个输出（Telegram 目标群、JSONL 文件、Webhook、
+JSON 转发、库调用方的异步迭代器）分别订阅。每个订阅方有自己的队列，
+publish() 只做入队、不等待，某个输出变慢不会拖慢其它输出。
+
+订阅方需要提供 offer(event) -> bool（不阻塞），可选 start() / close() / stats()。
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class HitEvent:
+    """一次关键词/规则命中
+
+    keyword 为显示用的文本（多个命中以逗号连接）；keywords / rule_ids 为逐个命中的
+    关键词与规则 ID，路由按它们查找目标群
+    """
+    FIELDS = ("listener_account", "keyword", "keywords", "rule_ids", "sender_name", "sender_username",
+              "chat_title", "chat_id", "message_id", "message_text", "message_link", "created_at")
+    __slots__ = FIELDS
+
+    def __init__(self, listener_account=None, keyword=None, keywords=None, rule_ids=(), sender_name=None,
+                 sender_username=None, chat_title=None, chat_id=None, message_id=None, message_text=None,
+                 message_link=None, created_at=None):
+        self.listener_account = listener_account
+        self.keyword = keyword
+        # 旧格式的事件只有 keyword
+        self.keywords = tuple(keywords) if keywords is not None else ((keyword,) if keyword else ())
+        self.rule_ids = tuple(rule_ids or ())
+        self.sender_name = sender_name
+        self.sender_username = sender_username
+        self.chat_title = chat_title
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.message_text = message_text
+        self.message_link = message_link
+        self.created_at = created_at if created_at is not None else time.time()
+
+    @classmethod
+    def from_dict(cls, data):
+        """从 event_data 构造（忽略多余的字段，如旧格式中的 "type"）"""
+        return cls(**{name: data[name] for name in cls.FIELDS if name in data})
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __repr__(self):
+        return f"HitEvent(keyword={self.keyword!r}, chat_id={self.chat_id}, message_id={self.message_id})"
+
+
+class EventBus:
+    """命中事件总线"""
+    def __init__(self, sinks=()):
+        self.sinks = []
+        self.published = 0
+        for sink in sinks:
+            self.subscribe(sink)
+
+    def subscribe(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def unsubscribe(self, sink):
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+    def publish(self, event):
+        """把事件交给所有订阅方（只入队，不等待）"""
+        self.published += 1
+        for sink in list(self.sinks):
+            try:
+                sink.offer(event)
+            except Exception as e:
+                logger.error(f"事件投递到 {getattr(sink, 'name', type(sink).__name__)} 失败: {e}", exc_info=True)
+
+    def stream(self, max_queue=1000):
+        """以异步迭代器的方式订阅命中（供库调用方使用）
+
+            async with bus.stream() as hits:
+                async for hit in hits:
+                    ...
+        """
+        return EventStream(self, max_queue)
+
+    async def close(self):
+        for sink in list(self.sinks):
+            close = getattr(sink, "close", None)
+            if close is not None:
+                try:
+                    await close()
+                except Exception as e:
+                    logger.error(f"关闭 {getattr(sink, 'name', type(sink).__name__)} 失败: {e}")
+
+    def stats(self):
+        result = {"published": self.published}
+        for sink in self.sinks:
+            stats = getattr(sink, "stats", None)
+            if stats is not None:
+                result[getattr(sink, "name", type(sink).__name__)] = stats()
+        return result
+
+
+class EventStream:
+    """异步迭代器订阅（有界队列，满时丢弃新事件并计数）"""
+    name = "stream"
+
+    def __init__(self, bus, max_queue=1000):
+        self.bus = bus
+        self.dropped = 0
+        self.delivered = 0
+        self._queue = asyncio.Queue(max_queue)
+        self._closed = False
+        bus.subscribe(self)
+
+    def offer(self, event):
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed and self._queue.empty():
+            raise StopAsyncIteration
+        event = await self._queue.get()
+        if event is None:
+            raise StopAsyncIteration
+        self.delivered += 1
+        return event
+
+    async def close(self):
+        """取消订阅；正在等待的迭代结束"""
+        if self._closed:
+            return
+        self._closed = True
+        self.bus.unsubscribe(self)
+        try:
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def stats(self):
+        return {"queue_depth": self._queue.qsize(), "delivered": self.delivered, "dropped": self.dropped}
@@ -0,0 +1,160 @@
+# modules/event_queue.py - 监听器消息处理队列模块
+"""每个监听器一个有界队列 + 固定数量的处理协程
+
+Telethon 为每条更新单独调用处理器，大群刷屏时同时在处理的消息数没有上限。
+处理器只把消息放入队列，由 workers 个协程依次处理，队列满时按 overflow 策略处理：
+
+- "drop_oldest"：丢弃队列中最早的消息
+- "drop_unmatched"：先丢弃未命中的消息（新消息与队列中尚未匹配的消息按需匹配，
+  结果随消息保存，处理时不再重复匹配）；全部命中时丢弃最早的消息
+- "block"：等待队列有空位。只有客户端以 sequential_updates=True 创建时才会把背压传回
+  Telethon（UserbotListener 在该策略下会这样创建客户端）：Telethon 默认为每条更新
+  单独创建任务，处理器在这里等待时任务会无限堆积；顺序分发时 Telethon 在处理器
+  返回前不再分发新的更新
+"""
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_unmatched", "block")
+
+
+class EventQueue:
+    """有界消息队列
+
+    process: async (event, hits) -> None，hits 为 None 表示尚未匹配
+    classify: event -> 命中列表（同步、无网络请求），drop_unmatched 策略使用
+    """
+    def __init__(self, process, classify=None, max_size=1000, workers=4, overflow="drop_unmatched", name=""):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的队列溢出策略：{overflow}（可选 {', '.join(OVERFLOW_POLICIES)}）")
+        if overflow == "drop_unmatched" and classify is None:
+            raise ValueError("drop_unmatched 策略需要提供 classify")
+        self.process = process
+        self.classify = classify
+        self.max_size = max(1, max_size)
+        self.workers = max(1, workers)
+        self.overflow = overflow
+        self.name = name
+        self._items = deque()  # [event, hits]
+        self._tasks = []
+        self._not_empty = None
+        self._not_full = None
+        self._idle = None
+        self._busy = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped_oldest = 0
+        self.dropped_unmatched = 0
+        self.blocked = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def pending(self):
+        """排队中与正在处理的消息数"""
+        return len(self._items) + self._busy
+
+    def _ensure_started(self):
+        if self._not_empty is None:
+            self._not_empty = asyncio.Event()
+            self._not_full = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._idle.set()
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def put(self, event):
+        """放入一条消息；被丢弃时返回 False"""
+        self._ensure_started()
+        hits = None
+        items = self._items
+        if len(items) >= self.max_size:
+            if self.overflow == "block":
+                self.blocked += 1
+                while len(items) >= self.max_size:
+                    self._not_full.clear()
+                    await self._not_full.wait()
+            elif self.overflow == "drop_oldest":
+                items.popleft()
+                self.dropped_oldest += 1
+            else:
+                hits = self.classify(event)
+                if not hits:
+                    # 新消息未命中，直接丢弃
+                    self.dropped_unmatched += 1
+                    return False
+                self._evict()
+        items.append([event, hits])
+        self.enqueued += 1
+        if len(items) > self.max_depth:
+            self.max_depth = len(items)
+        self._idle.clear()
+        self._not_empty.set()
+        return True
+
+    def _evict(self):
+        """丢弃最早的未命中消息；全部命中时丢弃最早的消息"""
+        items = self._items
+        for index, item in enumerate(items):
+            if item[1] is None:
+                item[1] = self.classify(item[0])
+            if not item[1]:
+                del items[index]
+                self.dropped_unmatched += 1
+                return
+        items.popleft()
+        self.dropped_oldest += 1
+        if self.dropped_oldest % 100 == 1:
+            logger.warning(f"[{self.name}] ⚠️ 消息队列已满 ({self.max_size})，已丢弃 {self.dropped_oldest} 条命中的消息")
+
+    async def _worker(self):
+        items = self._items
+        while True:
+            while not items:
+                if not self._busy:
+                    self._idle.set()
+                self._not_empty.clear()
+                await self._not_empty.wait()
+            event, hits = items.popleft()
+            self._not_full.set()
+            self._busy += 1
+            try:
+                await self.process(event, hits)
+            except Exception as e:
+                logger.error(f"[{self.name}] 消息处理失败: {e}", exc_info=True)
+            finally:
+                self._busy -= 1
+                self.processed += 1
+
+    async def join(self):
+        """等待队列中的消息全部处理完"""
+        if self._idle is not None:
+            while self.pending:
+                self._idle.clear()
+                await self._idle.wait()
+
+    async def close(self):
+        """停止处理协程（队列中剩余的消息被丢弃）"""
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._items.clear()
+
+    def stats(self):
+        return {
+            "depth": len(self._items),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped_oldest": self.dropped_oldest,
+            "dropped_unmatched": self.dropped_unmatched,
+            "blocked": self.blocked
+        }
+
@@ -0,0 +1,200 @@
+# modules/gap_recovery.py - 断线补拉模块
+"""监听账号断线期间的消息补拉
+
+- 每个账号记录每个群最后处理到的消息 ID（内存字典，定期落盘）
+- 断线时先记下当时的进度，重连成功后按群用 iter_messages 补拉进度之后的消息，
+  包装成与 NewMessage 事件相同的接口，经过同一个过滤/匹配/发送流程；
+  与实时消息重复的命中由共享去重索引（MessageDedup）过滤
+- 同时补拉的群数、每个群最多补拉的条数都有上限；遇到超过 max_flood_wait 秒的
+  FloodWait 时放弃该账号本轮补拉，避免长时间断线后集中请求
+- 进程重启时从磁盘读取进度，超过 max_age 秒的进度不再补拉
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from telethon.errors import FloodWaitError
+from modules.message_context import MessageContext
+from modules.persistence import WriteBehindWriter
+
+logger = logging.getLogger(__name__)
+
+
+class RecoveredEvent:
+    """把补拉到的 Message 包装成 NewMessage 事件的接口（属性转发给消息本身）"""
+    __slots__ = ("message",)
+
+    def __init__(self, message):
+        self.message = message
+
+    def __getattr__(self, name):
+        return getattr(self.message, name)
+
+
+class ChatCursors:
+    """每个账号每个群最后处理到的消息 ID"""
+    def __init__(self, path=None, save_interval=10):
+        self.path = path
+        self.save_interval = save_interval
+        self.saved_at = None  # 从磁盘加载的进度的保存时间
+        self._sessions = {}  # {session_name: {chat_id: message_id}}
+        self._writer = WriteBehindWriter(path, delay=0, indent=None) if path else None
+        self._save_task = None
+
+    def for_session(self, session_name):
+        """账号的进度字典（监听器在热路径上直接更新）"""
+        return self._sessions.setdefault(session_name, {})
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"加载消息进度失败: {e}")
+            return 0
+        self.saved_at = data.get("saved_at")
+        for session_name, chats in data.get("sessions", {}).items():
+            cursors = self.for_session(session_name)
+            for chat_id, message_id in chats.items():
+                cursors[int(chat_id)] = max(cursors.get(int(chat_id), 0), message_id)
+        return sum(len(chats) for chats in self._sessions.values())
+
+    def save(self):
+        if self._writer:
+            self._writer.schedule({
+                "saved_at": time.time(),
+                "sessions": {name: {str(k): v for k, v in chats.items()} for name, chats in self._sessions.items()}
+            })
+
+    async def flush(self):
+        self.save()
+        if self._writer:
+            await self._writer.flush()
+
+    async def autosave(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            self.save()
+
+    def start_autosave(self):
+        if self._writer and (self._save_task is None or self._save_task.done()):
+            self._save_task = asyncio.create_task(self.autosave())
+        return self._save_task
+
+
+class GapRecovery:
+    """所有监听器共享的补拉调度（限制并发与 FloodWait）"""
+    def __init__(self, path="cursors.json", save_interval=10, concurrency=3, max_messages_per_chat=300,
+                 max_flood_wait=60, max_age=6 * 3600, on_startup=True):
+        self.cursors = ChatCursors(path, save_interval)
+        self.concurrency = concurrency
+        self.max_messages_per_chat = max_messages_per_chat
+        self.max_flood_wait = max_flood_wait
+        self.max_age = max_age
+        self.on_startup = on_startup
+        self._slots = None
+        self._tasks = {}  # {session_name: asyncio.Task}
+        self.runs = 0
+        self.recovered = 0
+        self.aborted = 0
+
+    def checkpoint(self, session_name):
+        """记下账号当前的进度（断线时调用，重连后从这里补拉）"""
+        return dict(self.cursors.for_session(session_name))
+
+    def startup_checkpoint(self, session_name):
+        """进程启动时使用磁盘中的进度（过旧或关闭启动补拉时返回空）"""
+        if not self.on_startup or not self.cursors.saved_at:
+            return {}
+        if self.max_age and time.time() - self.cursors.saved_at > self.max_age:
+            return {}
+        return self.checkpoint(session_name)
+
+    def schedule(self, listener, checkpoint):
+        """在后台补拉 checkpoint 之后的消息（同一账号只保留一个补拉任务）"""
+        if not checkpoint:
+            return None
+        previous = self._tasks.get(listener.session_name)
+        if previous is not None and not previous.done():
+            previous.cancel()
+        task = asyncio.create_task(self.recover(listener, checkpoint))
+        self._tasks[listener.session_name] = task
+        return task
+
+    async def recover(self, listener, checkpoint):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(1, self.concurrency))
+        self.runs += 1
+        started_at = time.monotonic()
+        aborted = asyncio.Event()
+
+        async def recover_chat(chat_id, min_id):
+            async with self._slots:
+                if aborted.is_set() or not listener.is_running:
+                    return 0
+                return await self._recover_chat(listener, chat_id, min_id, aborted)
+
+        results = await asyncio.gather(
+            *(recover_chat(chat_id, min_id) for chat_id, min_id in checkpoint.items()),
+            return_exceptions=True
+        )
+        count = 0
+        for chat_id, result in zip(checkpoint, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"[{listener.account_name}] 补拉群 {chat_id} 失败: {result}")
+            else:
+                count += result
+        if aborted.is_set():
+            self.aborted += 1
+        if count:
+            logger.info(
+                f"[{listener.account_name}] 🧩 已补拉断线期间的 {count} 条消息"
+                f"（{len(checkpoint)} 个群，耗时 {time.monotonic() - started_at:.1f}s）"
+            )
+        return count
+
+    async def _recover_chat(self, listener, chat_id, min_id, aborted, limit=None):
+        limit = self.max_messages_per_chat if limit is None else limit
+        count = 0
+        last_id = min_id
+        try:
+            async for message in listener.client.iter_messages(chat_id, min_id=min_id, limit=limit, reverse=True):
+                event = RecoveredEvent(message)
+                if not listener.accepts_chat(event):
+                    return count
+                await listener.handle_event(MessageContext(event, listener))
+                last_id = message.id
+                count += 1
+                self.recovered += 1
+                listener.stats["recovered"] += 1
+        except FloodWaitError as e:
+            if e.seconds > self.max_flood_wait:
+                aborted.set()
+                logger.warning(
+                    f"[{listener.account_name}] ⚠️ 补拉遇到 {e.seconds}s FloodWait，放弃本轮补拉"
+                )
+                return count
+            await asyncio.sleep(e.seconds)
+            # 等待后从已补拉到的位置继续
+            if count >= limit:
+                return count
+            return count + await self._recover_chat(listener, chat_id, last_id, aborted, limit - count)
+        return count
+
+    async def close(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        await self.cursors.flush()
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "recovered": self.recovered,
+            "aborted": self.aborted,
+            "running": sum(1 for task in self._tasks.values() if not task.done())
+        }
@@ -0,0 +1,96 @@
+# modules/keyword_matcher.py - 关键词多模式匹配模块（Aho-Corasick）
+from collections import deque, namedtuple
+
+# 一次命中：text[start:end] == keyword（规则命中时 keyword 为规则标签，rule_id 为规则 ID）
+KeywordHit = namedtuple("KeywordHit", ["start", "end", "keyword", "rule_id"], defaults=(None,))
+
+# 关键词很少时，逐个 str.find（C 实现）比逐字符走自动机更快
+SMALL_SET_THRESHOLD = 32
+
+
+class KeywordMatcher:
+    """Aho-Corasick 自动机
+
+    构建一次后，对每条消息只做一次线性扫描，耗时与关键词数量无关，
+    并返回所有命中（含位置）。与原先的 `kw in text` 一样区分大小写。
+    """
+    __slots__ = ("keywords", "version", "_goto", "_fail", "_out")
+
+    def __init__(self, keywords, version=None):
+        # 去重并忽略空关键词，保持原有顺序
+        self.keywords = tuple(dict.fromkeys(kw for kw in keywords if kw))
+        self.version = version
+        self._build()
+
+    def _build(self):
+        goto = [{}]
+        out = [()]
+        for idx, kw in enumerate(self.keywords):
+            node = 0
+            for ch in kw:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                node = nxt
+            out[node] = out[node] + (idx,)
+
+        # BFS 计算失败指针，并把后缀节点的输出合并进来
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def find_all(self, text):
+        """扫描文本，返回所有命中 [KeywordHit, ...]（按结束位置排序）"""
+        hits = []
+        if not text or not self.keywords:
+            return hits
+        if len(self.keywords) <= SMALL_SET_THRESHOLD:
+            return self._find_all_small(text)
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        keywords = self.keywords
+        node = 0
+        for i, ch in enumerate(text):
+            nxt = goto[node].get(ch)
+            while nxt is None and node:
+                node = fail[node]
+                nxt = goto[node].get(ch)
+            # 子节点编号从 1 开始，None 表示回到根节点
+            node = nxt or 0
+            if out[node]:
+                end = i + 1
+                for idx in out[node]:
+                    kw = keywords[idx]
+                    hits.append(KeywordHit(end - len(kw), end, kw))
+        return hits
+
+    def _find_all_small(self, text):
+        hits = []
+        for kw in self.keywords:
+            start = text.find(kw)
+            while start != -1:
+                hits.append(KeywordHit(start, start + len(kw), kw))
+                start = text.find(kw, start + 1)
+        hits.sort(key=lambda h: (h.end, h.start))
+        return hits
@@ -4,38 +4,101 @@ from telethon.sessions import StringSession
 from telethon.events import NewMessage
 from telethon.errors import TypeNotFoundError
 import asyncio
-import json
 import logging
-from modules.data_manager import load_data
-from modules.message_handler import extract_text_from_event, build_message_link, create_event_data
+import random
+import time
+from modules.data_manager import get_config
+from modules.rule_engine import get_rule_plan
+from modules.chat_filter import get_chat_filter
+from modules.routing import get_routing_table
+from modules.dedup import MessageDedup
+from modules.event_queue import EventQueue
+from modules.gap_recovery import GapRecovery
+from modules.supervisor import (
+    STATE_CONNECTING, STATE_RUNNING, STATE_BACKOFF, STATE_FAILED, STATE_STOPPED, STATE_LABELS,
+    SessionUnauthorizedError, classify_error, backoff_delay, describe_error
+)
+from modules.alert_dispatcher import AlertDispatcher
+from modules.event_bus import EventBus, HitEvent
+from modules.sinks import TelegramSink
+from modules.entity_cache import EntityCache, EntityInfo
+from modules import metrics
+from modules.message_handler import LinkStrategyCache
+from modules.message_context import MessageContext
 
 logger = logging.getLogger(__name__)
 
+
+def uses_blocking_queue(queue_options):
+    """处理队列是否使用 "block" 溢出策略（此时客户端必须顺序分发更新）"""
+    return (queue_options or {}).get("overflow") == "block"
+
+
 class UserbotListener:
     """单个账号的监听客户端"""
-    def __init__(self, session_name, account_name, api_id, api_hash, bot_entity, bot_client=None, session_string=None):
+    def __init__(self, session_name, account_name, api_id, api_hash, bot_entity, bot_client=None, session_string=None, dedup=None, dispatcher=None, entity_cache=None, link_cache=None, client=None, history=None, me=None, queue_options=None, cursors=None, bus=None):
         self.session_name = session_name
         self.account_name = account_name
         self.api_id = api_id
         self.api_hash = api_hash
         self.bot_entity = bot_entity
         self.bot_client = bot_client  # 机器人的客户端，用于直接发送消息到目标群
-        # 如果提供了 StringSession，则优先使用字符串会话；否则使用基于文件的会话
-        if session_string:
-            self.client = TelegramClient(StringSession(session_string), api_id, api_hash)
+        self.dedup = dedup  # 跨账号共享的去重索引（同一条消息只由一个账号发送提醒）
+        self.dispatcher = dispatcher  # 共享的提醒发送队列（限速 + FloodWait 处理）
+        self.entity_cache = entity_cache  # 共享的会话/发送者信息缓存
+        self.link_cache = link_cache  # 共享的按会话链接策略缓存
+        self.history = history  # 共享的命中历史（批量写入 SQLite）
+        self.bus = bus  # 共享的事件总线（目标群、JSONL、Webhook 等输出各自订阅）
+        self.cursors = cursors  # 每个群最后处理到的消息 ID（断线补拉使用），None 表示不记录
+        # 可直接传入已创建的客户端；否则如果提供了 StringSession，则优先使用字符串会话；
+        # 再否则使用基于文件的会话
+        # "block" 队列策略需要 Telethon 顺序分发更新，等待入队才能暂停接收（见 event_queue）
+        sequential_updates = uses_blocking_queue(queue_options)
+        if client is not None:
+            self.client = client
+        elif session_string:
+            self.client = TelegramClient(
+                StringSession(session_string), api_id, api_hash, sequential_updates=sequential_updates
+            )
         else:
-            self.client = TelegramClient(session_name, api_id, api_hash)
+            self.client = TelegramClient(session_name, api_id, api_hash, sequential_updates=sequential_updates)
         self.listener_username = None
-        self.is_running = False
+        self.me = me  # 已验证客户端的账号信息（传入时 init 不再重复检查授权）
+        # 有界处理队列：处理器只负责入队，由固定数量的协程处理（max_size / workers / overflow）
+        self.queue = EventQueue(
+            self.handle_event, classify=self.match_event, name=account_name, **(queue_options or {})
+        )
+        self.active = False  # 是否应当运行（start 后为 True，stop 后为 False）
+        self.state = STATE_STOPPED  # connecting / running / backoff / failed / stopped
+        self.last_error = None
+        self.restarts = 0
+        self.next_retry_at = None  # 处于 backoff 时下次重连的时间（time.time()）
+        # 处理计数：rpc_awaits 为解析会话/发送者/链接的请求数（由 MessageContext 计数），
+        # rpc_awaits_unmatched 为其中属于未命中消息的部分（应始终为 0）
+        self.stats = {
+            "messages": 0,
+            "matched": 0,
+            "duplicates": 0,
+            "rpc_awaits": 0,
+            "rpc_awaits_unmatched": 0,
+            "filtered": 0,
+            "recovered": 0,
+            "reconnects": 0
+        }
+        self._metric_labels = (session_name,)
     
     async def init(self):
         """初始化客户端"""
+        if self.me is not None and self.client.is_connected():
+            # 批量导入时客户端已经登录并验证过，直接使用
+            self.listener_username = f"@{self.me.username}" if getattr(self.me, "username", None) else "无"
+            return
         try:
             # 先连接并检查是否已授权，避免交互式输入
             await self.client.connect()
             if not await self.client.is_user_authorized():
                 await self.client.disconnect()
-                raise Exception("Session 未授权或无效")
+                raise SessionUnauthorizedError("Session 未授权或无效")
             
             # 如果已授权，客户端已经连接并可以使用
             # 不需要调用 start()，因为 start() 在没有参数时会尝试交互式登录
@@ -61,250 +124,311 @@ class UserbotListener:
         
         # 不再自动发送 /start，直接开始监听
     
-    async def log_incoming_event(self, event):
+    async def get_chat_info(self, event):
+        """获取会话信息（优先使用共享缓存）"""
+        if self.entity_cache is not None:
+            return await self.entity_cache.get_chat(event) or EntityInfo()
+        return EntityInfo.from_entity(await event.get_chat())
+    
+    async def get_sender_info(self, event):
+        """获取发送者信息（优先使用共享缓存）"""
+        if self.entity_cache is not None:
+            # 匿名管理员/频道消息可能没有发送者
+            return await self.entity_cache.get_sender(event) or EntityInfo()
+        return EntityInfo.from_entity(await event.get_sender())
+    
+    async def log_incoming_event(self, ctx):
         """打印监听日志"""
         try:
-            chat = await event.get_chat()
-            sender = await event.get_sender()
-            
-            chat_title = getattr(chat, "title", None) or getattr(chat, "username", None) or str(event.chat_id)
+            chat_title = await ctx.chat_title()
+            sender_display_name = await ctx.sender_name()
             
-            sender_name_parts = []
-            if getattr(sender, "first_name", None):
-                sender_name_parts.append(sender.first_name)
-            if getattr(sender, "last_name", None):
-                sender_name_parts.append(sender.last_name)
-            sender_display_name = " ".join(sender_name_parts) if sender_name_parts else "未知"
-            
-            text = extract_text_from_event(event)
+            text = ctx.normalized_text
             snippet = text if len(text) <= 80 else text[:77] + "..."
             
-            # 简化日志：只在检测到关键词时记录
-            # logger.info(f"[{self.account_name}] [监听] 会话: {chat_title} | 发送者: {sender_display_name} | 文本: {snippet}")
+            # 只在命中且开启 DEBUG 日志时调用
+            logger.debug(f"[{self.account_name}] [监听] 会话: {chat_title} | 发送者: {sender_display_name} | 文本: {snippet}")
         except Exception as e:
             logger.error(f"[{self.account_name}] [监听] 日志生成失败: {e}")
     
-    async def send_keyword_alert(self, event, keyword_hit):
-        """直接使用机器人客户端发送关键词提醒到目标群"""
-        if not self.bot_client:
+    async def send_keyword_alert(self, ctx, keyword_hit, keywords=None, rule_ids=()):
+        """构造命中事件并发布到事件总线（未配置总线时交给发送队列或直接使用机器人客户端发送）
+
+        keyword_hit 为显示用的文本，keywords / rule_ids 为逐个命中的关键词与规则 ID（路由使用）
+        """
+        if keywords is None:
+            keywords = (keyword_hit,)
+        if not self.bus and not self.dispatcher and not self.bot_client:
             logger.error(f"[{self.account_name}] ⚠️ 未配置机器人客户端，无法发送提醒！请检查 bot_client 是否正确设置。")
             return
         
         try:
-            # 获取消息信息
-            sender = await event.get_sender()
-            sender_name_parts = []
-            if getattr(sender, "first_name", None):
-                sender_name_parts.append(sender.first_name)
-            if getattr(sender, "last_name", None):
-                sender_name_parts.append(sender.last_name)
-            sender_display_name = " ".join(sender_name_parts) if sender_name_parts else "未知"
-            sender_username = f"@{sender.username}" if getattr(sender, "username", None) else "无"
-            
-            chat = await event.get_chat()
-            chat_title = getattr(chat, "title", None) or getattr(chat, "username", None) or "未知"
-            chat_username = getattr(chat, "username", None)  # 保存 chat username 用于构造链接
-            chat_id = getattr(chat, "id", None)
-            
-            msg_text = extract_text_from_event(event) or "（无文本内容，可能仅为媒体消息）"
-            msg_link = await build_message_link(self.client, event, chat_username, event.message.id)
+            # 获取消息信息（上下文中已解析过的不再重复获取；共享缓存，多个账号不重复解析）
+            chat = await ctx.chat()
+            msg_link = await ctx.link()
             
             # 调试：记录链接构建结果
             if msg_link:
                 logger.debug(f"[{self.account_name}] 消息链接: {msg_link}")
             else:
-                logger.debug(f"[{self.account_name}] 无法构建消息链接 (chat_username={chat_username}, msg_id={event.message.id})")
+                logger.debug(f"[{self.account_name}] 无法构建消息链接 (chat_username={chat.username}, msg_id={ctx.message_id})")
             
             # 构造事件数据
+            chat_id = chat.id
             event_data = {
                 "listener_account": self.listener_username or "未知",
                 "keyword": keyword_hit,
-                "sender_name": sender_display_name,
-                "sender_username": sender_username,
-                "chat_title": chat_title,
+                "keywords": tuple(keywords),
+                "rule_ids": tuple(rule_ids),
+                "sender_name": await ctx.sender_name(),
+                "sender_username": await ctx.sender_username(),
+                "chat_title": await ctx.chat_title(),
                 "chat_id": chat_id,
-                "message_id": event.message.id,
-                "message_text": msg_text,
+                "message_id": ctx.message_id,
+                "message_text": ctx.alert_text,
                 "message_link": msg_link
             }
             
+            # 记录命中历史（只写内存缓冲区）
+            if self.history is not None:
+                self.history.record(event_data)
+            
+            # 发布到事件总线，由各个输出分别处理
+            if self.bus is not None:
+                self.bus.publish(HitEvent.from_dict(event_data))
+                return
+            
             # 使用 message_handler 模块格式化消息
             from modules.message_handler import create_keyword_alert_message
             alert_msg, buttons = create_keyword_alert_message(event_data)
             
-            # 加载目标群配置
-            from modules.data_manager import load_data
-            data = load_data()
-            target_id = data.get("target_channel_id")
+            # 按路由表从内存快照确定目标群（可能有多个）
+            targets = get_routing_table(get_config()).targets_for(keywords, chat_id, rule_ids)
             
-            if not target_id:
+            if not targets:
                 logger.warning(f"[{self.account_name}] ⚠️ 未设置目标群，无法发送提醒")
                 return
             
-            # 确保target_id是正确的格式
-            if isinstance(target_id, int) and target_id > 0:
-                target_id = int(f"-100{target_id}")
+            # 交给发送队列，不阻塞 Telethon 的更新处理
+            if self.dispatcher:
+                for target_id in targets:
+                    if self.dispatcher.submit(target_id, alert_msg, buttons, event_data):
+                        logger.debug(f"[{self.account_name}] 提醒已加入发送队列: {keyword_hit} -> {target_id}")
+                return
             
-            # 直接使用机器人客户端发送消息到目标群（使用 Markdown 格式）
-            await self.bot_client.send_message(
-                target_id, 
-                alert_msg, 
-                buttons=buttons,
-                parse_mode='md'  # 使用 Markdown 格式
+            # 直接使用机器人客户端并发发送到各目标群（使用 Markdown 格式）
+            results = await asyncio.gather(
+                *(self.bot_client.send_message(target_id, alert_msg, buttons=buttons, parse_mode='md')
+                  for target_id in targets),
+                return_exceptions=True
             )
-            logger.info(f"[{self.account_name}] ✅ 已发送关键词提醒: {keyword_hit} -> {target_id}")
+            for target_id, result in zip(targets, results):
+                if isinstance(result, BaseException):
+                    logger.error(f"[{self.account_name}] ❌ 发送关键词提醒失败 -> {target_id}: {result}")
+                else:
+                    logger.info(f"[{self.account_name}] ✅ 已发送关键词提醒: {keyword_hit} -> {target_id}")
         
         except Exception as e:
             logger.error(f"[{self.account_name}] ❌ 发送关键词提醒失败: {e}", exc_info=True)
     
+    def match_event(self, ctx):
+        """快速路径：只用原始文本、chat_id、sender_id 做关键词与规则匹配，不发起任何网络请求
+
+        返回命中列表（规则命中的 keyword 为规则标签）；不需要处理的消息返回空列表。
+        """
+        # 不监听私聊
+        if ctx.is_private:
+            return []
+        
+        # 读取最新配置（内存快照，不访问磁盘），按版本取已编译的关键词与规则
+        plan = get_rule_plan(get_config())
+        # 当前群既没有全局关键词也没有适用的规则时，不必扫描文本
+        chat_id = ctx.chat_id
+        if not plan.applies_to(chat_id):
+            return []
+        
+        text = ctx.text
+        if not text:
+            return []
+        
+        # 不要对自己发送的提醒再次触发
+        if text.startswith("🔔 关键词提醒"):
+            return []
+        
+        # 关键词与规则匹配（单次扫描，返回所有命中）
+        return plan.match(chat_id, ctx.sender_id, text)
+    
+    async def process_event(self, ctx, hits=None):
+        """处理一条新消息：先匹配，只有命中的消息才会去解析会话/发送者等信息
+
+        hits 为队列溢出时已算好的匹配结果（None 表示尚未匹配）
+        """
+        stats = self.stats
+        stats["messages"] += 1
+        
+        # 记录每个群处理到的位置（断线重连后从这里补拉）
+        cursors = self.cursors
+        if cursors is not None and not ctx.is_private:
+            message_id = ctx.message_id
+            if message_id > cursors.get(ctx.chat_id, 0):
+                cursors[ctx.chat_id] = message_id
+        
+        if hits is None:
+            hits = self.match_event(ctx)
+        if not hits:
+            # 未命中的消息不应解析任何信息；
+            # 若这里不为 0，说明快速路径（或入队前的某个阶段）引入了网络请求
+            stats["rpc_awaits_unmatched"] += ctx.rpc_awaits
+            return
+        stats["matched"] += 1
+        
+        # 多个账号在同一群时，只由第一个认领的账号处理（在任何 RPC 之前判断）
+        if self.dedup is not None and not self.dedup.claim(ctx.chat_id, ctx.message_id, self.session_name):
+            stats["duplicates"] += 1
+            logger.debug(f"[{self.account_name}] 消息已由其他账号处理，跳过: {ctx.chat_id}/{ctx.message_id}")
+            return
+        
+        # 以下为命中后的按需解析（结果保存在上下文中，后续阶段直接使用）
+        if logger.isEnabledFor(logging.DEBUG):
+            await self.log_incoming_event(ctx)
+        
+        # 显示用的文本合并所有命中；路由按逐个关键词/规则查找
+        hit = ", ".join(dict.fromkeys(h.keyword for h in hits))
+        keywords = tuple(dict.fromkeys(h.keyword for h in hits if h.rule_id is None))
+        rule_ids = tuple(dict.fromkeys(h.rule_id for h in hits if h.rule_id is not None))
+        # 获取聊天信息用于日志
+        try:
+            chat_title = await ctx.chat_title()
+        except Exception:
+            chat_title = "未知"
+        logger.info(f"[{self.account_name}] 🔍 检测到关键词: {hit} (来源: {chat_title})")
+        await self.send_keyword_alert(ctx, hit, keywords, rule_ids)
+    
+    def accepts_chat(self, event):
+        """事件过滤函数：被群组黑名单排除或不在白名单中的消息不进入处理器
+
+        名单只作用于群组/频道；私聊不计入 filtered，交给 match_event 忽略
+        """
+        if event.is_private or get_chat_filter(get_config(), self.session_name).allows(event.chat_id):
+            return True
+        self.stats["filtered"] += 1
+        return False
+    
     async def setup_handlers(self):
-        """设置消息处理器"""
-        @self.client.on(NewMessage())
+        """设置消息处理器（只入队，由处理队列的协程调用 handle_event）"""
+        @self.client.on(NewMessage(func=self.accepts_chat))
         async def handler(event):
-            try:
-                # 不监听私聊
-                if event.is_private:
-                    return
-                
-                # 打印监听日志
-                await self.log_incoming_event(event)
-                
-                # 加载最新配置
-                data = load_data()
-                keywords = data.get("keywords", [])
-                
-                if not keywords:
-                    return
-                
-                text = extract_text_from_event(event)
-                if not text:
-                    return
-                
-                # 不要对自己发送的提醒再次触发
-                if text.startswith("🔔 关键词提醒"):
-                    return
-                
-                # 关键词匹配
-                hit = None
-                for kw in keywords:
-                    if kw and kw in text:
-                        hit = kw
-                        break
-                
-                if hit:
-                    # 获取聊天信息用于日志
-                    try:
-                        chat = await event.get_chat()
-                        chat_title = getattr(chat, "title", None) or getattr(chat, "username", None) or str(event.chat_id)
-                    except:
-                        chat_title = "未知"
-                    logger.info(f"[{self.account_name}] 🔍 检测到关键词: {hit} (来源: {chat_title})")
-                    await self.send_keyword_alert(event, hit)
-            except TypeNotFoundError:
-                # 忽略 TypeNotFoundError（Telegram API 新增类型但 Telethon 版本过旧）
-                # 这是已知问题，不影响功能
-                pass
-            except Exception as e:
-                # 其他错误记录但不中断监听
-                logger.warning(f"[{self.account_name}] 消息处理错误: {e}")
-                # 记录错误类型，帮助诊断
-                logger.debug(f"[{self.account_name}] 错误类型: {type(e).__name__}", exc_info=True)
+            await self.queue.put(MessageContext(event, self))
+    
+    def queue_stats(self):
+        return self.queue.stats()
+    
+    async def handle_event(self, ctx, hits=None):
+        """处理队列中的一条消息（ctx 为 MessageContext）"""
+        started = time.perf_counter()
+        try:
+            await self.process_event(ctx, hits)
+        except TypeNotFoundError:
+            # 忽略 TypeNotFoundError（Telegram API 新增类型但 Telethon 版本过旧）
+            # 这是已知问题，不影响功能
+            pass
+        except Exception as e:
+            # 其他错误记录但不中断监听
+            logger.warning(f"[{self.account_name}] 消息处理错误: {e}")
+            # 记录错误类型，帮助诊断
+            logger.debug(f"[{self.account_name}] 错误类型: {type(e).__name__}", exc_info=True)
+        finally:
+            metrics.HANDLER_DURATION.observe(time.perf_counter() - started, self._metric_labels)
+    
+    @property
+    def is_running(self):
+        """是否已连接并在监听（断线重连、退避等待、失败时为 False）"""
+        return self.active and self.state == STATE_RUNNING
     
     async def start(self):
         """启动监听"""
-        if self.is_running:
+        if self.active:
             return
-        self.is_running = True
+        self.active = True
+        self.state = STATE_RUNNING if self.client.is_connected() else STATE_CONNECTING
         await self.setup_handlers()
         logger.info(f"[{self.account_name}] 监听已启动")
     
     async def stop(self):
         """停止监听"""
-        if not self.is_running:
+        if not self.active:
             return
-        self.is_running = False
+        self.active = False
+        self.state = STATE_STOPPED
         await self.client.disconnect()
+        await self.queue.close()
         logger.info(f"[{self.account_name}] 监听已停止")
     
     async def run(self):
-        """运行客户端（阻塞）"""
-        logger.info(f"[{self.account_name}] 监听任务开始运行")
-        retry_count = 0
-        max_retries = 10
-        
-        while self.is_running:
-            try:
-                # 确保连接
-                if not self.client.is_connected():
-                    logger.info(f"[{self.account_name}] 正在连接...")
-                    await self.client.connect()
-                
-                # 运行直到断开
-                await self.client.run_until_disconnected()
-                # 如果正常断开连接，退出循环
-                logger.warning(f"[{self.account_name}] 连接已断开")
-                break
-                
-            except TypeNotFoundError as e:
-                # TypeNotFoundError 通常发生在消息处理时，不应该导致监听停止
-                # 但如果在网络层发生，我们需要处理
-                logger.debug(f"[{self.account_name}] 遇到 TypeNotFoundError: {e}")
-                retry_count = 0  # 重置重试计数
-                await asyncio.sleep(1)
-                continue
-                
-            except Exception as e:
-                retry_count += 1
-                error_msg = str(e).lower()
-                
-                # 如果是连接相关错误，尝试重连
-                if any(keyword in error_msg for keyword in ["disconnect", "connection", "network", "timeout"]):
-                    if retry_count <= max_retries:
-                        logger.warning(f"[{self.account_name}] 连接错误，尝试重连 ({retry_count}/{max_retries}): {e}")
-                        await asyncio.sleep(min(retry_count * 2, 10))  # 指数退避，最多10秒
-                        try:
-                            if not self.client.is_connected():
-                                await self.client.connect()
-                            retry_count = 0  # 重连成功，重置计数
-                        except Exception as reconnect_error:
-                            logger.error(f"[{self.account_name}] 重连失败: {reconnect_error}")
-                    else:
-                        logger.error(f"[{self.account_name}] 重连次数过多，停止监听")
-                        break
-                else:
-                    # 其他错误，记录但不停止监听
-                    logger.error(f"[{self.account_name}] 监听运行错误: {e}", exc_info=True)
-                    await asyncio.sleep(5)
-                    retry_count = 0  # 非连接错误，重置计数
-        
-        logger.warning(f"[{self.account_name}] 监听任务已退出")
+        """保持一次连接直到断开；断开或出错后由 ListenerManager 的监督任务决定何时重连"""
+        if not self.client.is_connected():
+            self.state = STATE_CONNECTING
+            await self.init()
+        self.state = STATE_RUNNING
+        self.next_retry_at = None
+        await self.client.run_until_disconnected()
 
 class ListenerManager:
     """监听管理器 - 管理所有账号的监听"""
-    def __init__(self, api_id, api_hash, bot_entity, bot_client=None):
+    def __init__(self, api_id, api_hash, bot_entity, bot_client=None, dispatcher_options=None, entity_cache_options=None):
         self.api_id = api_id
         self.api_hash = api_hash
         self.bot_entity = bot_entity
         self.bot_client = bot_client  # 机器人的客户端，用于直接发送消息
         self.listeners = {}  # {session_name: UserbotListener}
         self.tasks = {}  # {session_name: asyncio.Task}
+        self._starting = set()  # 正在启动中的 session_name（并发启动时防止重复）
+        self.startup_concurrency = 8  # 同时登录的账号数上限
+        self.startup_jitter = 1.0  # 每个账号登录前的随机延迟上限（秒）
+        # 断线重连：带抖动的指数退避（秒）；连续运行超过 reconnect_reset_after 秒后重新计数
+        self.reconnect_backoff = 1.0
+        self.reconnect_max_backoff = 300.0
+        self.reconnect_reset_after = 60.0
+        self._reconnect_slots = None  # 同时重连的账号数上限与 startup_concurrency 相同
+        self.shard = None  # 多进程分片时为 (分片序号, 分片总数)，只管理属于本分片的账号
+        self.dedup = MessageDedup()  # 所有监听器共享的命中去重索引
+        # 所有监听器共享的会话/发送者缓存
+        self.entity_cache = EntityCache(**(entity_cache_options or {}))
+        self.warm_entity_cache = True  # 启动监听后从对话列表预热缓存
+        self.link_cache = LinkStrategyCache()  # 按会话缓存消息链接生成策略
+        self.history = None  # 可选的命中历史（AlertHistory）
+        self.queue_options = {}  # 每个监听器的处理队列参数（max_size / workers / overflow）
+        self.gap_recovery = None  # 可选的断线补拉（GapRecovery）
+        # 所有监听器共享的提醒发送队列
+        self.dispatcher = AlertDispatcher(bot_client, **(dispatcher_options or {}))
+        # 命中事件总线：默认只有目标群输出，其它输出由 main 按配置订阅
+        self.bus = EventBus([TelegramSink(self.dispatcher)])
     
-    async def start_listener(self, session_name, account_name):
-        """启动一个监听客户端"""
-        if session_name in self.listeners:
+    async def start_listener(self, session_name, account_name, client=None, me=None):
+        """启动一个监听客户端（可传入已登录验证的 client 与 me，避免重复登录）"""
+        if session_name in self.listeners or session_name in self._starting:
             logger.warning(f"监听 {session_name} 已存在")
+            if client is not None:
+                await client.disconnect()
             return False
+        self._starting.add(session_name)
+
+        if client is not None and uses_blocking_queue(self.queue_options):
+            # 验证时创建的客户端没有开启顺序分发，"block" 策略下由监听器重新创建
+            await client.disconnect()
+            client = None
 
         try:
             # 从配置中读取 session_string（如果有）
-            data = load_data()
-            accounts = data.get("userbot_accounts", [])
+            accounts = get_config().accounts
             session_string = None
             for acc in accounts:
                 if acc.get("session_name") == session_name:
                     session_string = acc.get("session_string")
                     break
 
+            # 进程重启前保存的进度：启动成功后补拉这段时间的消息
+            checkpoint = self.gap_recovery.startup_checkpoint(session_name) if self.gap_recovery else None
             listener = UserbotListener(
                 session_name,
                 account_name,
@@ -312,27 +436,117 @@ class ListenerManager:
                 self.api_hash,
                 self.bot_entity,
                 bot_client=self.bot_client,  # 传递机器人客户端
-                session_string=session_string
+                session_string=session_string,
+                dedup=self.dedup,
+                dispatcher=self.dispatcher,
+                entity_cache=self.entity_cache,
+                link_cache=self.link_cache,
+                history=self.history,
+                client=client,
+                me=me,
+                queue_options=self.queue_options,
+                bus=self.bus,
+                cursors=self.gap_recovery.cursors.for_session(session_name) if self.gap_recovery else None
             )
             
             # 记录 bot_client 状态
             if self.bot_client:
                 logger.debug(f"[{account_name}] bot_client 已设置: {type(self.bot_client).__name__}")
             else:
-                logger.warning(f"[{account_name}] ⚠️ bot_client 为 None，转发功能可能无法使用！")
+                # 机器人与监听账号同时启动，提醒会在发送队列中等待机器人就绪
+                logger.debug(f"[{account_name}] bot_client 尚未设置，提醒将在发送队列中等待")
             await listener.init()
             await listener.start()
             
-            # 在后台运行
-            task = asyncio.create_task(listener.run())
+            # 在后台运行（由监督任务负责断线重连）
+            task = asyncio.create_task(self.supervise(listener))
             self.listeners[session_name] = listener
             self.tasks[session_name] = task
             
+            if self.gap_recovery:
+                self.gap_recovery.schedule(listener, checkpoint)
+            
+            # 后台预热会话缓存，不阻塞启动
+            if self.warm_entity_cache:
+                asyncio.create_task(self.entity_cache.warm_from_dialogs(listener.client))
+            
             logger.info(f"✅ 已启动监听: {account_name} ({session_name})")
             return True
         except Exception as e:
             logger.error(f"❌ 启动监听失败 {session_name}: {e}")
             return False
+        finally:
+            self._starting.discard(session_name)
+    
+    async def supervise(self, listener):
+        """监督一个监听器：连接断开或出错后按错误类型重连，直到被停止或遇到无法恢复的错误"""
+        name = listener.account_name
+        failures = 0
+        checkpoint = None  # 断线时的进度，重连成功后补拉
+        while listener.active:
+            connected_at = time.monotonic()
+            error = None
+            try:
+                if listener.client.is_connected():
+                    await listener.run()
+                else:
+                    # 限制同时重连的账号数，网络恢复时不会所有账号同时登录
+                    if self._reconnect_slots is None:
+                        self._reconnect_slots = asyncio.Semaphore(max(1, self.startup_concurrency))
+                    async with self._reconnect_slots:
+                        listener.state = STATE_CONNECTING
+                        await listener.init()
+                    connected_at = time.monotonic()
+                    if self.gap_recovery and checkpoint:
+                        self.gap_recovery.schedule(listener, checkpoint)
+                    checkpoint = None
+                    await listener.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+            if not listener.active:
+                break
+            
+            if self.gap_recovery and checkpoint is None:
+                checkpoint = self.gap_recovery.checkpoint(listener.session_name)
+            kind = classify_error(error) if error is not None else "network"
+            listener.last_error = describe_error(error) if error is not None else "连接已断开"
+            if kind == "fatal":
+                listener.state = STATE_FAILED
+                listener.next_retry_at = None
+                logger.error(f"[{name}] ❌ 监听已停止，无法自动恢复: {listener.last_error}")
+                try:
+                    await listener.client.disconnect()
+                except Exception:
+                    pass
+                return
+            
+            if kind == "unknown":
+                logger.error(f"[{name}] 监听运行错误: {listener.last_error}", exc_info=error)
+            if time.monotonic() - connected_at >= self.reconnect_reset_after:
+                failures = 0
+            if kind == "transient":
+                delay = 1
+            elif kind == "flood":
+                delay = error.seconds + random.uniform(0, self.startup_jitter or 1)
+            else:
+                failures += 1
+                delay = backoff_delay(failures, self.reconnect_backoff, self.reconnect_max_backoff)
+            listener.restarts += 1
+            listener.stats["reconnects"] += 1
+            listener.state = STATE_BACKOFF
+            listener.next_retry_at = time.time() + delay
+            logger.warning(f"[{name}] 🔌 {listener.last_error}，{delay:.1f}s 后重连（连续失败 {failures} 次）")
+            await asyncio.sleep(delay)
+        logger.info(f"[{name}] 监听任务已退出")
+    
+    def enable_gap_recovery(self, **options):
+        """启用断线补拉（读取上次保存的进度并定期落盘）"""
+        self.gap_recovery = GapRecovery(**options)
+        self.gap_recovery.cursors.load()
+        self.gap_recovery.cursors.start_autosave()
+        return self.gap_recovery
     
     async def stop_listener(self, session_name):
         """停止一个监听客户端"""
@@ -359,10 +573,17 @@ class ListenerManager:
             logger.error(f"❌ 停止监听失败 {session_name}: {e}")
             return False
     
+    def owns(self, session_name):
+        """账号是否由本管理器负责（未分片时负责所有账号）"""
+        if self.shard is None:
+            return True
+        from modules.sharding import shard_for
+        index, count = self.shard
+        return shard_for(session_name, count) == index
+    
     async def reload_all(self):
         """重新加载所有监听（根据 data.json）"""
-        data = load_data()
-        accounts = data.get("userbot_accounts", [])
+        accounts = [acc for acc in get_config().accounts if self.owns(acc.get("session_name"))]
         
         # 停止不存在的监听
         current_sessions = {acc.get("session_name") for acc in accounts}
@@ -370,27 +591,140 @@ class ListenerManager:
             if session_name not in current_sessions:
                 await self.stop_listener(session_name)
         
-        # 启动新的监听
-        for acc in accounts:
-            session_name = acc.get("session_name")
-            account_name = acc.get("name", session_name)
-            if session_name not in self.listeners:
-                await self.start_listener(session_name, account_name)
+        # 并发启动新的监听：限制同时登录的数量，并加随机抖动，避免同时冲击 Telegram
+        pending = [
+            (acc.get("session_name"), acc.get("name", acc.get("session_name")))
+            for acc in accounts
+            if acc.get("session_name") not in self.listeners
+        ]
+        if not pending:
+            return 0, 0
+        
+        semaphore = asyncio.Semaphore(max(1, self.startup_concurrency))
+        
+        async def start_one(session_name, account_name):
+            async with semaphore:
+                if self.startup_jitter:
+                    await asyncio.sleep(random.uniform(0, self.startup_jitter))
+                return await self.start_listener(session_name, account_name)
+        
+        started_at = time.monotonic()
+        results = await asyncio.gather(*(start_one(*item) for item in pending))
+        started = sum(1 for ok in results if ok)
+        logger.info(
+            f"⏱ 监听账号启动完成: 成功 {started}/{len(pending)}，"
+            f"耗时 {time.monotonic() - started_at:.1f}s (并发 {self.startup_concurrency})"
+        )
+        return started, len(pending)
     
-    def get_listener_status(self):
-        """获取所有监听状态"""
+    def get_entity_cache_stats(self):
+        """获取会话/发送者缓存命中统计"""
+        return self.entity_cache.stats()
+    
+    def get_dispatcher_stats(self):
+        """获取发送队列状态（队列深度、丢弃数等）"""
+        return self.dispatcher.stats()
+    
+    def collect_metrics(self):
+        """供指标服务抓取时调用：根据监听器与队列的现有计数生成指标"""
+        labels = ("session", "account")
+        running = metrics.Gauge("tg_listener_running", "监听器是否在运行", labels)
+        state = metrics.Gauge("tg_listener_state", "监听器当前状态（当前状态为 1）", labels + ("state",))
+        messages = metrics.Counter("tg_listener_messages_total", "收到的群消息数", labels)
+        matched = metrics.Counter("tg_listener_matches_total", "命中关键词的消息数", labels)
+        duplicates = metrics.Counter("tg_listener_duplicates_total", "被其他账号认领而跳过的命中数", labels)
+        filtered = metrics.Counter("tg_listener_filtered_total", "被群组白名单/黑名单过滤的消息数", labels)
+        reconnects = metrics.Counter("tg_listener_reconnects_total", "重连次数", labels)
+        queue_depth_by_listener = metrics.Gauge("tg_listener_queue_depth", "监听器处理队列中等待的消息数", labels)
+        queue_dropped = metrics.Counter(
+            "tg_listener_queue_dropped_total", "处理队列溢出丢弃的消息数", labels + ("reason",)
+        )
+        for session_name, listener in self.listeners.items():
+            key = (session_name, listener.account_name)
+            running.set(1 if listener.is_running else 0, key)
+            for name in STATE_LABELS:
+                state.set(1 if listener.state == name else 0, key + (name,))
+            # 分片模式下的远程监听器在首次上报前没有计数
+            stats = listener.stats
+            messages.set(stats.get("messages", 0), key)
+            matched.set(stats.get("matched", 0), key)
+            duplicates.set(stats.get("duplicates", 0), key)
+            filtered.set(stats.get("filtered", 0), key)
+            reconnects.set(stats.get("reconnects", 0), key)
+            queue = listener.queue_stats()
+            queue_depth_by_listener.set(queue.get("depth", 0), key)
+            queue_dropped.set(queue.get("dropped_oldest", 0), key + ("oldest",))
+            queue_dropped.set(queue.get("dropped_unmatched", 0), key + ("unmatched",))
+        
+        dispatcher = self.dispatcher.stats()
+        queue_depth = metrics.Gauge("tg_alert_queue_depth", "发送队列中等待的提醒数")
+        queue_depth.set(dispatcher["queue_depth"])
+        alerts = metrics.Counter("tg_alerts_total", "提醒处理结果", ("result",))
+        for result in ("sent", "failed", "dropped"):
+            alerts.set(dispatcher[result], (result,))
+        flood_waits = metrics.Counter("tg_alert_flood_waits_total", "发送提醒时遇到的 FloodWait 次数")
+        flood_waits.set(dispatcher["flood_waits"])
+        
+        cache = self.entity_cache.stats()
+        cache_lookups = metrics.Counter("tg_entity_cache_lookups_total", "会话/发送者缓存查询", ("result",))
+        cache_lookups.set(cache["hits"], ("hit",))
+        cache_lookups.set(cache["misses"], ("miss",))
+        
+        sink_depth = metrics.Gauge("tg_sink_queue_depth", "各输出队列中等待的事件数", ("sink",))
+        sink_events = metrics.Counter("tg_sink_events_total", "各输出处理的事件数", ("sink", "result"))
+        for sink in self.bus.sinks:
+            sink_stats = sink.stats() if hasattr(sink, "stats") else {}
+            name = getattr(sink, "name", type(sink).__name__)
+            sink_depth.set(sink_stats.get("queue_depth", 0), (name,))
+            for result in ("delivered", "failed", "dropped", "submitted", "skipped"):
+                if result in sink_stats:
+                    sink_events.set(sink_stats[result], (name, result))
+        return [
+            running, state, messages, matched, duplicates, filtered, reconnects, queue_depth_by_listener,
+            queue_dropped, queue_depth, alerts, flood_waits, cache_lookups, sink_depth, sink_events
+        ]
+    
+    def get_listener_info(self, session_name):
+        """获取单个监听的状态（未启动时返回空字典）"""
+        listener = self.listeners.get(session_name)
+        if listener is None:
+            return {}
         return {
-            session_name: {
-                "account_name": listener.account_name,
-                "is_running": listener.is_running
-            }
-            for session_name, listener in self.listeners.items()
+            "account_name": listener.account_name,
+            "listener_username": listener.listener_username,
+            "is_running": listener.is_running,
+            "state": listener.state,
+            "last_error": listener.last_error,
+            "restarts": listener.restarts,
+            "next_retry_at": listener.next_retry_at,
+            "stats": dict(listener.stats),
+            "queue": listener.queue_stats()
         }
     
+    def get_listener_status(self):
+        """获取所有监听状态"""
+        return {session_name: self.get_listener_info(session_name) for session_name in self.listeners}
+    
+    def running_count(self):
+        """运行中的监听数"""
+        return sum(1 for listener in self.listeners.values() if listener.is_running)
+    
     def update_bot_client(self, bot_client):
         """更新所有监听器的 bot_client"""
         self.bot_client = bot_client
+        self.dispatcher.client = bot_client
         for listener in self.listeners.values():
             listener.bot_client = bot_client
         logger.info(f"✅ 已更新所有监听器的 bot_client")
-
+    
+    async def shutdown(self):
+        """停止所有监听并关闭发送队列（退出前调用）"""
+        if self.gap_recovery is not None:
+            # 先停止补拉任务并保存进度
+            await self.gap_recovery.close()
+        for session_name in list(self.listeners.keys()):
+            await self.stop_listener(session_name)
+        await self.bus.close()
+        await self.dispatcher.close()
+        if self.history is not None:
+            await self.history.close()
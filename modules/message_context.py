@@ -0,0 +1,108 @@
+# modules/message_context.py - 单条消息的处理上下文模块
+"""每条消息一个 MessageContext，在匹配、日志、提醒构造等各个阶段之间传递
+
+- 文本、会话/发送者信息、消息链接都在第一次使用时才解析，结果保存在对象上，
+  同一条消息的任何值只计算/请求一次
+- 未命中的消息只会用到 text，不会产生任何网络请求
+- rpc_awaits 记录本条消息发起的解析请求数（会话、发送者、消息链接）
+- 使用 __slots__，每条消息只多一个小对象
+"""
+from modules.message_handler import extract_text_from_event, build_message_link
+
+_UNSET = object()
+
+EMPTY_TEXT_PLACEHOLDER = "（无文本内容，可能仅为媒体消息）"
+
+
+class MessageContext:
+    """一条消息的惰性解析结果（listener 提供客户端、共享缓存与计数）"""
+    __slots__ = ("event", "listener", "rpc_awaits", "_text", "_normalized_text", "_chat", "_sender", "_link")
+
+    def __init__(self, event, listener):
+        self.event = event
+        self.listener = listener
+        self.rpc_awaits = 0
+        self._text = None
+        self._normalized_text = None
+        self._chat = None
+        self._sender = None
+        self._link = _UNSET
+
+    # 事件本身带有的字段，直接读取
+    @property
+    def chat_id(self):
+        return self.event.chat_id
+
+    @property
+    def sender_id(self):
+        return self.event.sender_id
+
+    @property
+    def message_id(self):
+        return self.event.message.id
+
+    @property
+    def is_private(self):
+        return self.event.is_private
+
+    @property
+    def text(self):
+        """去掉首尾空白的原始文本（关键词匹配使用）"""
+        if self._text is None:
+            self._text = extract_text_from_event(self.event)
+        return self._text
+
+    @property
+    def normalized_text(self):
+        """空白合并为单个空格的文本（日志摘要使用）"""
+        if self._normalized_text is None:
+            self._normalized_text = " ".join(self.text.split())
+        return self._normalized_text
+
+    @property
+    def alert_text(self):
+        """提醒中显示的文本（纯媒体消息显示占位文字）"""
+        return self.text or EMPTY_TEXT_PLACEHOLDER
+
+    async def chat(self):
+        """会话信息（共享缓存，每条消息只查询一次）"""
+        if self._chat is None:
+            self._count_rpc()
+            self._chat = await self.listener.get_chat_info(self.event)
+        return self._chat
+
+    async def sender(self):
+        """发送者信息（匿名管理员/频道消息没有发送者时为空的 EntityInfo）"""
+        if self._sender is None:
+            self._count_rpc()
+            self._sender = await self.listener.get_sender_info(self.event)
+        return self._sender
+
+    async def chat_title(self):
+        chat = await self.chat()
+        return chat.title or chat.username or str(self.chat_id)
+
+    async def sender_name(self):
+        return (await self.sender()).display_name or "未知"
+
+    async def sender_username(self):
+        username = (await self.sender()).username
+        return f"@{username}" if username else "无"
+
+    async def link(self):
+        """消息链接（按会话缓存的策略，可能需要一次 RPC）"""
+        if self._link is _UNSET:
+            listener = self.listener
+            chat = await self.chat()
+            link_cache = listener.link_cache
+            rpc_before = link_cache.rpc_calls if link_cache is not None else None
+            self._link = await build_message_link(
+                listener.client, self.event, chat.username, self.message_id, strategy_cache=link_cache
+            )
+            if rpc_before is None or link_cache.rpc_calls != rpc_before:
+                self._count_rpc()
+        return self._link
+
+    def _count_rpc(self):
+        self.rpc_awaits += 1
+        self.listener.stats["rpc_awaits"] += 1
@@ -11,32 +11,63 @@ def extract_text_from_event(event):
     return (event.raw_text or "").strip()
 
 
-async def build_message_link(client, event, chat_username, message_id):
-    """
-    生成消息链接：
-    1. 优先尝试官方 API (export_message_link)
-    2. 失败则尝试手动拼接公开用户名链接
-    3. 再失败则强制拼接私有频道链接 (t.me/c/xxx/xxx)
+# 消息链接生成策略
+LINK_EXPORT = "export"      # 调用 export_message_link（RPC）
+LINK_USERNAME = "username"  # 公开用户名：https://t.me/username/id
+LINK_INTERNAL = "internal"  # 内部 ID：https://t.me/c/xxx/id
+
+
+class LinkStrategyCache:
+    """按会话缓存可用的链接生成策略
+
+    第一次为某个会话生成链接时走完整流程并记住结果对应的策略；
+    之后只要策略可在本地完成（用户名 / 内部 ID），就不再发起 RPC。
+    会话用户名发生变化时，该会话的缓存失效并重新学习。
     """
-    chat_id = event.chat_id
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = {}  # {chat_id: (strategy, username, internal_id)}
+        self.local_builds = 0
+        self.rpc_calls = 0
+        self.invalidations = 0
 
-    # 尝试 1: 官方 API (最准确，但私有群+开启防复制时会失效)
-    try:
-        # 显式传入 input_chat 和 message_id
-        link = await client.export_message_link(event.input_chat, message_id)
-        if link:
-            if link.startswith('http:'):
-                link = link.replace('http:', 'https:', 1)
-            return link
-    except Exception:
-        # 失败则继续后续逻辑
-        pass
+    def __len__(self):
+        return len(self._entries)
 
-    # 尝试 2: 如果有公开用户名 (Public Channel/Group)
-    if chat_username:
-        return f"https://t.me/{chat_username}/{message_id}"
+    def get(self, chat_id, chat_username):
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return None
+        if entry[1] != chat_username:
+            # 用户名变了（公开/私有切换或改名），重新学习
+            del self._entries[chat_id]
+            self.invalidations += 1
+            return None
+        return entry
+
+    def learn(self, chat_id, chat_username, strategy, internal_id=None):
+        if chat_id not in self._entries and len(self._entries) >= self.max_size:
+            # 简单淘汰最早学习的条目（dict 保持插入顺序）
+            del self._entries[next(iter(self._entries))]
+        self._entries[chat_id] = (strategy, chat_username, internal_id)
+
+    def invalidate(self, chat_id):
+        if self._entries.pop(chat_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "local_builds": self.local_builds,
+            "rpc_calls": self.rpc_calls,
+            "invalidations": self.invalidations
+        }
+
+
+def get_internal_chat_id(event):
+    """计算 t.me/c/ 链接使用的内部 ID（不发起请求）"""
+    chat_id = event.chat_id
 
-    # 尝试 3: 强制手动拼接私有链接 (Private Channel/Group)
     # 私有频道/群组 ID 通常以 -100 开头 (如 -1003270297333)
     # 链接格式需要去掉 -100，变成 https://t.me/c/3270297333/173
 
@@ -62,6 +93,58 @@ async def build_message_link(client, event, chat_username, message_id):
         if final_internal_id.startswith("100"):
             final_internal_id = final_internal_id[3:]
 
+    return final_internal_id
+
+
+async def build_message_link(client, event, chat_username, message_id, strategy_cache=None):
+    """
+    生成消息链接：
+    1. 优先尝试官方 API (export_message_link)
+    2. 失败则尝试手动拼接公开用户名链接
+    3. 再失败则强制拼接私有频道链接 (t.me/c/xxx/xxx)
+
+    传入 strategy_cache 时，按会话记住可用的策略，后续命中直接在本地拼接。
+    """
+    chat_id = event.chat_id
+
+    if strategy_cache is not None:
+        entry = strategy_cache.get(chat_id, chat_username)
+        if entry is not None:
+            strategy, _, internal_id = entry
+            if strategy == LINK_USERNAME:
+                strategy_cache.local_builds += 1
+                return f"https://t.me/{chat_username}/{message_id}"
+            if strategy == LINK_INTERNAL:
+                strategy_cache.local_builds += 1
+                return f"https://t.me/c/{internal_id}/{message_id}"
+
+    # 尝试 1: 官方 API (最准确，但私有群+开启防复制时会失效)
+    try:
+        if strategy_cache is not None:
+            strategy_cache.rpc_calls += 1
+        # 显式传入 input_chat 和 message_id
+        link = await client.export_message_link(event.input_chat, message_id)
+        if link:
+            if link.startswith('http:'):
+                link = link.replace('http:', 'https:', 1)
+            if strategy_cache is not None:
+                _learn_from_export(strategy_cache, event, chat_username, message_id, link)
+            return link
+    except Exception:
+        # 失败则继续后续逻辑
+        pass
+
+    # 尝试 2: 如果有公开用户名 (Public Channel/Group)
+    if chat_username:
+        if strategy_cache is not None:
+            strategy_cache.learn(chat_id, chat_username, LINK_USERNAME)
+        return f"https://t.me/{chat_username}/{message_id}"
+
+    # 尝试 3: 强制手动拼接私有链接 (Private Channel/Group)
+    final_internal_id = get_internal_chat_id(event)
+    if strategy_cache is not None:
+        strategy_cache.learn(chat_id, chat_username, LINK_INTERNAL, final_internal_id)
+
     manual_link = f"https://t.me/c/{final_internal_id}/{message_id}"
 
     # 这里可以根据需要增加对话题（Forum Topics）的处理
@@ -69,6 +152,47 @@ async def build_message_link(client, event, chat_username, message_id):
 
     return manual_link
 
+
+def _learn_from_export(strategy_cache, event, chat_username, message_id, link):
+    """export 成功时，判断结果能否在本地复现；能则记住本地策略，否则继续用 export"""
+    chat_id = event.chat_id
+    if chat_username and link == f"https://t.me/{chat_username}/{message_id}":
+        strategy_cache.learn(chat_id, chat_username, LINK_USERNAME)
+        return
+    try:
+        internal_id = get_internal_chat_id(event)
+    except Exception:
+        internal_id = None
+    if internal_id and link == f"https://t.me/c/{internal_id}/{message_id}":
+        strategy_cache.learn(chat_id, chat_username, LINK_INTERNAL, internal_id)
+    else:
+        strategy_cache.learn(chat_id, chat_username, LINK_EXPORT)
+
+def resolve_alert_link(msg_link, msg_text):
+    """确定"查看消息"按钮使用的链接，没有有效链接时返回 None"""
+    final_link = None
+
+    # 1. 优先使用 build_message_link 得到的消息链接
+    if msg_link and msg_link.strip():
+        final_link = msg_link.strip()
+        logger.debug(f"[keyword_alert] 初始 message_link: {final_link}")
+        # 确保是 HTTPS 格式
+        if final_link.startswith('http://'):
+            final_link = final_link.replace('http://', 'https://', 1)
+    # 2. 如果没有链接，尝试从消息文本中提取 https://t.me/username/message_id 或 https://t.me/c/... 格式的链接
+    if not final_link:
+        link_match = re.search(r'(https://t\.me/[^\s\)/]+/[^\s\)]+)', msg_text or "")
+        if link_match:
+            final_link = link_match.group(1)
+            # 验证格式
+            if final_link.count('/') < 3:
+                logger.debug(f"[keyword_alert] 从消息文本提取的链接无效: {final_link}")
+                final_link = None
+
+    if final_link and final_link.startswith('https://t.me/'):
+        return final_link
+    return None
+
 def create_keyword_alert_message(event_data):
     """构造关键词提醒消息（带 Markdown 格式）"""
     listener = event_data.get("listener_account", "未知")
@@ -97,27 +221,10 @@ def create_keyword_alert_message(event_data):
     )
     
     # 必须添加"查看消息"按钮，优先使用消息链接（格式：https://t.me/username/message_id 或 https://t.me/c/...）
-    final_link = None
-    
-    # 1. 优先使用 build_message_link 得到的消息链接
-    if msg_link and msg_link.strip():
-        final_link = msg_link.strip()
-        logger.debug(f"[keyword_alert] 初始 message_link: {final_link}")
-        # 确保是 HTTPS 格式
-        if final_link.startswith('http://'):
-            final_link = final_link.replace('http://', 'https://', 1)
-    # 2. 如果没有链接，尝试从消息文本中提取 https://t.me/username/message_id 或 https://t.me/c/... 格式的链接
-    if not final_link:
-        link_match = re.search(r'(https://t\.me/[^\s\)/]+/[^\s\)]+)', msg_text)
-        if link_match:
-            final_link = link_match.group(1)
-            # 验证格式
-            if final_link.count('/') < 3:
-                logger.debug(f"[keyword_alert] 从消息文本提取的链接无效: {final_link}")
-                final_link = None
+    final_link = resolve_alert_link(msg_link, msg_text)
 
-    # 3. 按钮必须显示（用户要求）
-    if final_link and final_link.startswith('https://t.me/'):
+    # 按钮必须显示（用户要求）
+    if final_link:
         logger.debug(f"[keyword_alert] 最终使用链接生成按钮: {final_link}")
         buttons = [[Button.url("查看消息", final_link)]]
     else:
@@ -127,6 +234,34 @@ def create_keyword_alert_message(event_data):
     
     return alert_msg, buttons
 
+def format_digest_entry(index, event_data, snippet_len=200):
+    """汇总消息中的单条命中（Markdown 格式）"""
+    keyword = event_data.get("keyword", "未知")
+    sender_name = event_data.get("sender_name", "未知")
+    chat_title = event_data.get("chat_title", "未知")
+    # 去掉代码块标记，避免破坏汇总消息的 Markdown 结构
+    msg_text = (event_data.get("message_text") or "（无文本内容）").replace("```", "")
+    if len(msg_text) > snippet_len:
+        msg_text = msg_text[:snippet_len - 3] + "..."
+    return (
+        f"**{index}.** 🔑 `{keyword}` | 💬 {chat_title} | 👤 {sender_name}\n"
+        f"```\n{msg_text}\n```\n"
+    )
+
+def create_keyword_digest_message(event_data_list, snippet_len=200, max_buttons=100):
+    """把多条命中合并为一条汇总提醒（放得下时每条命中一个"查看消息"按钮）"""
+    alert_msg = f"🔔 **关键词提醒汇总**（共 {len(event_data_list)} 条）\n\n"
+    link_buttons = []
+    for i, event_data in enumerate(event_data_list, 1):
+        alert_msg += format_digest_entry(i, event_data, snippet_len)
+        link = resolve_alert_link(event_data.get("message_link"), event_data.get("message_text"))
+        if link and len(link_buttons) < max_buttons:
+            link_buttons.append(Button.url(f"查看消息 {i}", link))
+
+    # 每行 3 个按钮
+    buttons = [link_buttons[i:i + 3] for i in range(0, len(link_buttons), 3)] or None
+    return alert_msg, buttons
+
 def create_event_data(listener_account, keyword, sender_name, sender_username, 
                       chat_title, message_text, message_link):
     """创建事件数据（JSON格式）"""
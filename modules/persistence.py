@@ -0,0 +1,134 @@
+# modules/persistence.py - 持久化模块（原子写入 + 延迟合并写入）
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write_json(path, data, indent=4):
+    """原子写入 JSON：临时文件 + fsync + rename，崩溃时不会留下半截文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    # 同步目录项，确保 rename 本身落盘
+    if hasattr(os, "O_DIRECTORY"):
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+
+
+class WriteBehindWriter:
+    """延迟合并写入器
+
+    - schedule() 只记录最新数据，delay 秒内的多次修改合并为一次写入
+    - 实际的序列化与磁盘 I/O 在单线程执行器中完成，不阻塞事件循环
+    - 没有运行中的事件循环时（例如脚本调用）直接同步写入
+    - 传入 write_func 时由它负责写入（例如 SQLite 增量更新），否则原子写入 JSON 文件
+    """
+    def __init__(self, path, delay=1.0, indent=4, serializer=None, on_written=None, write_func=None):
+        self.path = path
+        self.delay = delay
+        self.indent = indent
+        self.serializer = serializer
+        self.on_written = on_written
+        self.write_func = write_func
+        self.write_count = 0
+        self._pending = None
+        self._has_pending = False
+        self._in_flight = 0
+        self._task = None
+        self._io_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="write-behind")
+
+    @property
+    def has_pending(self):
+        return self._has_pending
+
+    @property
+    def busy(self):
+        """有待写入或正在写入的数据"""
+        return self._has_pending or self._in_flight > 0
+
+    def schedule(self, data):
+        """登记待写入的数据（调用方之后不得再修改 data）"""
+        self._pending = data
+        self._has_pending = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_sync()
+            return
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        # 写入过程中又有新修改时，继续下一轮
+        while self._has_pending:
+            await asyncio.sleep(self.delay)
+            await self.flush()
+
+    def _take_pending(self):
+        data = self._pending
+        self._pending = None
+        self._has_pending = False
+        return data
+
+    def _write(self, data):
+        with self._io_lock:
+            if self.serializer:
+                data = self.serializer(data)
+            if self.write_func:
+                self.write_func(data)
+            else:
+                atomic_write_json(self.path, data, indent=self.indent)
+            self.write_count += 1
+            if self.on_written:
+                self.on_written()
+
+    async def flush(self):
+        """立即把待写入数据写到磁盘（在执行器线程中）"""
+        if not self._has_pending:
+            return
+        data = self._take_pending()
+        self._in_flight += 1
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write, data)
+        except Exception as e:
+            logger.error(f"写入 {self.path} 失败: {e}", exc_info=True)
+            # 没有更新的数据时重新登记，下一轮重试
+            if not self._has_pending:
+                self._pending = data
+                self._has_pending = True
+        finally:
+            self._in_flight -= 1
+
+    def flush_sync(self):
+        """同步写入待写数据（用于没有事件循环或退出前兜底）"""
+        if not self._has_pending:
+            return
+        data = self._take_pending()
+        try:
+            self._write(data)
+        except Exception as e:
+            logger.error(f"写入 {self.path} 失败: {e}", exc_info=True)
@@ -0,0 +1,168 @@
+# modules/routing.py - 提醒路由模块
+"""按关键词组 / 来源群把提醒发到不同的目标群
+
+路由示例（data.json 中的 "routes"）：
+
+    名称: 交易
+    关键词: 出售, 收购, USDT
+    规则: 3
+    群组: -1001234567890
+    目标: -1001111111111, -1002222222222
+
+- 关键词（含规则，按规则 ID 填写）与群组都是可选条件，同时填写时两者都要满足；
+  都不填表示所有命中
+- 一条消息可能同时命中多个关键词/规则：每个命中分别查找，发往所有匹配路由的
+  目标群（去重）；某个命中没有匹配任何路由时，它仍发往默认目标群（target_channel_id）
+- 路由表在配置变化时预编译为 关键词 / 群 / (关键词, 群) -> 目标群 的查找表，
+  每个命中只做几次字典查找
+"""
+import re
+from modules.rule_engine import normalize_chat_ids
+
+_EMPTY = frozenset()
+
+
+def normalize_target(target_id):
+    """目标群 ID：正数 ID 补上 -100 前缀"""
+    if isinstance(target_id, int) and target_id > 0:
+        return int(f"-100{target_id}")
+    return target_id
+
+
+def _chat_keys(chat_ids):
+    """路由中的群 ID 集合：同时包含 -100 前缀形式与实体本身的 ID（提醒中的 chat_id 为实体 ID）"""
+    result = set(normalize_chat_ids(chat_ids))
+    for chat_id in list(result):
+        if chat_id < 0:
+            text = str(chat_id)
+            result.add(-chat_id)  # 普通群
+            if text.startswith("-100") and len(text) > 4:
+                result.add(int(text[4:]))  # 频道/超级群
+    return result
+
+
+def rule_key(rule_id):
+    """规则在查找表中的键（与关键词字符串区分开，规则改名不影响路由）"""
+    return ("rule", rule_id)
+
+
+class RoutingTable:
+    """编译后的路由表（不可变，配置变化时整体替换）"""
+    __slots__ = ("version", "default_targets", "_source", "_by_keyword", "_by_chat", "_by_pair", "_global")
+
+    def __init__(self, routes, rules=(), default_target=None, version=None):
+        self.version = version
+        self._source = (tuple(routes), tuple(rules), default_target)
+        default_target = normalize_target(default_target)
+        self.default_targets = (default_target,) if default_target else ()
+        by_keyword = {}
+        by_chat = {}
+        by_pair = {}
+        global_targets = set()
+        rule_ids = {rule.get("id") for rule in rules}
+        for route in routes:
+            targets = [normalize_target(int(t)) for t in route.get("targets") or ()]
+            if not targets:
+                continue
+            keywords = list(route.get("keywords") or ()) + [
+                rule_key(rule_id) for rule_id in route.get("rules") or () if rule_id in rule_ids
+            ]
+            chats = _chat_keys(route.get("chats")) if route.get("chats") else ()
+            if route.get("rules") and not keywords:
+                # 引用的规则都已删除：路由不再匹配任何命中
+                continue
+            if keywords and chats:
+                for keyword in keywords:
+                    for chat_id in chats:
+                        by_pair.setdefault((keyword, chat_id), set()).update(targets)
+            elif keywords:
+                for keyword in keywords:
+                    by_keyword.setdefault(keyword, set()).update(targets)
+            elif chats:
+                for chat_id in chats:
+                    by_chat.setdefault(chat_id, set()).update(targets)
+            else:
+                global_targets.update(targets)
+        self._by_keyword = {k: frozenset(v) for k, v in by_keyword.items()}
+        self._by_chat = {k: frozenset(v) for k, v in by_chat.items()}
+        self._by_pair = {k: frozenset(v) for k, v in by_pair.items()}
+        self._global = frozenset(global_targets)
+
+    def targets_for(self, keywords, chat_id, rule_ids=()):
+        """一条消息的所有命中应发往的目标群
+
+        每个命中单独查找；没有被任何路由匹配的命中发往默认目标群
+        （不区分关键词的路由已经匹配这条消息时除外）
+        """
+        targets = set(self._global)
+        targets.update(self._by_chat.get(chat_id, _EMPTY))
+        covered = bool(targets)  # 全局/按群路由已匹配这条消息的所有命中
+        unrouted = False
+        for key in (*keywords, *map(rule_key, rule_ids)):
+            routed = self._by_keyword.get(key, _EMPTY) | self._by_pair.get((key, chat_id), _EMPTY)
+            if routed:
+                targets.update(routed)
+            else:
+                unrouted = True
+        if not targets or (unrouted and not covered):
+            targets.update(self.default_targets)
+        return tuple(targets)
+
+
+_table = None
+
+
+def get_routing_table(snapshot):
+    """获取与配置快照对应的路由表（路由、规则、默认目标群不变时沿用）"""
+    global _table
+    table = _table
+    if table is not None and table.version == snapshot.version:
+        return table
+    source = (tuple(snapshot.get("routes", ())), tuple(snapshot.get("rules", ())), snapshot.target_channel_id)
+    if table is not None and table._source == source:
+        table.version = snapshot.version
+        return table
+    table = RoutingTable(*source, version=snapshot.version)
+    _table = table
+    return table
+
+
+_FIELD_NAMES = {
+    "名称": "name", "name": "name",
+    "关键词": "keywords", "keywords": "keywords",
+    "规则": "rules", "rules": "rules",
+    "群组": "chats", "chats": "chats",
+    "目标": "targets", "targets": "targets",
+}
+
+
+def parse_route_text(text):
+    """解析机器人收到的路由文本（每行「字段: 值」），返回路由 dict（不含 id），格式错误时抛出 ValueError
+
+    关键词用逗号分隔（关键词本身可以包含空格），其余字段为逗号或空格分隔的 ID。
+    """
+    route = {"name": "", "keywords": [], "rules": [], "chats": [], "targets": []}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        parts = re.split(r"[:：]", line, maxsplit=1)
+        if len(parts) != 2 or parts[0].strip().lower() not in _FIELD_NAMES:
+            raise ValueError(f"无法识别的行：{line}")
+        field = _FIELD_NAMES[parts[0].strip().lower()]
+        value = parts[1].strip()
+        if field == "name":
+            route["name"] = value
+        elif field == "keywords":
+            route["keywords"] = [kw.strip() for kw in re.split(r"[,，]", value) if kw.strip()]
+        else:
+            for item in re.split(r"[,，\s]+", value):
+                if not item:
+                    continue
+                try:
+                    route[field].append(int(item))
+                except ValueError:
+                    raise ValueError(f"{parts[0].strip()} 中的 ID 无效：{item}")
+    if not route["targets"]:
+        raise ValueError("缺少「目标」")
+    return route
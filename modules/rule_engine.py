@@ -0,0 +1,322 @@
+# modules/rule_engine.py - 规则引擎模块（布尔表达式 + 按群索引）
+"""规则示例：
+
+    名称: 出售频道
+    表达式: 出售 AND 频道 NOT 担保
+    群组: -1001234567890, -1009876543210
+    排除发送者: 123456
+
+- 表达式支持 AND / OR / NOT（不区分大小写）与括号，相邻的词默认为 AND，
+  含空格的词用双引号括起来；与关键词一样区分大小写
+- 群组为空表示所有群；排除发送者按 sender_id 判断，不发起请求
+- 全局关键词与所有规则中的词编译进同一个自动机，每条消息只扫描一次文本，
+  只计算与当前群相关、且至少有一个词命中的规则
+"""
+import logging
+import re
+from modules.keyword_matcher import KeywordHit, KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+
+class RuleSyntaxError(ValueError):
+    """规则表达式或规则文本格式错误"""
+
+
+_TOKEN_PATTERN = re.compile(r'\s*(\(|\)|"[^"]*"|[^\s()"]+)')
+_OPERATORS = {"AND", "OR", "NOT"}
+
+
+def tokenize(expr):
+    tokens = []
+    pos = 0
+    expr = expr.strip()
+    while pos < len(expr):
+        match = _TOKEN_PATTERN.match(expr, pos)
+        if not match:
+            raise RuleSyntaxError(f"无法解析表达式：{expr[pos:]}")
+        token = match.group(1)
+        pos = match.end()
+        if token.startswith('"'):
+            term = token[1:-1]
+            if not term:
+                raise RuleSyntaxError("引号中的关键词不能为空")
+            tokens.append(("term", term))
+        elif token.upper() in _OPERATORS:
+            tokens.append((token.upper(), None))
+        elif token in ("(", ")"):
+            tokens.append((token, None))
+        else:
+            tokens.append(("term", token))
+    return tokens
+
+
+class _Parser:
+    """递归下降解析：or := and (OR and)*；and := unary ([AND] unary)*；unary := NOT unary | (or) | 词"""
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise RuleSyntaxError("表达式为空")
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise RuleSyntaxError(f"表达式中有多余的内容：{self.tokens[self.pos][1] or self.tokens[self.pos][0]}")
+        return node
+
+    def parse_or(self):
+        items = [self.parse_and()]
+        while self.peek() == "OR":
+            self.take()
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else ("or", items)
+
+    def parse_and(self):
+        items = [self.parse_unary()]
+        while self.peek() in ("AND", "NOT", "(", "term"):
+            if self.peek() == "AND":
+                self.take()
+            items.append(self.parse_unary())
+        return items[0] if len(items) == 1 else ("and", items)
+
+    def parse_unary(self):
+        kind = self.peek()
+        if kind == "NOT":
+            self.take()
+            return ("not", self.parse_unary())
+        if kind == "(":
+            self.take()
+            node = self.parse_or()
+            if self.peek() != ")":
+                raise RuleSyntaxError("缺少右括号")
+            self.take()
+            return node
+        if kind == "term":
+            return self.take()
+        raise RuleSyntaxError("表达式不完整" if kind is None else f"此处不应出现 {kind}")
+
+
+def parse_expression(expr):
+    """解析表达式，返回语法树：("term", 词) / ("and", [...]) / ("or", [...]) / ("not", 子树)"""
+    return _Parser(tokenize(expr)).parse()
+
+
+def _compile_node(node):
+    """把语法树编译为 present -> bool 的函数（present 为命中词的集合/字典）"""
+    kind = node[0]
+    if kind == "term":
+        term = node[1]
+        return lambda present: term in present
+    if kind == "not":
+        inner = _compile_node(node[1])
+        return lambda present: not inner(present)
+    parts = tuple(_compile_node(child) for child in node[1])
+    if kind == "and":
+        return lambda present: all(part(present) for part in parts)
+    return lambda present: any(part(present) for part in parts)
+
+
+def _collect_terms(node, positive=True, terms=None, positives=None):
+    if terms is None:
+        terms, positives = [], []
+    kind = node[0]
+    if kind == "term":
+        terms.append(node[1])
+        if positive:
+            positives.append(node[1])
+    elif kind == "not":
+        _collect_terms(node[1], not positive, terms, positives)
+    else:
+        for child in node[1]:
+            _collect_terms(child, positive, terms, positives)
+    return terms, positives
+
+
+def normalize_chat_ids(chat_ids):
+    """群 ID 集合：正数 ID 同时加入 -100 前缀形式，与 event.chat_id 一致"""
+    result = set()
+    for chat_id in chat_ids or ():
+        chat_id = int(chat_id)
+        result.add(chat_id)
+        if chat_id > 0:
+            result.add(int(f"-100{chat_id}"))
+    return frozenset(result)
+
+
+class CompiledRule:
+    """编译后的规则"""
+    __slots__ = ("id", "name", "expr", "evaluate", "terms", "positive_terms", "chats", "exclude_senders")
+
+    def __init__(self, rule):
+        self.id = rule.get("id")
+        self.name = rule.get("name") or f"#{self.id}"
+        self.expr = rule.get("expr", "")
+        tree = parse_expression(self.expr)
+        self.evaluate = _compile_node(tree)
+        terms, positives = _collect_terms(tree)
+        self.terms = tuple(dict.fromkeys(terms))
+        self.positive_terms = tuple(dict.fromkeys(positives))
+        # 没有任何词命中时也成立的规则（如 "NOT 广告"）会对每条消息触发，不允许
+        if self.evaluate(()):
+            raise RuleSyntaxError("规则至少需要一个必须出现的关键词")
+        chats = rule.get("chats") or ()
+        self.chats = normalize_chat_ids(chats) if chats else None
+        self.exclude_senders = frozenset(int(s) for s in rule.get("exclude_senders") or ())
+
+    @property
+    def label(self):
+        return f"规则:{self.name}"
+
+
+def compile_rule(rule):
+    """校验并编译一条规则（格式错误时抛出 RuleSyntaxError）"""
+    try:
+        return CompiledRule(rule)
+    except (TypeError, ValueError) as e:
+        if isinstance(e, RuleSyntaxError):
+            raise
+        raise RuleSyntaxError(f"规则格式错误：{e}")
+
+
+class RulePlan:
+    """关键词 + 规则的编译结果（不可变，配置变化时整体替换）"""
+    __slots__ = ("version", "keywords", "rules", "matcher", "_source", "_by_term", "_by_chat", "_global_rules")
+
+    def __init__(self, keywords, rules, version=None):
+        self.version = version
+        self.keywords = frozenset(kw for kw in keywords if kw)
+        self._source = (tuple(keywords), tuple(rules))
+        compiled = []
+        for rule in rules:
+            try:
+                compiled.append(compile_rule(rule))
+            except RuleSyntaxError as e:
+                logger.error(f"❌ 规则 {rule.get('id')} 无效，已跳过: {e}")
+        self.rules = tuple(compiled)
+
+        # 词 -> 用到该词（肯定形式）的规则；规则只有在至少一个肯定词命中时才可能成立
+        by_term = {}
+        by_chat = {}
+        global_rules = set()
+        for index, rule in enumerate(self.rules):
+            for term in rule.positive_terms:
+                by_term.setdefault(term, set()).add(index)
+            if rule.chats is None:
+                global_rules.add(index)
+            else:
+                for chat_id in rule.chats:
+                    by_chat.setdefault(chat_id, set()).add(index)
+        self._by_term = {term: frozenset(indexes) for term, indexes in by_term.items()}
+        self._by_chat = {chat_id: frozenset(indexes) for chat_id, indexes in by_chat.items()}
+        self._global_rules = frozenset(global_rules)
+
+        terms = list(keywords)
+        for rule in self.rules:
+            terms.extend(rule.terms)
+        self.matcher = KeywordMatcher(terms, version=version)
+
+    def __len__(self):
+        return len(self.keywords) + len(self.rules)
+
+    def applies_to(self, chat_id):
+        """当前群是否有需要检查的关键词或规则（没有则不必扫描文本）"""
+        return bool(self.keywords or self._global_rules or chat_id in self._by_chat)
+
+    def match(self, chat_id, sender_id, text):
+        """扫描一次文本，返回命中的全局关键词与规则（规则命中的 keyword 为规则标签）"""
+        hits = self.matcher.find_all(text)
+        if not hits:
+            return []
+        keywords = self.keywords
+        result = [hit for hit in hits if hit.keyword in keywords]
+        if not self.rules:
+            return result
+
+        present = {}
+        for hit in hits:
+            present.setdefault(hit.keyword, hit)
+        scoped = self._by_chat.get(chat_id)
+        candidates = set()
+        for term in present:
+            indexes = self._by_term.get(term)
+            if indexes:
+                candidates.update(indexes)
+        for index in sorted(candidates):
+            if index not in self._global_rules and (scoped is None or index not in scoped):
+                continue
+            rule = self.rules[index]
+            if sender_id in rule.exclude_senders or not rule.evaluate(present):
+                continue
+            first = min((present[t] for t in rule.positive_terms if t in present), key=lambda h: h.end)
+            result.append(KeywordHit(first.start, first.end, rule.label, rule.id))
+        return result
+
+
+_plan = None
+
+
+def get_rule_plan(snapshot):
+    """获取与配置快照对应的编译结果（关键词与规则不变时沿用，变化时整体换入新结果）"""
+    global _plan
+    plan = _plan
+    if plan is not None and plan.version == snapshot.version:
+        return plan
+    keywords = snapshot.keywords
+    rules = snapshot.get("rules", ())
+    if plan is not None and plan._source == (tuple(keywords), tuple(rules)):
+        plan.version = snapshot.version
+        return plan
+    plan = RulePlan(keywords, rules, version=snapshot.version)
+    _plan = plan
+    return plan
+
+
+_FIELD_NAMES = {
+    "名称": "name", "name": "name",
+    "表达式": "expr", "expr": "expr",
+    "群组": "chats", "chats": "chats",
+    "排除发送者": "exclude_senders", "exclude_senders": "exclude_senders",
+}
+
+
+def _parse_id_list(value, field):
+    ids = []
+    for item in re.split(r"[,，\s]+", value.strip()):
+        if not item:
+            continue
+        try:
+            ids.append(int(item))
+        except ValueError:
+            raise RuleSyntaxError(f"{field} 中的 ID 无效：{item}")
+    return ids
+
+
+def parse_rule_text(text):
+    """解析机器人收到的规则文本（每行「字段: 值」），返回规则 dict（不含 id）"""
+    rule = {"name": "", "expr": "", "chats": [], "exclude_senders": []}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        parts = re.split(r"[:：]", line, maxsplit=1)
+        if len(parts) != 2 or parts[0].strip().lower() not in _FIELD_NAMES:
+            raise RuleSyntaxError(f"无法识别的行：{line}")
+        field = _FIELD_NAMES[parts[0].strip().lower()]
+        value = parts[1].strip()
+        if field in ("chats", "exclude_senders"):
+            rule[field] = _parse_id_list(value, parts[0].strip())
+        else:
+            rule[field] = value
+    if not rule["expr"]:
+        raise RuleSyntaxError("缺少「表达式」")
+    compile_rule(rule)
+    return rule
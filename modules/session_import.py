@@ -0,0 +1,152 @@
+# modules/session_import.py - 批量导入 session 模块
+"""批量导入监听账号
+
+- 支持 zip / tar 压缩包（内含 .session 文件或每行一个 StringSession 的文本文件）
+  以及直接发送的多行 StringSession
+- 并发验证（限制同时登录的数量），验证通过的客户端保持连接，
+  直接交给 UserbotListener 使用，不再重新登录
+"""
+import asyncio
+import logging
+import os
+import tarfile
+import zipfile
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+MAX_ARCHIVE_ENTRIES = 500  # 单个压缩包最多处理的条目数
+MAX_ENTRY_SIZE = 10 * 1024 * 1024  # 单个文件最大 10MB
+
+
+class ValidatedSession:
+    """一个 session 的验证结果；成功时 client 保持连接"""
+    __slots__ = ("session_name", "session_string", "client", "me", "error", "source")
+
+    def __init__(self, session_name, session_string=None, client=None, me=None, error=None, source=None):
+        self.session_name = session_name
+        self.session_string = session_string
+        self.client = client
+        self.me = me
+        self.error = error
+        self.source = source  # 来源描述（压缩包内文件名 / 第几行），用于结果提示
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def account_name(self):
+        return describe_account(self.me) if self.me else f"账号_{self.session_name}"
+
+
+def describe_account(me):
+    """账号显示名：姓名 > @用户名 > 用户ID"""
+    name = f"{getattr(me, 'first_name', None) or ''} {getattr(me, 'last_name', None) or ''}".strip()
+    if name:
+        return name
+    username = getattr(me, "username", None)
+    return f"@{username}" if username else f"用户{me.id}"
+
+
+def is_archive(file_name):
+    return bool(file_name) and file_name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def split_session_strings(text):
+    """多行文本中的 StringSession（忽略空行和 # 开头的注释）"""
+    return [line.strip() for line in (text or "").splitlines() if line.strip() and not line.strip().startswith("#")]
+
+
+def new_session_names(count, existing):
+    """生成 count 个未被占用的 session 名称（anon_N）"""
+    names = []
+    taken = set(existing)
+    index = len(taken) + 1
+    while len(names) < count:
+        name = f"anon_{index}"
+        if name not in taken and not os.path.exists(f"{name}.session"):
+            names.append(name)
+            taken.add(name)
+        index += 1
+    return names
+
+
+def read_session_archive(path):
+    """读取压缩包，返回 [(来源, 'file', 文件内容) | (来源, 'string', session 字符串)]"""
+    entries = []
+
+    def add_member(name, data):
+        base = os.path.basename(name)
+        if not base or base.startswith("."):
+            return
+        if base.endswith(".session"):
+            entries.append((base, "file", data))
+        elif base.endswith((".txt", ".session_string", ".string")) or "." not in base:
+            text = data.decode("utf-8", errors="ignore")
+            for line_no, session_string in enumerate(split_session_strings(text), 1):
+                entries.append((f"{base}:{line_no}", "string", session_string))
+
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist()[:MAX_ARCHIVE_ENTRIES]:
+                if not info.is_dir() and info.file_size <= MAX_ENTRY_SIZE:
+                    add_member(info.filename, archive.read(info))
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            for member in archive.getmembers()[:MAX_ARCHIVE_ENTRIES]:
+                if member.isfile() and member.size <= MAX_ENTRY_SIZE:
+                    add_member(member.name, archive.extractfile(member).read())
+    else:
+        raise ValueError("不是有效的 zip / tar 压缩包")
+    return entries
+
+
+async def validate_session(api_id, api_hash, session_name, session_string=None, timeout=30, source=None):
+    """登录并验证一个 session；成功时返回保持连接的客户端，失败时断开并返回错误信息"""
+    client = None
+    try:
+        if session_string:
+            client = TelegramClient(StringSession(session_string), api_id, api_hash)
+        else:
+            client = TelegramClient(session_name, api_id, api_hash)
+        await asyncio.wait_for(client.connect(), timeout)
+        if not await client.is_user_authorized():
+            raise Exception("Session 未授权或已失效")
+        me = await client.get_me()
+        return ValidatedSession(session_name, session_string, client, me, source=source)
+    except Exception as e:
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+        return ValidatedSession(session_name, session_string, error=str(e) or type(e).__name__, source=source)
+
+
+async def validate_sessions(api_id, api_hash, items, concurrency=5, timeout=30):
+    """并发验证多个 session
+
+    items: [(session_name, session_string 或 None, 来源描述)]
+    同一账号出现多次时只保留第一个，其余断开并标记为重复。
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(session_name, session_string, source):
+        async with semaphore:
+            return await validate_session(api_id, api_hash, session_name, session_string, timeout, source)
+
+    results = await asyncio.gather(*(run(*item) for item in items))
+    seen = set()
+    for result in results:
+        if not result.ok:
+            continue
+        if result.me.id in seen:
+            await result.client.disconnect()
+            result.client = None
+            result.error = "与本批次中的其它 session 是同一个账号"
+            continue
+        seen.add(result.me.id)
+    return results
@@ -0,0 +1,446 @@
+# modules/sharding.py - 多进程分片监听模块
+"""把监听账号分散到多个工作进程
+
+- 每个工作进程有自己的事件循环和 Telethon 客户端，只负责按 session_name 哈希分到本分片的账号
+- 工作进程命中关键词后，通过进程间队列把命中事件交给主进程；主进程持有机器人客户端，
+  统一去重后发布到主进程的事件总线（限速、FloodWait 处理仍只在一处进行）
+- 配置修改由主进程推送给所有工作进程，工作进程不写 data.json
+- 工作进程意外退出时按指数退避（带随机抖动）自动重启
+
+注意：工作进程内的处理耗时直方图不会汇总到主进程的 /metrics，
+主进程只能看到各账号的计数（通过定期上报的状态）。
+"""
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import signal
+import threading
+import time
+import zlib
+from modules.data_manager import config_store, get_config
+from modules.event_bus import EventBus, HitEvent
+from modules.listener import ListenerManager
+from modules.supervisor import STATE_CONNECTING
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for(session_name, shard_count):
+    """账号所属的分片（稳定哈希，与进程重启无关）"""
+    return zlib.crc32(str(session_name).encode("utf-8")) % shard_count
+
+
+class HitChannel:
+    """工作进程内事件总线的唯一输出：把命中事件放入进程间队列交给主进程
+
+    只传递事件字段（dict），主进程重新构造 HitEvent 并发布到自己的总线。
+    """
+    name = "shard_channel"
+
+    def __init__(self, outbox, shard_index):
+        self.outbox = outbox
+        self.shard_index = shard_index
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, event):
+        try:
+            self.outbox.put_nowait(("hit", self.shard_index, event.to_dict()))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"⚠️ 分片 {self.shard_index} 提醒通道已满，丢弃命中: {event.keyword}")
+            return False
+        self.sent += 1
+        return True
+
+    def stats(self):
+        return {"sent": self.sent, "dropped": self.dropped}
+
+
+class RemoteListener:
+    """主进程中代表工作进程内某个监听器的状态（由工作进程定期上报）"""
+    def __init__(self, session_name, shard_index):
+        self.session_name = session_name
+        self.shard_index = shard_index
+        self.account_name = session_name
+        self.listener_username = None
+        self.is_running = False
+        self.state = STATE_CONNECTING
+        self.last_error = None
+        self.restarts = 0
+        self.next_retry_at = None
+        self.bot_client = None
+        self.stats = {}
+        self._queue_stats = {}
+
+    def queue_stats(self):
+        return self._queue_stats
+
+    def update(self, status):
+        self.account_name = status.get("account_name", self.account_name)
+        self.listener_username = status.get("listener_username")
+        self.is_running = status.get("is_running", False)
+        self.state = status.get("state", self.state)
+        self.last_error = status.get("last_error")
+        self.restarts = status.get("restarts", 0)
+        self.next_retry_at = status.get("next_retry_at")
+        self.stats = status.get("stats", {})
+        self._queue_stats = status.get("queue", {})
+
+
+def _shard_cache_path(path, shard_index):
+    """每个分片使用单独的实体缓存文件"""
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{shard_index}{ext}"
+
+
+def _worker_main(shard_index, shard_count, api_id, api_hash, config_data, options, inbox, outbox):
+    """工作进程入口"""
+    # Ctrl+C 由主进程处理，工作进程等待主进程通知退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        level=options.get("log_level", logging.INFO),
+        format=f'%(asctime)s - shard{shard_index} - %(name)s - %(levelname)s - %(message)s'
+    )
+    logging.getLogger('telethon').setLevel(logging.WARNING)
+    logging.getLogger('telethon.network').setLevel(logging.ERROR)
+    try:
+        asyncio.run(_run_worker(shard_index, shard_count, api_id, api_hash, config_data, options, inbox, outbox))
+    except KeyboardInterrupt:
+        pass
+
+
+def _get_message(inbox, timeout=1.0):
+    try:
+        return inbox.get(timeout=timeout)
+    except queue.Empty:
+        return None
+
+
+async def _send(outbox, message):
+    """发送主进程必须收到的消息（ready / reply）：队列满时在线程中等待，不阻塞事件循环"""
+    await asyncio.get_running_loop().run_in_executor(None, outbox.put, message)
+
+
+async def _report_status(manager, shard_index, outbox, interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            outbox.put_nowait(("status", shard_index, manager.get_listener_status()))
+        except queue.Full:
+            # 状态下次还会上报，积压时直接跳过
+            pass
+
+
+async def _run_worker(shard_index, shard_count, api_id, api_hash, config_data, options, inbox, outbox):
+    # 只发布内存快照，工作进程不写 data.json
+    config_store.publish(config_data)
+
+    cache_options = dict(options.get("entity_cache_options") or {})
+    cache_options["path"] = _shard_cache_path(cache_options.get("path"), shard_index)
+    manager = ListenerManager(api_id, api_hash, bot_entity=None, entity_cache_options=cache_options)
+    manager.shard = (shard_index, shard_count)
+    manager.bus = EventBus([HitChannel(outbox, shard_index)])
+    manager.startup_concurrency = options.get("startup_concurrency", manager.startup_concurrency)
+    manager.startup_jitter = options.get("startup_jitter", manager.startup_jitter)
+    manager.queue_options = options.get("queue_options") or {}
+    gap_options = options.get("gap_recovery_options")
+    if gap_options is not None:
+        gap_options = dict(gap_options)
+        gap_options["path"] = _shard_cache_path(gap_options.get("path"), shard_index)
+        manager.enable_gap_recovery(**gap_options)
+    manager.warm_entity_cache = options.get("warm_entity_cache", True)
+    manager.entity_cache.load()
+    manager.entity_cache.start_autosave()
+
+    await manager.reload_all()
+    await _send(outbox, ("ready", shard_index, manager.get_listener_status()))
+    status_task = asyncio.create_task(
+        _report_status(manager, shard_index, outbox, options.get("status_interval", 2))
+    )
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            message = await loop.run_in_executor(None, _get_message, inbox)
+            if message is None:
+                continue
+            kind = message[0]
+            if kind == "shutdown":
+                break
+            if kind == "config":
+                # 控制消息按顺序处理：新配置生效后才处理之后的启动/停止请求
+                config_store.publish(message[1])
+                await manager.reload_all()
+            elif kind == "start":
+                _, request_id, session_name, account_name = message
+                await manager.start_listener(session_name, account_name)
+                ok = session_name in manager.listeners
+                await _send(outbox, ("reply", request_id, ok, shard_index, manager.get_listener_status()))
+            elif kind == "stop":
+                _, request_id, session_name = message
+                ok = await manager.stop_listener(session_name)
+                await _send(outbox, ("reply", request_id, ok, shard_index, manager.get_listener_status()))
+    finally:
+        status_task.cancel()
+        await manager.shutdown()
+        await manager.entity_cache.flush()
+
+
+class _Shard:
+    __slots__ = ("index", "process", "inbox", "ready", "started_at", "failures", "restart_at")
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.inbox = None
+        self.ready = None
+        self.started_at = 0
+        self.failures = 0
+        self.restart_at = None
+
+
+class ShardedListenerManager(ListenerManager):
+    """多进程版监听管理器（接口与 ListenerManager 相同，供 BotManager 直接使用）
+
+    listeners 中保存的是 RemoteListener，状态来自工作进程的定期上报。
+    """
+    def __init__(self, api_id, api_hash, bot_entity, bot_client=None, dispatcher_options=None,
+                 entity_cache_options=None, workers=2, restart_backoff=1, restart_max_backoff=60,
+                 status_interval=2, request_timeout=120):
+        super().__init__(api_id, api_hash, bot_entity, bot_client, dispatcher_options, entity_cache_options)
+        self.workers = workers
+        self.entity_cache_options = entity_cache_options
+        self.restart_backoff = restart_backoff
+        self.restart_max_backoff = restart_max_backoff
+        self.status_interval = status_interval
+        self.request_timeout = request_timeout
+        self.worker_restarts = 0
+        self.cross_shard_duplicates = 0
+        self._ctx = multiprocessing.get_context("spawn")
+        # 工作进程 -> 主进程：提醒与状态（有界，积压时工作进程丢弃提醒并计数）
+        max_queue = (dispatcher_options or {}).get("max_queue", 1000)
+        self._outbox = self._ctx.Queue(maxsize=max_queue)
+        self._shards = {index: _Shard(index) for index in range(workers)}
+        self._requests = {}  # {request_id: asyncio.Future}
+        self._request_ids = itertools.count(1)
+        self._loop = None
+        self._pump = None
+        self._supervisor = None
+        self._closing = False
+        self.gap_recovery_options = None  # 由各分片进程按这些参数启用断线补拉
+
+    def enable_gap_recovery(self, **options):
+        """断线补拉在各分片进程中执行（每个分片使用单独的进度文件）"""
+        self.gap_recovery_options = options
+        return None
+
+    def _worker_options(self):
+        return {
+            "entity_cache_options": self.entity_cache_options,
+            "startup_concurrency": self.startup_concurrency,
+            "startup_jitter": self.startup_jitter,
+            "queue_options": self.queue_options,
+            "gap_recovery_options": self.gap_recovery_options,
+            "warm_entity_cache": self.warm_entity_cache,
+            "status_interval": self.status_interval,
+            "log_level": logging.getLogger().level
+        }
+
+    def _spawn(self, shard):
+        shard.inbox = self._ctx.Queue()
+        shard.ready = self._loop.create_future()
+        shard.process = self._ctx.Process(
+            target=_worker_main,
+            args=(shard.index, self.workers, self.api_id, self.api_hash,
+                  config_store.snapshot.to_dict(), self._worker_options(), shard.inbox, self._outbox),
+            name=f"listener-shard-{shard.index}",
+            daemon=True
+        )
+        shard.process.start()
+        shard.started_at = time.monotonic()
+        shard.restart_at = None
+        logger.info(f"🧩 已启动分片进程 {shard.index} (pid {shard.process.pid})")
+
+    def _start_workers(self):
+        self._loop = asyncio.get_running_loop()
+        self._pump = threading.Thread(target=self._pump_outbox, name="shard-outbox", daemon=True)
+        self._pump.start()
+        for shard in self._shards.values():
+            self._spawn(shard)
+        self._supervisor = asyncio.create_task(self._supervise())
+        config_store.subscribe(self._on_config)
+
+    def _pump_outbox(self):
+        """后台线程：把工作进程的消息转交给事件循环"""
+        while True:
+            message = self._outbox.get()
+            if message is None:
+                return
+            self._loop.call_soon_threadsafe(self._on_worker_message, message)
+
+    def _on_worker_message(self, message):
+        kind = message[0]
+        if kind == "hit":
+            _, shard_index, event_data = message
+            self._handle_hit(shard_index, event_data)
+        elif kind == "status":
+            self._update_listeners(message[1], message[2])
+        elif kind == "ready":
+            _, shard_index, status = message
+            self._update_listeners(shard_index, status)
+            shard = self._shards[shard_index]
+            if shard.ready is not None and not shard.ready.done():
+                shard.ready.set_result(status)
+        elif kind == "reply":
+            _, request_id, ok, shard_index, status = message
+            self._update_listeners(shard_index, status)
+            future = self._requests.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_result(ok)
+
+    def _handle_hit(self, shard_index, event_data):
+        chat_id = event_data.get("chat_id")
+        message_id = event_data.get("message_id")
+        # 分片内已经去过重，这里处理不同分片的账号在同一个群的情况
+        if chat_id is not None and message_id is not None and not self.dedup.claim(chat_id, message_id, shard_index):
+            self.cross_shard_duplicates += 1
+            return
+        if self.history is not None:
+            self.history.record(event_data)
+        self.bus.publish(HitEvent.from_dict(event_data))
+
+    def _update_listeners(self, shard_index, status):
+        for session_name in [s for s, l in self.listeners.items() if l.shard_index == shard_index and s not in status]:
+            del self.listeners[session_name]
+        for session_name, info in status.items():
+            listener = self.listeners.get(session_name)
+            if listener is None:
+                listener = self.listeners[session_name] = RemoteListener(session_name, shard_index)
+                listener.bot_client = self.bot_client
+            listener.update(info)
+
+    def _on_config(self, snapshot):
+        data = snapshot.to_dict()
+        for shard in self._shards.values():
+            if shard.process is not None and shard.process.is_alive():
+                shard.inbox.put(("config", data))
+
+    async def _supervise(self):
+        """监控工作进程，退出的进程按指数退避重启"""
+        while not self._closing:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            for shard in self._shards.values():
+                if self._closing:
+                    return
+                if shard.process.is_alive():
+                    continue
+                if shard.restart_at is None:
+                    # 正常运行超过最大退避时间后才退出的，视为偶发故障，重新计算退避
+                    if now - shard.started_at > self.restart_max_backoff:
+                        shard.failures = 0
+                    delay = min(self.restart_max_backoff, self.restart_backoff * 2 ** shard.failures)
+                    delay *= random.uniform(0.5, 1.0)
+                    shard.failures += 1
+                    shard.restart_at = now + delay
+                    self._update_listeners(shard.index, {})
+                    if shard.ready is not None and not shard.ready.done():
+                        # 启动阶段就退出的进程，不让 reload_all 一直等待
+                        shard.ready.set_result({})
+                    logger.error(
+                        f"❌ 分片进程 {shard.index} 已退出 (exitcode={shard.process.exitcode})，"
+                        f"{delay:.1f} 秒后重启"
+                    )
+                elif now >= shard.restart_at:
+                    self.worker_restarts += 1
+                    self._spawn(shard)
+
+    async def _request(self, session_name, message):
+        shard = self._shards[shard_for(session_name, self.workers)]
+        if shard.process is None or not shard.process.is_alive():
+            logger.warning(f"分片进程 {shard.index} 未运行，无法处理 {session_name}")
+            return False
+        request_id = next(self._request_ids)
+        future = self._loop.create_future()
+        self._requests[request_id] = future
+        shard.inbox.put((message[0], request_id) + message[1:])
+        try:
+            return await asyncio.wait_for(future, self.request_timeout)
+        except asyncio.TimeoutError:
+            self._requests.pop(request_id, None)
+            logger.error(f"❌ 分片进程 {shard.index} 处理 {session_name} 超时")
+            return False
+
+    async def start_listener(self, session_name, account_name, client=None, me=None):
+        """在所属分片进程中启动监听（已连接的客户端不能跨进程传递，先断开再由分片进程登录）"""
+        if client is not None:
+            await client.disconnect()
+        if self._loop is None:
+            self._start_workers()
+        return await self._request(session_name, ("start", session_name, account_name))
+
+    async def stop_listener(self, session_name):
+        """在所属分片进程中停止监听"""
+        if session_name not in self.listeners or self._loop is None:
+            return False
+        ok = await self._request(session_name, ("stop", session_name))
+        if ok:
+            self.listeners.pop(session_name, None)
+        return ok
+
+    async def reload_all(self):
+        """首次调用时启动所有分片进程并等待其完成登录；之后把当前配置推送给各分片"""
+        started_at = time.monotonic()
+        if self._loop is None:
+            self._start_workers()
+        else:
+            self._on_config(config_store.snapshot)
+        await asyncio.gather(*(shard.ready for shard in self._shards.values()), return_exceptions=True)
+        total = len(get_config().accounts)
+        running = sum(1 for listener in self.listeners.values() if listener.is_running)
+        logger.info(
+            f"⏱ 分片监听启动完成: 运行中 {running}/{total}，{self.workers} 个进程，"
+            f"耗时 {time.monotonic() - started_at:.1f}s"
+        )
+        return running, total
+
+    def get_dispatcher_stats(self):
+        stats = super().get_dispatcher_stats()
+        stats["cross_shard_duplicates"] = self.cross_shard_duplicates
+        stats["worker_restarts"] = self.worker_restarts
+        return stats
+
+    async def shutdown(self):
+        """通知所有工作进程退出，超时未退出的强制结束"""
+        self._closing = True
+        config_store.unsubscribe(self._on_config)
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        loop = asyncio.get_running_loop()
+        for shard in self._shards.values():
+            if shard.process is not None and shard.process.is_alive():
+                shard.inbox.put(("shutdown",))
+        for shard in self._shards.values():
+            if shard.process is None:
+                continue
+            await loop.run_in_executor(None, shard.process.join, 15)
+            if shard.process.is_alive():
+                logger.warning(f"分片进程 {shard.index} 未按时退出，强制结束")
+                shard.process.terminate()
+        if self._pump is not None:
+            try:
+                self._outbox.put_nowait(None)
+            except queue.Full:
+                # 队列仍有积压：转发线程为守护线程，不等待它退出
+                logger.warning("分片消息队列已满，未能通知转发线程退出")
+        await self.bus.close()
+        await self.dispatcher.close()
+        if self.history is not None:
+            await self.history.close()
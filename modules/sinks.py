@@ -0,0 +1,192 @@
+# modules/sinks.py - 命中事件输出模块
+"""事件总线的订阅方
+
+- TelegramSink：格式化提醒并按路由表交给 AlertDispatcher 发送到一个或多个目标群
+  （每个目标群有自己的发送协程，多个目标群并发发送；发送队列本身负责限速）
+- JsonlSink：追加写入 JSONL 文件，按大小轮转
+- WebhookSink：POST JSON 到本地 HTTP 地址
+- RelaySink：把事件以 JSON 文本发给指定会话（旧版 userbot -> 机器人转发格式）
+
+除 TelegramSink 外都继承 QueuedSink：每个输出有自己的有界队列和发送协程，
+队列满时丢弃新事件并计数，输出变慢或出错不影响其它输出。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from modules.data_manager import get_config
+from modules.message_handler import create_keyword_alert_message
+from modules.routing import get_routing_table
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramSink:
+    """按路由表发送到目标群（经由共享的 AlertDispatcher）"""
+    name = "telegram"
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+        self.submitted = 0
+        self.skipped = 0
+
+    def offer(self, event):
+        targets = get_routing_table(get_config()).targets_for(event.keywords, event.chat_id, event.rule_ids)
+        if not targets:
+            self.skipped += 1
+            logger.warning("⚠️ 未设置目标群，无法发送提醒")
+            return False
+        event_data = event.to_dict()
+        # 只格式化一次，各目标群共用
+        alert_msg, buttons = create_keyword_alert_message(event_data)
+        submitted = 0
+        for target_id in targets:
+            if self.dispatcher.submit(target_id, alert_msg, buttons, event_data):
+                submitted += 1
+                logger.debug(f"提醒已加入发送队列: {event.keyword} -> {target_id}")
+        self.submitted += submitted
+        return submitted > 0
+
+    def stats(self):
+        return {"submitted": self.submitted, "skipped": self.skipped}
+
+
+class QueuedSink:
+    """带独立队列与发送协程的输出基类（子类实现 handle_batch）"""
+    name = "sink"
+
+    def __init__(self, max_queue=1000, batch_size=50):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self._queue = deque()
+        self._wakeup = None
+        self._task = None
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def offer(self, event):
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f"⚠️ 输出 {self.name} 积压 {len(self._queue)} 条，已丢弃 {self.dropped} 条事件")
+            return False
+        self._queue.append(event)
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return True
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            if not queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            batch = [queue.popleft() for _ in range(min(self.batch_size, len(queue)))]
+            try:
+                await self.handle_batch(batch)
+                self.delivered += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"❌ 输出 {self.name} 处理 {len(batch)} 条事件失败: {e}")
+
+    async def handle_batch(self, events):
+        raise NotImplementedError
+
+    async def close(self, timeout=5):
+        """尽量处理完队列中的事件后停止"""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue and not self._task.done() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self):
+        return {
+            "queue_depth": len(self._queue),
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped
+        }
+
+
+class JsonlSink(QueuedSink):
+    """追加写入 JSONL 文件（超过 max_bytes 时轮转，保留 backup_count 个旧文件）"""
+    name = "jsonl"
+
+    def __init__(self, path="alerts.jsonl", max_bytes=10 * 1024 * 1024, backup_count=5, **options):
+        super().__init__(**options)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jsonl-sink")
+
+    def _rotate(self):
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _write(self, lines):
+        if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write("".join(lines))
+
+    async def handle_batch(self, events):
+        lines = [json.dumps(event.to_dict(), ensure_ascii=False) + "\n" for event in events]
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._write, lines)
+
+
+class WebhookSink(QueuedSink):
+    """逐条 POST JSON 到 HTTP 地址（标准库 urllib，在线程中执行）"""
+    name = "webhook"
+
+    def __init__(self, url, timeout=5, headers=None, **options):
+        super().__init__(**options)
+        self.url = url
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webhook-sink")
+
+    def _post(self, body):
+        request = urllib.request.Request(self.url, data=body, headers=self.headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    async def handle_batch(self, events):
+        loop = asyncio.get_running_loop()
+        for event in events:
+            body = json.dumps({"type": "keyword_alert", **event.to_dict()}, ensure_ascii=False).encode("utf-8")
+            await loop.run_in_executor(self._executor, self._post, body)
+
+
+class RelaySink(QueuedSink):
+    """把事件以 JSON 文本发给指定会话（旧版转发格式：{"type": "keyword_alert", ...}）"""
+    name = "relay"
+
+    def __init__(self, chat, client_provider, **options):
+        super().__init__(**options)
+        self.chat = chat
+        self.client_provider = client_provider  # async () -> TelegramClient
+
+    async def handle_batch(self, events):
+        client = await self.client_provider()
+        for event in events:
+            await client.send_message(
+                self.chat, json.dumps({"type": "keyword_alert", **event.to_dict()}, ensure_ascii=False)
+            )
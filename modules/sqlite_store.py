@@ -0,0 +1,232 @@
+# modules/sqlite_store.py - SQLite 配置存储模块（WAL 模式，增量更新）
+"""data.json 的可选替代
+
+- 账号、关键词、规则分别存放在带索引的表中，其余顶层配置存放在 settings 表（JSON 值）
+- 写入时与上一次写入/读取的内容做差异比较，只增删改变化的行，不重写整个配置
+- WAL 模式 + 事务，多个进程同时读写也是安全的；其它连接提交后 data_version 会变化，
+  配置监视器据此重新加载
+- 首次启动时自动导入已有的 data.json（导入后重命名为 data.json.migrated）
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    session_name TEXT PRIMARY KEY,
+    name TEXT,
+    session_string TEXT,
+    extra TEXT,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_position ON accounts(position);
+CREATE TABLE IF NOT EXISTS keywords (
+    keyword TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_keywords_position ON keywords(position);
+CREATE TABLE IF NOT EXISTS rules (
+    id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 单独成表的顶层键，其余键存入 settings
+TABLE_KEYS = ("userbot_accounts", "keywords", "rules")
+ACCOUNT_COLUMNS = ("name", "session_string")
+
+
+def _account_row(account):
+    """账号 -> (name, session_string, extra)；未单独成列的字段存入 extra（JSON）"""
+    extra = {k: v for k, v in account.items() if k not in ACCOUNT_COLUMNS and k != "session_name"}
+    return (
+        account.get("name"),
+        account.get("session_string"),
+        json.dumps(extra, ensure_ascii=False) if extra else None
+    )
+
+
+class SQLiteBackend:
+    """配置的 SQLite 存储（供 ConfigStore 读取、WriteBehindWriter 写入）"""
+    def __init__(self, path, default_factory):
+        self.path = path
+        self.default_factory = default_factory
+        self.write_count = 0
+        self._lock = threading.Lock()
+        self._baseline = None  # 上一次读取/写入的完整配置，用于计算差异
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def change_token(self):
+        """其它连接（其它进程）提交修改后会变化；本连接自身的写入不会改变它"""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def read(self):
+        """读取完整配置"""
+        with self._lock:
+            conn = self._conn
+            data = self.default_factory()
+            for key, value in conn.execute("SELECT key, value FROM settings"):
+                data[key] = json.loads(value)
+            accounts = []
+            for session_name, name, session_string, extra in conn.execute(
+                "SELECT session_name, name, session_string, extra FROM accounts ORDER BY position, rowid"
+            ):
+                account = {"name": name, "session_name": session_name, "session_string": session_string}
+                if extra:
+                    account.update(json.loads(extra))
+                accounts.append(account)
+            data["userbot_accounts"] = accounts
+            data["keywords"] = [row[0] for row in conn.execute("SELECT keyword FROM keywords ORDER BY position, rowid")]
+            data["rules"] = [json.loads(row[0]) for row in conn.execute("SELECT data FROM rules ORDER BY id")]
+            self._baseline = data
+            return data
+
+    def write(self, data):
+        """把新配置与上一次的内容比较，只写入变化的行（单个事务）"""
+        with self._lock:
+            old = self._baseline if self._baseline is not None else self.default_factory()
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._sync_accounts(conn, old.get("userbot_accounts", []), data.get("userbot_accounts", []))
+                self._sync_keywords(conn, old.get("keywords", []), data.get("keywords", []))
+                self._sync_rules(conn, old.get("rules", []), data.get("rules", []))
+                self._sync_settings(conn, old, data)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._baseline = data
+            self.write_count += 1
+
+    def _sync_ordered(self, conn, table, key_column, old_keys, new_keys):
+        """同步有序键的增删；顺序变化或新键不在末尾时重排 position"""
+        old_set = set(old_keys)
+        new_set = set(new_keys)
+        removed = [k for k in old_keys if k not in new_set]
+        if removed:
+            conn.executemany(f"DELETE FROM {table} WHERE {key_column} = ?", [(k,) for k in removed])
+        kept_new_order = [k for k in new_keys if k in old_set]
+        added = [k for k in new_keys if k not in old_set]
+        appended = new_keys[len(kept_new_order):] == added
+        if kept_new_order != [k for k in old_keys if k in new_set] or not appended:
+            return added, True
+        return added, False
+
+    def _sync_keywords(self, conn, old, new):
+        # keyword 为主键：重复的关键词（手工编辑的 data.json 中可能出现）只保留第一个
+        old = list(dict.fromkeys(old))
+        new = list(dict.fromkeys(new))
+        added, reorder = self._sync_ordered(conn, "keywords", "keyword", old, new)
+        if reorder:
+            conn.executemany("INSERT OR IGNORE INTO keywords (keyword, position) VALUES (?, 0)", [(k,) for k in added])
+            conn.executemany("UPDATE keywords SET position = ? WHERE keyword = ?", [(i, k) for i, k in enumerate(new)])
+            return
+        start = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM keywords").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO keywords (keyword, position) VALUES (?, ?)",
+            [(k, start + i) for i, k in enumerate(added)]
+        )
+
+    def _sync_accounts(self, conn, old, new):
+        old_by_key = {a.get("session_name"): a for a in old}
+        new_by_key = {a.get("session_name"): a for a in new}
+        added, reorder = self._sync_ordered(conn, "accounts", "session_name", list(old_by_key), list(new_by_key))
+        added_set = set(added)
+        start = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM accounts").fetchone()[0]
+        for i, session_name in enumerate(added):
+            conn.execute(
+                "INSERT INTO accounts (session_name, name, session_string, extra, position) VALUES (?, ?, ?, ?, ?)",
+                (session_name,) + _account_row(new_by_key[session_name]) + (start + i,)
+            )
+        for session_name, account in new_by_key.items():
+            if session_name in added_set or old_by_key.get(session_name) == account:
+                continue
+            conn.execute(
+                "UPDATE accounts SET name = ?, session_string = ?, extra = ? WHERE session_name = ?",
+                _account_row(account) + (session_name,)
+            )
+        if reorder:
+            conn.executemany(
+                "UPDATE accounts SET position = ? WHERE session_name = ?",
+                [(i, k) for i, k in enumerate(new_by_key)]
+            )
+
+    def _sync_rules(self, conn, old, new):
+        old_by_id = {r.get("id"): r for r in old}
+        new_by_id = {r.get("id"): r for r in new}
+        removed = [rule_id for rule_id in old_by_id if rule_id not in new_by_id]
+        if removed:
+            conn.executemany("DELETE FROM rules WHERE id = ?", [(rule_id,) for rule_id in removed])
+        for rule_id, rule in new_by_id.items():
+            if old_by_id.get(rule_id) != rule:
+                conn.execute(
+                    "INSERT OR REPLACE INTO rules (id, data) VALUES (?, ?)",
+                    (rule_id, json.dumps(rule, ensure_ascii=False))
+                )
+
+    def _sync_settings(self, conn, old, new):
+        for key in old:
+            if key not in TABLE_KEYS and key not in new:
+                conn.execute("DELETE FROM settings WHERE key = ?", (key,))
+        for key, value in new.items():
+            if key in TABLE_KEYS or (key in old and old[key] == value):
+                continue
+            conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                (key, json.dumps(value, ensure_ascii=False))
+            )
+
+    def migrate_from_json(self, json_path):
+        """首次启动时导入 data.json；已导入过或文件不存在时返回 False"""
+        with self._lock:
+            if self._get_meta("migrated_from") is not None:
+                return False
+        if not os.path.exists(json_path):
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', '')")
+            return False
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        merged = self.default_factory()
+        merged.update(data)
+        # 以空库为基准写入全部内容
+        self._baseline = self.read()
+        self.write(merged)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)",
+                (os.path.abspath(json_path),)
+            )
+        backup = json_path + ".migrated"
+        os.replace(json_path, backup)
+        logger.info(
+            f"✅ 已将 {json_path} 导入 {self.path}：{len(merged.get('userbot_accounts', []))} 个账号，"
+            f"{len(merged.get('keywords', []))} 个关键词（原文件已重命名为 {backup}）"
+        )
+        return True
@@ -0,0 +1,55 @@
+# modules/supervisor.py - 监听器重启策略模块
+"""监听任务断开或出错后的处理策略（由 ListenerManager 的监督任务使用）
+
+- 按异常类型区分错误，而不是匹配异常文本：
+  fatal（session 失效/被封/在别处重复登录）不再重试；flood 按 Telegram 要求的秒数等待；
+  network / unknown 按带抖动的指数退避重试；transient（TypeNotFoundError）短暂等待后重试
+- 退避时间一半固定、一半随机，网络抖动后各账号的重连时间自然错开
+"""
+import asyncio
+import random
+from telethon.errors import (
+    AuthKeyDuplicatedError, FloodWaitError, RpcCallFailError, ServerError, TypeNotFoundError, UnauthorizedError
+)
+
+# 监听器状态
+STATE_CONNECTING = "connecting"
+STATE_RUNNING = "running"
+STATE_BACKOFF = "backoff"
+STATE_FAILED = "failed"
+STATE_STOPPED = "stopped"
+
+STATE_LABELS = {
+    STATE_CONNECTING: "🔄 连接中",
+    STATE_RUNNING: "✅ 运行中",
+    STATE_BACKOFF: "⏳ 等待重连",
+    STATE_FAILED: "❌ 已失败",
+    STATE_STOPPED: "⏹ 未运行",
+}
+
+
+class SessionUnauthorizedError(Exception):
+    """session 未授权或已失效（重连也无法恢复）"""
+
+
+def classify_error(error):
+    """错误类型：fatal / flood / network / transient / unknown"""
+    if isinstance(error, (SessionUnauthorizedError, UnauthorizedError, AuthKeyDuplicatedError)):
+        return "fatal"
+    if isinstance(error, FloodWaitError):
+        return "flood"
+    if isinstance(error, TypeNotFoundError):
+        return "transient"
+    if isinstance(error, (ConnectionError, OSError, asyncio.TimeoutError, ServerError, RpcCallFailError)):
+        return "network"
+    return "unknown"
+
+
+def backoff_delay(failures, base=1.0, maximum=300.0):
+    """第 failures 次连续失败后的等待秒数（指数增长，上限 maximum，一半随机）"""
+    cap = min(maximum, base * (2 ** max(0, failures - 1)))
+    return cap / 2 + random.uniform(0, cap / 2)
+
+
+def describe_error(error):
+    return f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
@@ -0,0 +1,37 @@
+# tests/test_alert_history.py - 提醒历史检索测试
+import asyncio
+import unittest
+
+from modules.alert_history import AlertHistory
+
+
+class SearchTest(unittest.TestCase):
+    def search(self, fts, query):
+        async def run():
+            history = AlertHistory(path=":memory:")
+            if fts is not None:
+                history.fts = fts
+            history.record({"keyword": "出售", "chat_id": 1, "message_text": "今天出售一批USDT，价格可谈"})
+            history.record({"keyword": "广告", "chat_id": 1, "message_text": "欢迎加入本群"})
+            try:
+                rows, total = await history.search(query)
+            finally:
+                await history.close()
+            return [row["message_text"] for row in rows], total
+
+        return asyncio.run(run())
+
+    def test_chinese_substring_without_trigram_uses_like(self):
+        # unicode61 把整句中文当作一个词，MATCH 查不到句中的子串
+        texts, total = self.search("unicode61", "一批")
+        self.assertEqual(total, 1)
+        self.assertEqual(texts, ["今天出售一批USDT，价格可谈"])
+
+    def test_short_term_uses_like(self):
+        texts, total = self.search(None, "加入")
+        self.assertEqual(total, 1)
+        self.assertEqual(texts, ["欢迎加入本群"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+# tests/test_routing.py - 提醒路由测试
+import unittest
+
+from modules.routing import RoutingTable
+
+DEFAULT = -1009999
+RULES = [{"id": 3, "name": "交易", "expr": "出售 AND USDT"}]
+
+
+class TargetsForTest(unittest.TestCase):
+    def table(self, *routes):
+        return RoutingTable(list(routes), RULES, default_target=DEFAULT)
+
+    def test_unrouted_hit_still_goes_to_default(self):
+        table = self.table({"id": 1, "keywords": ["出售"], "targets": [-1001111]})
+
+        self.assertEqual(sorted(table.targets_for(["出售", "广告"], 1234)), [DEFAULT, -1001111])
+        self.assertEqual(table.targets_for(["出售"], 1234), (-1001111,))
+        self.assertEqual(table.targets_for(["广告"], 1234), (DEFAULT,))
+
+    def test_rule_hits_are_looked_up_by_id(self):
+        table = self.table({"id": 1, "rules": [3], "targets": [-1003333]})
+
+        self.assertEqual(table.targets_for((), 1234, rule_ids=[3]), (-1003333,))
+        self.assertEqual(sorted(table.targets_for(["广告"], 1234, rule_ids=[3])), [DEFAULT, -1003333])
+
+    def test_chat_route_covers_unrouted_hits(self):
+        table = self.table(
+            {"id": 1, "keywords": ["出售"], "targets": [-1001111]},
+            {"id": 2, "chats": [-1001234], "targets": [-1002222]},
+        )
+
+        self.assertEqual(sorted(table.targets_for(["出售", "广告"], 1234)), [-1002222, -1001111])
+        self.assertEqual(sorted(table.targets_for(["出售", "广告"], 5678)), [DEFAULT, -1001111])
+
+    def test_keyword_and_chat_pair(self):
+        table = self.table({"id": 1, "keywords": ["广告"], "chats": [-1001234], "targets": [-1002222]})
+
+        self.assertEqual(table.targets_for(["广告"], 1234), (-1002222,))
+        self.assertEqual(table.targets_for(["广告"], 5678), (DEFAULT,))
+
+
+if __name__ == "__main__":
+    unittest.main()
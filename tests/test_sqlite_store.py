@@ -0,0 +1,44 @@
+# tests/test_sqlite_store.py - SQLite 配置存储测试
+import json
+import os
+import tempfile
+import unittest
+
+from modules.sqlite_store import SQLiteBackend
+
+
+def default_data():
+    return {"userbot_accounts": [], "keywords": [], "rules": [], "target_channel_id": None}
+
+
+class MigrateFromJsonTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.tmp.name, "data.json")
+        self.backend = SQLiteBackend(os.path.join(self.tmp.name, "data.db"), default_data)
+
+    def tearDown(self):
+        self.backend.close()
+        self.tmp.cleanup()
+
+    def test_duplicate_keywords_are_imported_once(self):
+        with open(self.json_path, "w", encoding="utf-8") as f:
+            json.dump({"keywords": ["出售", "USDT", "出售", "收购"], "target_channel_id": -1001}, f)
+
+        self.assertTrue(self.backend.migrate_from_json(self.json_path))
+
+        data = self.backend.read()
+        self.assertEqual(data["keywords"], ["出售", "USDT", "收购"])
+        self.assertEqual(data["target_channel_id"], -1001)
+        self.assertTrue(os.path.exists(self.json_path + ".migrated"))
+
+    def test_duplicate_keywords_in_later_write(self):
+        self.backend.read()
+        self.backend.write({**default_data(), "keywords": ["a"]})
+        self.backend.write({**default_data(), "keywords": ["a", "b", "b"]})
+
+        self.assertEqual(self.backend.read()["keywords"], ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()